@@ -0,0 +1,175 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""A stand-in for the parts of portage esearch uses, for the benchmarks.
+
+It answers from a synthetic tree (see bench/synthetic.py) installed
+with use_tree() instead of reading a real tree and metadata cache.
+Only what esearch calls is there, and only as much of it as esearch
+needs: there is no dependency resolution, versions are plain dotted
+numbers with an optional revision and every ebuild is stable or
+masked.
+"""
+
+import os
+
+from synthetic import split_cpv, version_key
+
+
+_tree = None
+
+
+def use_tree(tree):
+    """Makes the stand-in answer from tree, a synthetic.Tree"""
+    global _tree
+    _tree = tree
+    settings["EROOT"] = os.path.join(tree.root, "root") + "/"
+    settings["PORTDIR"] = tree.root
+    settings["DISTDIR"] = os.path.join(tree.root, "distfiles")
+
+
+def catpkgsplit(cpv):
+    return split_cpv(cpv)
+
+
+def pkgsplit(pv):
+    parts = split_cpv("null/" + pv)
+    if parts is None:
+        return None
+    return parts[1:]
+
+
+def vercmp(version1, version2):
+    parts1 = split_cpv("null/x-" + version1)
+    parts2 = split_cpv("null/x-" + version2)
+    key1 = version_key(parts1[2], parts1[3])
+    key2 = version_key(parts2[2], parts2[3])
+    return (key1 > key2) - (key1 < key2)
+
+
+def pkgcmp(pkg1, pkg2):
+    """Compares two [pkg, version, revision] lists"""
+    if pkg1[0] != pkg2[0]:
+        return None
+    key1 = version_key(pkg1[1], pkg1[2])
+    key2 = version_key(pkg2[1], pkg2[2])
+    return (key1 > key2) - (key1 < key2)
+
+
+def best(cpvs):
+    if not cpvs:
+        return ""
+    return max(cpvs, key=lambda cpv: version_key(*split_cpv(cpv)[2:]))
+
+
+class config(dict):
+    """The settings, setcpv() turns on the USE flags of the package's
+    IUSE which are in USE"""
+
+    USE = frozenset(("X", "gtk", "ssl", "ipv6", "nls", "pam", "python",
+        "zlib", "png", "jpeg", "alsa", "dbus", "udev", "introspection",
+        "threads", "kernel_linux", "elibc_glibc", "amd64"))
+
+    def __init__(self, clone=None):
+        dict.__init__(self, clone or {})
+        self.profiles = ()
+        self.usemask = frozenset(("debug",))
+        self.useforce = frozenset(("kernel_linux",))
+
+    def lock(self):
+        pass
+
+    def unlock(self):
+        pass
+
+    def setcpv(self, cpv, mydb=None):
+        iuse = _tree.metadata[cpv]["IUSE"].split()
+        use = [flag.lstrip("+-") for flag in iuse]
+        self["PORTAGE_USE"] = " ".join(flag for flag in use
+            if flag in self.USE)
+
+    def reset(self):
+        self["PORTAGE_USE"] = ""
+
+
+settings = config({
+    "ACCEPT_KEYWORDS": "amd64",
+    "ARCH": "amd64",
+    "PORTAGE_ARCHLIST": "amd64 x86 arm arm64 ppc",
+    "USE_EXPAND_HIDDEN": "KERNEL ELIBC USERLAND ABI",
+    "PORTAGE_CONFIGROOT": "/nonexistent",
+    "PORTDIR_OVERLAY": "",
+    "PORTAGE_USE": "",
+    "EROOT": "/nonexistent/",
+})
+features = frozenset()
+
+
+class portdbapi(object):
+    """The ebuild database of the synthetic tree"""
+
+    def __init__(self, mysettings=None):
+        self.settings = mysettings or settings
+
+    @property
+    def porttrees(self):
+        return [_tree.root]
+
+    def cp_all(self):
+        return sorted(_tree.cps)
+
+    def xmatch(self, level, origdep):
+        if level == "match-all":
+            return list(_tree.cps.get(origdep, ()))
+        if level == "bestmatch-visible":
+            return _tree.best_visible(origdep)
+        raise KeyError(level)
+
+    def aux_get(self, cpv, keys):
+        metadata = _tree.metadata[cpv]
+        return [metadata.get(key, "") for key in keys]
+
+    def findname(self, cpv):
+        category, pn, version, revision = split_cpv(cpv)
+        if revision != "r0":
+            version += "-" + revision
+        return os.path.join(_tree.root, category, pn,
+            "%s-%s.ebuild" % (pn, version))
+
+    def getFetchMap(self, cpv):
+        uri = _tree.metadata[cpv]["SRC_URI"]
+        return {uri.rsplit("/", 1)[1]: (uri,)}
+
+
+class _vardbapi(object):
+
+    def cpv_all(self):
+        return list(_tree.installed)
+
+
+class vartree(object):
+    """The installed packages of the synthetic tree"""
+
+    def __init__(self, *args, **kwargs):
+        self.dbapi = _vardbapi()
+
+    def dep_bestmatch(self, cp):
+        # startswith(cp + "-") would take app-misc/foo-bar for
+        # app-misc/foo as well
+        matches = []
+        for cpv in _tree.installed:
+            parts = catpkgsplit(cpv)
+            if parts is not None and parts[0] + "/" + parts[1] == cp:
+                matches.append(cpv)
+        return best(matches)
+
+
+portdb = portdbapi()
+
+# set by bench/run.py for esearch run in a new process
+if os.environ.get("ESEARCH_BENCH_TREE"):
+    import synthetic
+    use_tree(synthetic.Tree.load(os.environ["ESEARCH_BENCH_TREE"]))
@@ -0,0 +1,9 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+EPREFIX = ""
+VDB_PATH = "var/db/pkg"
+USER_CONFIG_PATH = "etc/portage"
@@ -0,0 +1,23 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""The Manifest of the portage stand-in, the sizes of the distfiles are
+those of the synthetic tree"""
+
+import portage
+from portage.exception import PortageException
+
+
+class Manifest(object):
+
+    def __init__(self, pkgdir, distdir=None):
+        self.pkgdir = pkgdir
+
+    def getDistfilesSize(self, fetchlist):
+        try:
+            return sum(portage._tree.distfiles[name] for name in fetchlist)
+        except KeyError as name:
+            raise PortageException("no digest for %s" % name)
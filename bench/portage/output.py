@@ -0,0 +1,47 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""Colors of the portage stand-in, the same escape codes as portage"""
+
+havecolor = 1
+
+codes = {
+    "reset": "\x1b[39;49;00m",
+    "bold": "\x1b[01m",
+    "red": "\x1b[31;01m",
+    "green": "\x1b[32;01m",
+    "yellow": "\x1b[33;01m",
+    "blue": "\x1b[34;01m",
+    "darkgreen": "\x1b[32m",
+    "turquoise": "\x1b[36;01m",
+}
+
+
+def nocolor():
+    global havecolor
+    havecolor = 0
+
+
+def _color(name):
+    def colorize(text):
+        if havecolor:
+            return codes[name] + text + codes["reset"]
+        return text
+    colorize.__name__ = name
+    return colorize
+
+
+bold = _color("bold")
+red = _color("red")
+green = _color("green")
+yellow = _color("yellow")
+blue = _color("blue")
+darkgreen = _color("darkgreen")
+turquoise = _color("turquoise")
+
+
+def xtermTitle(mystr, raw=False):
+    pass
@@ -0,0 +1,7 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+from functools import cmp_to_key as cmp_sort_key
@@ -0,0 +1,400 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""Benchmarks of eupdatedb, esearch and esync on synthetic trees.
+
+The benchmarks run against the portage stand-in next to this file,
+which answers from a generated tree (see synthetic.py), so they need
+neither a Gentoo system nor a real tree.  For every tree size given
+with --packages they time:
+
+  updatedb/*   eupdatedb: a full build, a run with nothing changed and
+               a run after a sync changed 2% of the packages
+  loaddb       opening the index and the installed packages
+  search/*     search_list() with assorted pattern shapes
+  exclude      filter_excluded()
+  output/*     output_results() in each output mode, to /dev/null
+  esync/diff   the changes of a sync, old index against new
+  startup/*    esearch as a new process, from start to exit, and
+               whether it imported portage
+
+Each is run --repeat times on a freshly opened index, the results are
+written as JSON.  --compare reports the ratios to an earlier result
+file and exits 1 if a benchmark got slower by more than --threshold.
+
+    $ python bench/run.py -p 10000,50000 -o new.json -c old.json
+"""
+
+from __future__ import print_function
+
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from getopt import getopt, GetoptError
+from timeit import default_timer
+
+# the stand-in portage next to this file is found first, the esearch
+# of this checkout after it
+BENCHDIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(1, os.path.dirname(BENCHDIR))
+
+import portage
+from synthetic import Tree
+
+from esearch.common import (CONFIG, NORMAL, COMPACT, VERBOSE, OWN, JSONL,
+    TSV, NUL, version)
+from esearch import color, search, update
+from esearch.diff import changes
+
+
+# name => (patterns, config)
+SEARCHES = (
+    ("substring", ["gtk"], {}),
+    ("prefix", ["^lib"], {}),
+    ("suffix", ["ssl$"], {}),
+    ("exact", ["^python-xml$"], {}),
+    ("regex", ["x11.*font"], {}),
+    ("fullname", ["^media-.*/sound"], {'fullname': True}),
+    ("description", ["crypt"], {'searchdesc': True}),
+    ("instonly", ["lib"], {'instonly': True}),
+    ("notinst", ["lib"], {'notinst': True}),
+    ("5-patterns", ["gtk", "^py", "ssl$", "x11.*font", "net"], {}),
+    ("50-patterns", [first + second for first in
+        ("lib", "gtk", "python", "perl", "xml", "net", "tool", "qt", "kde",
+        "gnome") for second in ("", "-", "[0-9]", "-tool", "$")], {}),
+    ("words", ["python", "xml"], {'wordsearch': True}),
+)
+
+EXCLUDES = ["gtk", "^x11", "[0-9]$"]
+
+# name => esearch arguments
+STARTUPS = (
+    ("compact", ["-c", "-n", "^lib-gtk"]),
+    ("normal", ["^lib-gtk"]),
+    ("verbose", ["-v", "^lib-gtk"]),
+)
+
+# esearch, telling at the end whether it imported portage
+STARTUP = """
+import atexit, sys
+atexit.register(lambda: sys.stdout.write("portage" in sys.modules and
+    "portage imported\\n" or "\\n"))
+from esearch.client import main
+main()
+"""
+
+# name => (output mode, config)
+OUTPUTS = (
+    ("normal", NORMAL, {}),
+    ("normal-nocolor", NORMAL, {'nocolor': True}),
+    ("compact", COMPACT, {}),
+    ("verbose", VERBOSE, {}),
+    ("own", OWN, {'outputf': "%p %va %vi %s %d\\n", 'nocolor': True}),
+    ("json", JSONL, {'nocolor': True}),
+    ("tsv", TSV, {'nocolor': True}),
+    ("null", NUL, {'nocolor': True}),
+)
+
+
+def usage():
+    print("bench/run.py - Benchmarks esearch on synthetic trees")
+    print("")
+    print("Usage: bench/run.py [ options ]")
+    print("Options:")
+    print("  --help, -h")
+    print("    Print this help message")
+    print("")
+    print("  --packages=N[,N...], -p N[,N...]")
+    print("    Sizes of the synthetic trees, 10000 by default")
+    print("")
+    print("  --repeat=N, -r N")
+    print("    Run every benchmark N times, 5 by default")
+    print("")
+    print("  --jobs=N, -j N")
+    print("    Run eupdatedb with N processes")
+    print("")
+    print("  --seed=N, -s N")
+    print("    Seed of the synthetic trees")
+    print("")
+    print("  --only=prefix, -b prefix")
+    print("    Only run the benchmarks whose name starts with prefix")
+    print("")
+    print("  --output=file, -o file")
+    print("    Write the results to file, bench-results.json by default")
+    print("")
+    print("  --compare=file, -c file")
+    print("    Compare the results with those in file")
+    print("")
+    print("  --threshold=fraction, -t fraction")
+    print("    Slow down reported as a regression, 0.1 by default")
+
+    sys.exit(0)
+
+
+def parseopts(opts):
+    options = {'packages': [10000], 'repeat': 5, 'jobs': 1, 'seed': 0,
+        'only': "", 'output': "bench-results.json", 'compare': None,
+        'threshold': 0.1}
+    try:
+        for arg, value in opts:
+            if arg in ("-h", "--help"):
+                usage()
+            elif arg in ("-p", "--packages"):
+                options['packages'] = [int(n) for n in value.split(",")]
+            elif arg in ("-r", "--repeat"):
+                options['repeat'] = max(1, int(value))
+            elif arg in ("-j", "--jobs"):
+                options['jobs'] = max(1, int(value))
+            elif arg in ("-s", "--seed"):
+                options['seed'] = int(value)
+            elif arg in ("-b", "--only"):
+                options['only'] = value
+            elif arg in ("-o", "--output"):
+                options['output'] = value
+            elif arg in ("-c", "--compare"):
+                options['compare'] = value
+            elif arg in ("-t", "--threshold"):
+                options['threshold'] = float(value)
+    except ValueError as errmsg:
+        print("bench/run.py:", errmsg, file=sys.stderr)
+        sys.exit(2)
+    return options
+
+
+class Bench(object):
+    """The benchmarks of one synthetic tree"""
+
+    def __init__(self, options, packages, workdir):
+        self.options = options
+        self.packages = packages
+        self.results = {}
+        # startup benchmark => whether esearch imported portage
+        self.imported = {}
+        self.devnull = io.open(os.devnull, "w")
+
+        treedir = os.path.join(workdir, "tree")
+        dbdir = os.path.join(workdir, "db")
+        os.makedirs(dbdir)
+        start = default_timer()
+        self.tree = Tree(packages, options['seed'])
+        self.tree.write(treedir)
+        portage.use_tree(self.tree)
+        self.setuptime = default_timer() - start
+
+        self.config = dict(CONFIG)
+        self.config.update({
+            'esearchdbdir': dbdir,
+            'tmpfile': os.path.join(dbdir, "esearchdb.idx.tmp"),
+            'stdout': self.devnull,
+            'verbose': -1,
+            'jobs': options['jobs'],
+            'resultcache': False,
+            'exclude': [],
+        })
+
+    def wanted(self, name):
+        return name.startswith(self.options['only'])
+
+    def measure(self, name, run, setup=None, repeat=None):
+        """Times run(*setup()) repeat times, setup is not timed"""
+        if not self.wanted(name):
+            return
+        if repeat is None:
+            repeat = self.options['repeat']
+        runs = []
+        for i in range(repeat):
+            args = setup() if setup is not None else ()
+            start = default_timer()
+            run(*args)
+            runs.append(default_timer() - start)
+        runs.sort()
+        self.results[name] = {"min": runs[0], "median": runs[len(runs) // 2],
+            "runs": runs}
+        print("  %-24s %9.4fs" % (name, runs[0]))
+
+    def searchconfig(self, **changes):
+        config = dict(self.config)
+        config.update(changes)
+        return config
+
+    def loaddb(self):
+        return search.loaddb(self.config)
+
+    def updatedb(self, fullrebuild=False):
+        config = dict(self.config)
+        config['fullrebuild'] = fullrebuild
+        if not update.updatedb(config):
+            raise RuntimeError("updatedb failed")
+
+    def run(self):
+        # the first build fills the fetch size cache, it is only timed once
+        start = default_timer()
+        self.updatedb(True)
+        self.results["updatedb/full"] = {"min": default_timer() - start}
+        self.results["updatedb/full"]["median"] = \
+            self.results["updatedb/full"]["min"]
+        print("  %-24s %9.4fs" % ("updatedb/full",
+            self.results["updatedb/full"]["min"]))
+        self.measure("updatedb/unchanged", self.updatedb)
+        self.measure("loaddb", self.loaddb)
+
+        for name, patterns, changes in SEARCHES:
+            config = self.searchconfig(**changes)
+            if config['wordsearch']:
+                self.measure("search/" + name, search.search_words,
+                    lambda: (config, patterns, self.loaddb()))
+            else:
+                regexlist = search.create_regexlist(config, patterns)
+                self.measure("search/" + name, search.search_list,
+                    lambda: (config, regexlist, self.loaddb()))
+
+        config = self.searchconfig(exclude=EXCLUDES)
+        regexlist = search.create_regexlist(config, ["lib"])
+        self.measure("exclude", search.filter_excluded,
+            lambda: (config, search.search_list(config, regexlist,
+                self.loaddb())))
+
+        for name, mode, changes in OUTPUTS:
+            self.output(name, mode, changes)
+
+        for name, args in STARTUPS:
+            self.startup(name, args)
+
+        if self.wanted("esync") or self.wanted("updatedb/sync"):
+            self.sync()
+
+    def startup(self, name, args):
+        """Times esearch args as a new process.  The stand-in portage
+        imports in no time, so this is what esearch itself costs."""
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join([BENCHDIR,
+            os.path.dirname(BENCHDIR)])
+        env["ESEARCHD_SOCKET"] = ""
+        # the stand-in answers from the tree of this run
+        env["ESEARCH_BENCH_TREE"] = self.tree.root
+        command = [sys.executable, "-c", STARTUP, "-d",
+            self.config['esearchdbdir'], "-C"] + args
+
+        def run():
+            output = subprocess.check_output(command, env=env)
+            self.imported[name] = output.endswith(b"portage imported\n")
+
+        self.measure("startup/" + name, run)
+        if name in self.imported:
+            self.results["startup/" + name]["portage"] = self.imported[name]
+            print("  %-24s %s" % ("", self.imported[name] and
+                "portage imported" or "portage not imported"))
+
+    def output(self, name, mode, changes):
+        config = self.searchconfig(outputm=mode, **changes)
+
+        def setup():
+            regexlist = search.create_regexlist(config, ["lib"])
+            found = search.search_list(config, regexlist, self.loaddb())
+            return config, regexlist, found
+
+        def run(config, regexlist, found):
+            stdout = sys.stdout
+            sys.stdout = self.devnull
+            color.havecolor = not config['nocolor']
+            try:
+                search.output_results(config, regexlist, found)
+            finally:
+                sys.stdout = stdout
+                color.havecolor = 1
+
+        self.measure("output/" + name, run, setup)
+
+    def sync(self):
+        """Times eupdatedb after a sync and the diff esync makes"""
+        diffs = []
+        updates = []
+        for i in range(self.options['repeat']):
+            old = self.loaddb()
+            self.tree.sync()
+            start = default_timer()
+            self.updatedb()
+            updates.append(default_timer() - start)
+            new = self.loaddb()
+            start = default_timer()
+            list(changes(old, new))
+            diffs.append(default_timer() - start)
+        for name, runs in (("updatedb/sync", updates), ("esync/diff", diffs)):
+            runs.sort()
+            self.results[name] = {"min": runs[0],
+                "median": runs[len(runs) // 2], "runs": runs}
+            print("  %-24s %9.4fs" % (name, runs[0]))
+
+
+def compare(results, path, threshold):
+    """Prints the ratios of results to those in the file at path,
+    returns whether none got slower by more than threshold"""
+    with io.open(path, encoding="utf_8") as resultfile:
+        base = json.load(resultfile)
+    ok = True
+    print("")
+    print("compared with %s:" % path)
+    for size, benchmarks in sorted(results["sizes"].items(), key=lambda
+            item: int(item[0])):
+        old = base.get("sizes", {}).get(size)
+        if old is None:
+            continue
+        print(" %s packages" % size)
+        for name in sorted(benchmarks):
+            if name not in old or not old[name]["min"]:
+                continue
+            ratio = benchmarks[name]["min"] / old[name]["min"]
+            mark = ""
+            if ratio > 1 + threshold:
+                mark = "  REGRESSION"
+                ok = False
+            print("  %-24s %6.2fx%s" % (name, ratio, mark))
+    return ok
+
+
+def main():
+    try:
+        opts = getopt(sys.argv[1:], "hp:r:j:s:b:o:c:t:",
+            ["help", "packages=", "repeat=", "jobs=", "seed=", "only=",
+            "output=", "compare=", "threshold="])[0]
+    except GetoptError as errmsg:
+        print("bench/run.py:", errmsg, "(see --help for all options)",
+            file=sys.stderr)
+        sys.exit(2)
+    options = parseopts(opts)
+    color.havecolor = 1
+
+    results = {"esearch": version, "python": platform.python_version(),
+        "platform": platform.platform(), "time": int(time.time()),
+        "options": options, "sizes": {}}
+    for packages in options['packages']:
+        workdir = tempfile.mkdtemp(prefix="esearch-bench-")
+        try:
+            print("%d packages" % packages)
+            bench = Bench(options, packages, workdir)
+            print("  %-24s %9.4fs" % ("(tree setup)", bench.setuptime))
+            bench.run()
+            results["sizes"][str(packages)] = bench.results
+        finally:
+            shutil.rmtree(workdir)
+
+    with io.open(options['output'], "w", encoding="utf_8") as resultfile:
+        resultfile.write(u"" + json.dumps(results, indent=1, sort_keys=True))
+    print("results written to " + options['output'])
+    if options['compare'] is not None:
+        sys.exit(not compare(results, options['compare'],
+            options['threshold']))
+
+
+if __name__ == '__main__':
+
+    main()
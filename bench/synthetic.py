@@ -0,0 +1,222 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""Synthetic portage trees for the benchmarks.
+
+A Tree is made of random, but reproducible for a seed, categories,
+packages, versions and metadata drawn from a small vocabulary, so that
+patterns find a realistic share of the packages.  Its package
+directories are written to disk with empty ebuilds and a Manifest,
+which is what eupdatedb looks at to tell which packages changed.  The
+metadata itself is kept in memory and served by the portage stand-in.
+"""
+
+import os
+import pickle
+import random
+
+
+WORDS = ("lib", "gtk", "python", "perl", "xml", "net", "tool", "qt", "kde",
+    "gnome", "ssl", "x11", "media", "font", "dev", "util", "sound", "video",
+    "image", "text", "mail", "web", "db", "sql", "crypt", "fs", "sys",
+    "game", "term", "shell", "doc", "java", "ruby", "lua", "rust", "go",
+    "vim", "emacs", "http", "dns", "usb", "pci", "gl", "vulkan", "audio",
+    "midi", "print", "scan", "cloud", "proxy", "zip", "tar", "json", "yaml")
+
+CATEGORY_PREFIXES = ("app", "dev", "media", "net", "sys", "x11", "games",
+    "sci", "www", "gnome", "kde", "mail", "x11", "virtual", "acct")
+
+FLAGS = ("X", "gtk", "qt5", "ssl", "ipv6", "doc", "examples", "test",
+    "static-libs", "debug", "nls", "pam", "python", "perl", "zlib", "bzip2",
+    "lzma", "jpeg", "png", "alsa", "pulseaudio", "dbus", "udev", "systemd",
+    "+introspection", "-minimal", "+threads")
+
+# flags hidden by USE_EXPAND_HIDDEN and arch flags
+HIDDEN = ("kernel_linux", "elibc_glibc", "userland_GNU", "abi_x86_64",
+    "python_targets_python3_11")
+ARCHES = ("amd64", "x86", "arm", "arm64", "ppc")
+
+LICENSES = ("GPL-2", "GPL-3", "LGPL-2.1", "MIT", "BSD", "Apache-2.0",
+    "MPL-2.0", "ISC")
+
+
+class Tree(object):
+    """A synthetic portage tree of about packages packages"""
+
+    def __init__(self, packages, seed=0, root=None):
+        self.random = random.Random(seed)
+        self.root = root
+        # cat/pkg => [cpv, ...] oldest first
+        self.cps = {}
+        # cpv => {metadata key: value}
+        self.metadata = {}
+        # cpv => stable
+        self.stable = {}
+        # distfile => size
+        self.distfiles = {}
+        self.installed = []
+        self.serial = 0
+
+        categories = sorted(set(prefix + "-" + word
+            for prefix in CATEGORY_PREFIXES for word in WORDS))
+        self.random.shuffle(categories)
+        categories = sorted(categories[:max(1, min(len(categories),
+            packages // 60))])
+        while len(self.cps) < packages:
+            category = self.random.choice(categories)
+            self.add(category + "/" + self._name())
+        for cp in sorted(self.cps):
+            if self.random.random() < 0.05:
+                self.installed.append(self.cps[cp][0])
+
+    def _name(self):
+        words = self.random.sample(WORDS, self.random.randint(1, 3))
+        name = "-".join(words)
+        if self.random.random() < 0.3:
+            name += str(self.random.randint(0, 99))
+        return name
+
+    def _version(self):
+        version = ".".join(str(self.random.randint(0, 20))
+            for i in range(self.random.randint(1, 3)))
+        if self.random.random() < 0.2:
+            version += "-r" + str(self.random.randint(1, 5))
+        return version
+
+    def _metadata(self, cp, version):
+        rnd = self.random
+        pn = cp.split("/")[1]
+        distfile = "%s-%s.tar.gz" % (pn, version.split("-r")[0])
+        self.distfiles[distfile] = rnd.randint(1, 50000) * 1024
+        iuse = rnd.sample(FLAGS, rnd.randint(0, 10))
+        if rnd.random() < 0.3:
+            iuse += rnd.sample(HIDDEN, rnd.randint(1, 3))
+        return {
+            "HOMEPAGE": "https://%s.example.org/" % pn,
+            "DESCRIPTION": " ".join(rnd.sample(WORDS, rnd.randint(3, 9)))
+                .capitalize(),
+            "LICENSE": rnd.choice(LICENSES),
+            "IUSE": " ".join(iuse),
+            "SRC_URI": "https://%s.example.org/%s" % (pn, distfile),
+            "KEYWORDS": " ".join(rnd.sample(ARCHES, rnd.randint(1, 4))),
+        }
+
+    def add(self, cp):
+        """Adds package cp with one to four versions"""
+        if cp in self.cps:
+            return
+        self.cps[cp] = []
+        for i in range(self.random.randint(1, 4)):
+            self.bump(cp)
+
+    def bump(self, cp):
+        """Adds a new version to cp, unstable in a tenth of the cases"""
+        self.serial += 1
+        while True:
+            version = self._version()
+            cpv = cp + "-" + version
+            if cpv not in self.metadata:
+                break
+        self.metadata[cpv] = self._metadata(cp, version)
+        self.stable[cpv] = self.random.random() > 0.1
+        self.cps[cp].append(cpv)
+        self.cps[cp].sort(key=cpv_key)
+        if self.root is not None:
+            self.write_package(cp)
+
+    def remove(self, cp):
+        for cpv in self.cps.pop(cp):
+            del self.metadata[cpv]
+            del self.stable[cpv]
+        if self.root is not None:
+            pkgdir = os.path.join(self.root, cp)
+            for name in os.listdir(pkgdir):
+                os.unlink(os.path.join(pkgdir, name))
+            os.rmdir(pkgdir)
+
+    def sync(self, fraction=0.02):
+        """Changes about fraction of the packages the way a sync does:
+        version bumps, new and removed packages and new descriptions"""
+        cps = sorted(self.cps)
+        changed = self.random.sample(cps, max(1, int(len(cps) * fraction)))
+        for i, cp in enumerate(changed):
+            kind = i % 4
+            if kind == 0 or kind == 1:
+                self.bump(cp)
+            elif kind == 2:
+                self.remove(cp)
+                category = cp.split("/")[0]
+                self.add(category + "/" + self._name())
+            else:
+                cpv = self.cps[cp][-1]
+                self.metadata[cpv]["DESCRIPTION"] += " " + \
+                    self.random.choice(WORDS)
+                if self.root is not None:
+                    self.write_package(cp)
+
+    def write(self, root):
+        """Writes the package directories below root, and the tree for
+        load()"""
+        self.root = root
+        os.makedirs(os.path.join(root, "profiles"))
+        for cp in sorted(self.cps):
+            self.write_package(cp)
+        with open(os.path.join(root, "tree.pickle"), "wb") as treefile:
+            pickle.dump(self, treefile, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(root):
+        """Returns the tree written to root"""
+        with open(os.path.join(root, "tree.pickle"), "rb") as treefile:
+            return pickle.load(treefile)
+
+    def write_package(self, cp):
+        pkgdir = os.path.join(self.root, cp)
+        if not os.path.isdir(pkgdir):
+            os.makedirs(pkgdir)
+        pn = cp.split("/")[1]
+        manifest = []
+        wanted = set()
+        for cpv in self.cps[cp]:
+            name = pn + "-" + cpv[len(cp) + 1:] + ".ebuild"
+            wanted.add(name)
+            with open(os.path.join(pkgdir, name), "w") as ebuild:
+                ebuild.write("# %d\n" % self.serial)
+            distfile = self.metadata[cpv]["SRC_URI"].rsplit("/", 1)[1]
+            manifest.append("DIST %s %d\n" % (distfile,
+                self.distfiles[distfile]))
+        for name in os.listdir(pkgdir):
+            if name.endswith(".ebuild") and name not in wanted:
+                os.unlink(os.path.join(pkgdir, name))
+        with open(os.path.join(pkgdir, "Manifest"), "w") as manifestfile:
+            manifestfile.writelines(sorted(set(manifest)))
+
+    def best_visible(self, cp):
+        stable = [cpv for cpv in self.cps.get(cp, ()) if self.stable[cpv]]
+        return stable and stable[-1] or ""
+
+
+def split_cpv(cpv):
+    """Returns [cat, pkg, version, revision] of cpv, None if it is
+    not one"""
+    cp, sep, version = cpv.rpartition("-")
+    revision = "r0"
+    if version.startswith("r") and version[1:].isdigit():
+        revision = version
+        cp, sep, version = cp.rpartition("-")
+    if not sep or "/" not in cp or not version.replace(".", "").isdigit():
+        return None
+    category, pn = cp.split("/", 1)
+    return [category, pn, version, revision]
+
+
+def version_key(version, revision="r0"):
+    return tuple(int(part) for part in version.split(".")), int(revision[1:])
+
+
+def cpv_key(cpv):
+    parts = split_cpv(cpv)
+    return version_key(parts[2], parts[3])
@@ -0,0 +1,72 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""Helpers for the fixed width little endian tables of the esearch index"""
+
+import struct
+import sys
+from array import array
+
+
+COUNT = struct.Struct("<I")
+OFFSET_PAIR = struct.Struct("<II")
+
+if array('I').itemsize == 4:
+    UINT32 = 'I'
+else:
+    UINT32 = 'L'
+
+# tobytes() and frombytes() are tostring() and fromstring() before
+# Python 3.2
+if hasattr(array, "tobytes"):
+    _tobytes = array.tobytes
+    _frombytes = array.frombytes
+else:
+    _tobytes = array.tostring
+    _frombytes = array.fromstring
+
+
+def unpack_from(fmt, buf, offset):
+    """Unpacks the struct.Struct fmt at offset of buf, which may be the
+    BlockFile of a compressed index as well as an mmap"""
+    return fmt.unpack(buf[offset:offset + fmt.size])
+
+
+def pack_uint32(values):
+    """Returns values as a little endian uint32 table"""
+    packed = array(UINT32, values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return _tobytes(packed)
+
+
+def unpack_uint32(buf, offset, count):
+    """Reads count little endian uint32s at offset into an array"""
+    unpacked = array(UINT32)
+    _frombytes(unpacked, buf[offset:offset + 4 * count])
+    if sys.byteorder == "big":
+        unpacked.byteswap()
+    return unpacked
+
+
+def pack_strings(values):
+    """Returns values as a string table: nrows + 1 uint32 offsets
+    followed by the utf-8 encoded strings.  Byte strings, as Python 2
+    gives them, are taken to be utf-8 already."""
+    data = [value if isinstance(value, bytes) else
+        (value or u"").encode("utf_8") for value in values]
+    offsets = [0]
+    for item in data:
+        offsets.append(offsets[-1] + len(item))
+    return pack_uint32(offsets) + b"".join(data)
+
+
+def read_string(buf, offset, nrows, i):
+    """Reads string i of the table at offset without loading its
+    offset table"""
+    start, end = unpack_from(OFFSET_PAIR, buf, offset + 4 * i)
+    base = offset + 4 * (nrows + 1)
+    return buf[base + start:base + end].decode("utf_8")
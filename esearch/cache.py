@@ -0,0 +1,110 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""On disk cache of esearch results.
+
+Scripts tend to run the same few queries again and again between two
+syncs.  The rows a query found, after --exclude, are kept as row
+numbers in a small file per query in the user's cache directory, named
+after the generation of the index and a hash of the patterns and of the
+options which change the result.
+
+The cache is least recently used: a hit touches its file, and writing
+a new entry removes the oldest ones beyond the size cap.  Entries of
+other generations are removed at the same time, so the cache empties
+itself once eupdatedb writes a new index.
+"""
+
+import io
+import json
+import os
+from hashlib import md5
+
+
+# the CONFIG flags which change the rows a query finds
+FLAGS = ('searchdesc', 'fullname', 'instonly', 'notinst', 'wordsearch')
+
+
+def cache_dir():
+    """Returns the directory of the result cache"""
+    base = os.environ.get("XDG_CACHE_HOME") or \
+        os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "esearch")
+
+
+class ResultCache(object):
+    """The cached results of the queries of one index generation"""
+
+    def __init__(self, path, generation, maxsize):
+        self.path = path
+        self.generation = generation
+        self.maxsize = maxsize
+
+    def key(self, config, patterns, installed):
+        """Returns the key of the query of patterns with config, installed
+        is the installed package map the index was opened with"""
+        parts = [list(patterns), [config[flag] for flag in FLAGS],
+            config['exclude']]
+        if config['instonly'] or config['notinst']:
+            parts.append(sorted(installed.items()))
+        return md5(json.dumps(parts).encode("utf_8")).hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, self.generation + "-" + key)
+
+    def get(self, key):
+        """Returns the cached {pattern: [row numbers]} of key, None if
+        there is none"""
+        path = self._file(key)
+        try:
+            with io.open(path, encoding="utf_8") as cachefile:
+                found = json.load(cachefile)
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            return None
+        return found
+
+    def put(self, key, found):
+        """Caches {pattern: [row numbers]} under key, silently giving up
+        if the cache directory is not writable"""
+        path = self._file(key)
+        tmpfile = os.path.join(self.path, ".%s.%d" % (key, os.getpid()))
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            with io.open(tmpfile, "w", encoding="utf_8") as cachefile:
+                cachefile.write(u"" + json.dumps(found,
+                    separators=(",", ":")))
+            os.rename(tmpfile, path)
+            self.evict()
+        except (IOError, OSError):
+            pass
+
+    def evict(self):
+        """Removes the entries of other generations and the least
+        recently used ones beyond the size cap"""
+        entries = []
+        for name in os.listdir(self.path):
+            if name.startswith("."):
+                continue
+            path = os.path.join(self.path, name)
+            try:
+                if not name.startswith(self.generation + "-"):
+                    os.unlink(path)
+                    continue
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        entries.sort(reverse=True)
+        size = 0
+        for mtime, entrysize, path in entries:
+            size += entrysize
+            if size > self.maxsize:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
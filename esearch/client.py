@@ -0,0 +1,137 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""The esearch side of esearchd.
+
+esearchd (see esearch.daemon) keeps the index loaded and answers the
+queries of esearch over a Unix socket.  A request is a line of JSON
+holding the command line arguments of esearch.  The answer is a line of
+JSON for every piece of output, {"stdout": text} or {"stderr": text},
+sent as the query renders it, and a last {"status": exit status}.  A
+query esearchd cannot answer gets {"fallback": true} instead.
+
+This module does not import portage, a query esearchd answers costs
+neither the portage start up nor loading the index.  Without a running
+esearchd, or for queries it cannot answer, esearch runs in process.
+"""
+
+import json
+import os
+import socket
+import sys
+
+
+# where esearchd listens unless ESEARCHD_SOCKET says otherwise,
+# ESEARCHD_SOCKET="" keeps esearch from using esearchd
+SOCKET = "/var/cache/edb/esearchd.socket"
+
+# seconds esearch waits to connect to esearchd before searching in
+# process.  The answer itself is waited for, a long query is not run
+# twice.
+CONNECT_TIMEOUT = 10
+
+
+def socket_path():
+    """Returns the path of esearchd's socket"""
+    return os.environ.get("ESEARCHD_SOCKET", SOCKET)
+
+
+def send_message(sock, message):
+    """Sends message as a line of JSON"""
+    sock.sendall(json.dumps(message).encode("utf_8") + b"\n")
+
+
+def read_message(sock):
+    """Reads a line of JSON, returns None if the peer sent nothing"""
+    chunks = []
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        # newlines within the message are escaped by the JSON encoding
+        if chunk.endswith(b"\n"):
+            break
+    if not chunks:
+        return None
+    return json.loads(b"".join(chunks).decode("utf_8"))
+
+
+def read_messages(sock):
+    """Yields the lines of JSON sock sends until it closes"""
+    pending = b""
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        pending += chunk
+        lines = pending.split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield json.loads(line.decode("utf_8"))
+
+
+def _write(stream, text):
+    if not isinstance(text, str):
+        # unicode on Python 2
+        text = text.encode("utf_8")
+    stream.write(text)
+
+
+def request(args, path=None, stdout=None, stderr=None):
+    """Has esearchd answer the esearch command line arguments args and
+    writes its output to stdout and stderr as it arrives.  Returns the
+    exit status, or None if no esearchd is running or it cannot answer,
+    before anything was written."""
+    if path is None:
+        path = socket_path()
+    if not path or not os.path.exists(path):
+        return None
+    if stdout is None:
+        stdout = sys.stdout
+    if stderr is None:
+        stderr = sys.stderr
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT)
+    written = False
+    try:
+        try:
+            sock.connect(path)
+            sock.settimeout(None)
+            send_message(sock, {"args": args})
+            for message in read_messages(sock):
+                if message.get("fallback"):
+                    return None
+                if "status" in message:
+                    return message["status"]
+                written = True
+                if "stdout" in message:
+                    try:
+                        _write(stdout, message["stdout"])
+                    except IOError:
+                        pass
+                else:
+                    _write(stderr, message.get("stderr", u""))
+        except (socket.timeout, socket.error, ValueError):
+            if not written:
+                return None
+        stderr.write("esearchd did not finish the answer\n")
+        return 1
+    finally:
+        sock.close()
+        try:
+            stdout.flush()
+        except IOError:
+            pass
+
+
+def main():
+    status = request(sys.argv[1:])
+    if status is None:
+        from esearch.search import main
+        main()
+        return
+    sys.exit(status)
@@ -0,0 +1,81 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""The colors of esearch's output, without importing portage.
+
+The functions color text with the escape codes of portage.output, so
+the output looks the same.  Only if there is a color.map in
+/etc/portage, which may redefine them, are the codes taken from
+portage.output instead, on the first colored text.
+"""
+
+import os
+import sys
+
+
+# portage.output's
+codes = {
+    "reset": "\x1b[39;49;00m",
+    "bold": "\x1b[01m",
+    "red": "\x1b[31;01m",
+    "green": "\x1b[32;01m",
+    "darkgreen": "\x1b[32m",
+    "yellow": "\x1b[33;01m",
+    "blue": "\x1b[34;01m",
+    "turquoise": "\x1b[36;01m",
+}
+
+COLORMAP = "etc/portage/color.map"
+
+havecolor = 1
+_codes_loaded = False
+
+
+def _load_codes():
+    """Takes the codes from portage.output if color.map changes them"""
+    global _codes_loaded
+    _codes_loaded = True
+    from esearch.common import EPREFIX
+    if not os.path.exists(os.path.join(EPREFIX + "/", COLORMAP)):
+        return
+    try:
+        from portage.output import codes as portage_codes
+        for key in codes:
+            codes[key] = portage_codes[key]
+    except (ImportError, KeyError):
+        pass
+
+
+def nocolor():
+    """Turns off colors, those of portage as well if it is loaded"""
+    global havecolor
+    havecolor = 0
+    if "portage.output" in sys.modules:
+        sys.modules["portage.output"].nocolor()
+
+
+def colorize(key, text):
+    if not havecolor:
+        return text
+    if not _codes_loaded:
+        _load_codes()
+    return codes[key] + text + codes["reset"]
+
+
+def _color_function(key):
+    def color(text):
+        return colorize(key, text)
+    color.__name__ = key
+    return color
+
+
+bold = _color_function("bold")
+red = _color_function("red")
+green = _color_function("green")
+darkgreen = _color_function("darkgreen")
+yellow = _color_function("yellow")
+blue = _color_function("blue")
+turquoise = _color_function("turquoise")
@@ -8,23 +8,48 @@
 
 from __future__ import print_function
 
+import os
 import sys
-from portage import catpkgsplit
-from portage.output import red, green, yellow
+
+from esearch.color import red, green, yellow
 
 from . import __version__
 
-# Load EPREFIX from Portage, fall back to the empty string if it fails
-try:
-    from portage.const import EPREFIX
-except ImportError:
-    EPREFIX = ''
+
+def _eprefix():
+    """Returns the EPREFIX of portage.  eupdatedb, esync and esearchd
+    import portage before this module, so it is asked.  esearch does not
+    import it for most searches and guesses without it: the EPREFIX
+    portage is told to use, else the root of the Python running us,
+    which is installed in EPREFIX/usr, else the empty string."""
+    if "portage" in sys.modules:
+        try:
+            from portage.const import EPREFIX
+            return EPREFIX
+        except ImportError:
+            pass
+    eprefix = os.environ.get("PORTAGE_OVERRIDE_EPREFIX")
+    if eprefix is not None:
+        return eprefix.rstrip(os.sep)
+    base = getattr(sys, "base_prefix", sys.prefix)
+    if base.endswith(os.sep + "usr"):
+        return base[:-len(os.sep + "usr")]
+    return ''
+
+# portage.const.EPREFIX where portage is loaded anyway, importing it
+# only for this costs esearch all of portage's start up
+EPREFIX = _eprefix()
 
 NORMAL =  1
 COMPACT = 2
 VERBOSE = 3
 EBUILDS = 4
 OWN =     5
+# one record per package, see esearch.records
+JSONL =   6
+TSV =     7
+NUL =     8
+RECORDS = (JSONL, TSV, NUL)
 
 
 SyncOpts = {
@@ -39,22 +64,54 @@ SyncOpts = {
 
 logfile_sync =  EPREFIX + "/var/log/emerge-sync.log"
 laymanlog_sync =  EPREFIX + "/var/log/layman-sync.log"
-tmp_path = "/tmp"
-tmp_prefix = tmp_path + "/esync"
 
 
 CONFIG = {
     'esearchdbdir': EPREFIX + "/var/cache/edb/",
-    'esearchdbfile': "esearchdb.py",
-    'tmpfile': tmp_path + "/esearchdb.py.tmp",
+    'esearchdbfile': "esearchdb.idx",
+    # held with flock by eupdatedb, in esearchdbdir
+    'lockfile': "esearchdb.lock",
+    # the number of indexes eupdatedb keeps, as esearchdbfile.N
+    'generations': 2,
+    # the last one eupdatedb published
+    'generation': None,
+    # the codec eupdatedb compresses the index with, see esearch.compress
+    'compress': None,
+    # installed versions, refreshed when the vdb changes, in esearchdbdir
+    'installedfile': "esearchdb.installed",
+    # eupdatedb's cache of distfile sizes, in esearchdbdir
+    'fetchsizefile': "esearchdb.fetchsize",
+    # the changes esync found, in esearchdbdir
+    'historyfile': "esearchdb.history",
     # -1==quiet, 0==normal, +1==verbose
     'verbose': 0,
     # current esearch database version
-    'needdbversion': 63,
+    'needdbversion': 65,
+    # last version of the esearchdb.py format
+    'legacydbversion': 63,
     'stdout': sys.stdout,
     'stderr': sys.stderr,
     'outputm': NORMAL,
+    # --stats: the esearch.stats.Stats of the run
+    'stats': None,
+    # --profile: the file to write the cProfile data to
+    'profile': None,
+    # the fields of the JSONL, TSV and NUL records, None for the default
+    'fields': None,
     'searchdesc': False,
+    'wordsearch': False,
+    # esearch: reuse the results of earlier identical queries
+    'resultcache': True,
+    # None for $XDG_CACHE_HOME/esearch
+    'resultcachedir': None,
+    # bytes
+    'resultcachesize': 2 * 1024 * 1024,
+    # eupdatedb: rebuild every row, not only those of changed packages
+    'fullrebuild': False,
+    # eupdatedb: number of worker processes
+    'jobs': 1,
+    # eupdatedb: add the homepages to the word index
+    'homepagewords': False,
     'fullname': False,
     'pattern': False,
     'instonly': False,
@@ -63,6 +120,8 @@ CONFIG = {
     'found_in_overlay': False,
     'syncprogram': SyncOpts['sync'],
     'layman-sync': False,
+    # esync --since: (sync number, None) or (None, time)
+    'since': None,
     'layman-cmd': 'layman -SN',
     'eupdatedb_extra_options': '',
     # too time comsuming to import & get it from portage here
@@ -78,6 +137,7 @@ version = __version__
 # get the version from a string like 'foo-bar/bar-0.4_rc2-r1'
 def pkg_version(pkg):
     # from /usr/bin/emerge
+    from portage import catpkgsplit
     if len(pkg) > 1:
         parts = catpkgsplit(pkg)
         if parts == None:
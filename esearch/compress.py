@@ -0,0 +1,149 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""Compressed esearch indexes.
+
+eupdatedb --compress writes the index through a BlockWriter, which cuts
+it into blocks of BLOCK_SIZE bytes and compresses each on its own with
+zlib or lzma.  The file starts with a header naming the codec and ends
+with the table of the offsets of the blocks and a trailer locating it.
+
+Index opens such a file through a BlockFile, which the readers slice
+like the mmap of an uncompressed index.  A slice decompresses only the
+blocks it spans, and the last CACHED_BLOCKS of them are kept, so the
+whole uncompressed index is never in memory at once.
+"""
+
+import struct
+import zlib
+from collections import OrderedDict
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+from esearch.binary import pack_uint32, unpack_from, unpack_uint32
+
+
+MAGIC = b"ESDZ"
+# magic, codec, uncompressed size of a block
+HEADER = struct.Struct("<4s4sI")
+# uncompressed size, offset of the block table, number of blocks
+TRAILER = struct.Struct("<QII")
+
+BLOCK_SIZE = 64 * 1024
+CACHED_BLOCKS = 32
+
+# codec => (compress, decompress)
+CODECS = {"zlib": (zlib.compress, zlib.decompress)}
+if lzma is not None:
+    CODECS["lzma"] = (lzma.compress, lzma.decompress)
+
+
+class BlockWriter(object):
+    """A binary file object compressing what is written to dbfile
+    block by block.  finish() writes the last block and the table."""
+
+    def __init__(self, dbfile, codec, blocksize=BLOCK_SIZE):
+        self._file = dbfile
+        self._compress = CODECS[codec][0]
+        self._blocksize = blocksize
+        self._pending = []
+        self._npending = 0
+        # the uncompressed and compressed bytes written
+        self.size = 0
+        self.compressed = HEADER.size
+        self._offsets = [HEADER.size]
+        dbfile.write(HEADER.pack(MAGIC, codec.encode("ascii"), blocksize))
+
+    def _block(self, data):
+        block = self._compress(data)
+        self._file.write(block)
+        self.compressed += len(block)
+        self._offsets.append(self.compressed)
+
+    def write(self, data):
+        self._pending.append(data)
+        self._npending += len(data)
+        self.size += len(data)
+        if self._npending < self._blocksize:
+            return
+        pending = b"".join(self._pending)
+        end = len(pending) - len(pending) % self._blocksize
+        for start in range(0, end, self._blocksize):
+            self._block(pending[start:start + self._blocksize])
+        self._pending = [pending[end:]]
+        self._npending = len(pending) - end
+
+    def finish(self):
+        if self._npending:
+            self._block(b"".join(self._pending))
+            self._pending = []
+            self._npending = 0
+        table = self.compressed
+        self._file.write(pack_uint32(self._offsets))
+        self._file.write(TRAILER.pack(self.size, table,
+            len(self._offsets) - 1))
+        self.compressed += 4 * len(self._offsets) + TRAILER.size
+
+
+class BlockFile(object):
+    """The uncompressed image of the compressed index in buf, an mmap.
+    Only slices of it can be taken."""
+
+    def __init__(self, buf):
+        if len(buf) < HEADER.size + TRAILER.size:
+            raise ValueError("the compressed index is truncated")
+        magic, codec, self.blocksize = unpack_from(HEADER, buf, 0)
+        self.codec = codec.decode("ascii", "replace")
+        if self.codec not in CODECS:
+            raise ValueError("the index is compressed with %s, which this "
+                "Python lacks" % self.codec)
+        self._decompress = CODECS[self.codec][1]
+        self.size, table, nblocks = unpack_from(TRAILER, buf,
+            len(buf) - TRAILER.size)
+        if table + 4 * (nblocks + 1) > len(buf) - TRAILER.size or \
+                nblocks * self.blocksize < self.size:
+            raise ValueError("the compressed index is truncated")
+        self._offsets = unpack_uint32(buf, table, nblocks + 1)
+        self._buf = buf
+        self.compressed = len(buf)
+        # block number => decompressed block, least recently used first
+        self._blocks = OrderedDict()
+
+    def __len__(self):
+        return self.size
+
+    def decode(self, data):
+        """Decompresses one block, wrapped by --stats to time it"""
+        return self._decompress(data)
+
+    def _block(self, n):
+        block = self._blocks.pop(n, None)
+        if block is None:
+            block = self.decode(self._buf[self._offsets[n]:
+                self._offsets[n + 1]])
+            if len(self._blocks) >= CACHED_BLOCKS:
+                self._blocks.popitem(last=False)
+        self._blocks[n] = block
+        return block
+
+    def __getitem__(self, key):
+        start, stop, step = key.indices(self.size)
+        if stop <= start:
+            return b""
+        blocksize = self.blocksize
+        first = start // blocksize
+        last = (stop - 1) // blocksize
+        if first == last:
+            base = first * blocksize
+            return self._block(first)[start - base:stop - base]
+        parts = [self._block(first)[start - first * blocksize:]]
+        for n in range(first + 1, last):
+            parts.append(self._block(n))
+        parts.append(self._block(last)[:stop - last * blocksize])
+        return b"".join(parts)
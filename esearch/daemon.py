@@ -0,0 +1,320 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""esearchd, answers esearch queries from a resident index.
+
+esearchd imports portage and opens the index once, then answers the
+requests of esearch (see esearch.client) on a Unix socket.  Each
+request is parsed by search.parseopts() like an esearch command line,
+so every option works the same.  --ebuild, which is interactive, and
+--directory for another index are handed back to esearch to run in
+process.  The output is sent to esearch as it is written.
+
+The socket is only open to the group of its directory, portage for
+/var/cache/edb.  Every connection is read in a thread of its own, so a
+client which is slow to send its query holds up no other, but the
+queries are answered one at a time: they switch sys.stdout and the
+colors of the whole process.  Before each query esearchd checks whether
+eupdatedb renamed a new index into place or the installed packages
+changed, and if so opens the new index, so a query sees either the old
+or the new index, never a mix.
+"""
+
+from __future__ import print_function
+
+import os
+import signal
+import socket
+import sys
+import threading
+import traceback
+from getopt import getopt, GetoptError
+
+# resident, so the searches which need portage should not wait for it
+# before esearch.common, which takes EPREFIX from it
+import portage.output
+
+from esearch import color
+from esearch.color import bold, darkgreen
+
+from esearch.client import read_message, send_message, socket_path
+from esearch.common import CONFIG, EBUILDS, error, version
+from esearch.index import Index
+from esearch.stats import Stats
+from esearch import search
+from esearch.vdb import load_installed
+
+
+# seconds esearchd waits for a client to send its query or take a
+# piece of the answer
+CONNECTION_TIMEOUT = 5
+
+# the output sent to esearch in pieces of about this many characters
+CHUNK_SIZE = 16384
+
+
+class _Stream(object):
+    """A text file sending what is written to it to esearch as messages
+    {kind: text}"""
+
+    def __init__(self, conn, kind):
+        self._conn = conn
+        self._kind = kind
+        self._pending = []
+        self._size = 0
+
+    def write(self, text):
+        self._pending.append(text)
+        self._size += len(text)
+        if self._size >= CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            text = u"".join(piece if not isinstance(piece, bytes) else
+                piece.decode("utf_8", "replace") for piece in self._pending)
+            self._pending = []
+            self._size = 0
+            send_message(self._conn, {self._kind: text})
+
+    def discard(self):
+        self._pending = []
+        self._size = 0
+
+
+def usage():
+    print("esearchd (%s) - Answers esearch queries from a resident index" %
+        version)
+    print("")
+    print(bold("Usage:"), "esearchd [", darkgreen("options"), "]")
+    print(bold("Options:"))
+    print(darkgreen("  --help") + ", " + darkgreen("-h"))
+    print("    Print this help message")
+    print("")
+    print(darkgreen("  --directory=") + "dir" + ", " + darkgreen("-d"), "dir")
+    print("    Use dir as directory to load esearch index from")
+    print("")
+    print(darkgreen("  --socket=") + "path" + ", " + darkgreen("-s"), "path")
+    print("    Listen on path instead of " + socket_path())
+
+    sys.exit(0)
+
+
+def parseopts(opts, config=None):
+
+    if config is None:
+        config = CONFIG
+
+    config['socketpath'] = socket_path()
+    for a in opts[0]:
+        arg = a[0]
+        if arg in ("-h", "--help"):
+            usage()
+        elif arg in ("-d", "--directory"):
+            config['esearchdbdir'] = a[1]
+            if not os.path.exists(config['esearchdbdir']):
+                error("directory '" + darkgreen(config['esearchdbdir']) +
+                    "' does not exist.", stderr=config['stderr'])
+        elif arg in ("-s", "--socket"):
+            config['socketpath'] = a[1]
+    if not config['socketpath']:
+        error("no socket to listen on, ESEARCHD_SOCKET is empty",
+            stderr=config['stderr'])
+    return config
+
+
+def _exit_status(code):
+    """Returns the exit status of sys.exit(code)"""
+    if code is None or code is False:
+        return 0
+    if code is True:
+        return 1
+    if isinstance(code, int):
+        return code
+    return 1
+
+
+class Server(object):
+    """The resident index and the queries answered from it"""
+
+    def __init__(self, config):
+        self.config = config
+        self.dbpath = os.path.join(config['esearchdbdir'],
+            config['esearchdbfile'])
+        self.db = search.loaddb(config)
+        if not isinstance(self.db, Index):
+            error("esearchd needs an index written by this version of " +
+                "eupdatedb", stderr=config['stderr'])
+        # the first query picks up the installed packages
+        self._installed = None
+        self._stamp = self._stat()
+        # colors are switched off by --nocolor, for its query only
+        self._havecolor = color.havecolor
+        # held while a query runs
+        self._lock = threading.Lock()
+
+    def _stat(self):
+        try:
+            st = os.stat(self.dbpath)
+        except OSError:
+            return None
+        return (st.st_dev, st.st_ino, st.st_mtime, st.st_size)
+
+    def refresh(self):
+        """Opens the index again if eupdatedb published a new one or the
+        installed packages changed.  Keeps the old one if the new one
+        cannot be read."""
+        stamp = self._stat()
+        installed = load_installed(self.config)
+        if stamp is None or (stamp == self._stamp and
+                installed == self._installed):
+            return
+        try:
+            db = Index(self.dbpath, installed)
+        except (IOError, OSError, ValueError):
+            return
+        if db.dbversion < self.config['needdbversion']:
+            return
+        self.db = db
+        self._stamp = stamp
+        self._installed = installed
+
+    def answer(self, args, conn):
+        """Runs the esearch command line args, sending the output and
+        the exit status to conn"""
+        stdout = _Stream(conn, "stdout")
+        stderr = _Stream(conn, "stderr")
+        with self._lock:
+            answer = self._answer(args, stdout, stderr)
+            if answer.get("fallback"):
+                # esearch says it all again
+                stdout.discard()
+                stderr.discard()
+            else:
+                stdout.flush()
+                stderr.flush()
+            send_message(conn, answer)
+
+    def _answer(self, args, stdout, stderr):
+        config = dict(self.config)
+        config['exclude'] = []
+        config['stdout'] = stdout
+        config['stderr'] = stderr
+        saved = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = stdout, stderr
+        try:
+            try:
+                try:
+                    opts = search.getopts(args)
+                except GetoptError as errmsg:
+                    error(str(errmsg) + "(see" + darkgreen("--help") +
+                        "for all options)" + '\n', stderr=stderr)
+                for arg, value in opts[0]:
+                    # relative to the working directory of esearch
+                    if arg in ("-d", "--directory") and \
+                            not os.path.isabs(value):
+                        return {"fallback": True}
+                config = search.parseopts(opts, config)
+                if config['outputm'] == EBUILDS or config['profile'] or \
+                        not os.path.samefile(config['esearchdbdir'],
+                        self.config['esearchdbdir']):
+                    return {"fallback": True}
+                if config['stats'] is not None:
+                    # the imports and start up are esearchd's
+                    config['stats'] = Stats(process=False)
+                self.refresh()
+                if config['stats'] is not None:
+                    config['stats'].mark("refresh")
+                # sys.exit() values are opposite T/F
+                status = int(not search.query(config, opts[1], self.db))
+                if config['stats'] is not None:
+                    config['stats'].report(stderr)
+            except SystemExit as exiting:
+                status = _exit_status(exiting.code)
+            except Exception:
+                traceback.print_exc(file=stderr)
+                status = 1
+        finally:
+            sys.stdout, sys.stderr = saved
+            color.havecolor = self._havecolor
+            portage.output.havecolor = self._havecolor
+        return {"status": status}
+
+    def handle(self, conn):
+        """Answers the query of conn, in a thread of its own"""
+        # a client which sends nothing or takes no answer must not
+        # block the others for long
+        conn.settimeout(CONNECTION_TIMEOUT)
+        try:
+            message = read_message(conn)
+            if message is not None:
+                self.answer(message["args"], conn)
+        except (socket.timeout, socket.error, ValueError, KeyError,
+                TypeError):
+            pass
+        finally:
+            conn.close()
+
+    def serve(self):
+        """Answers queries until esearchd is terminated"""
+        path = self.config['socketpath']
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except socket.error:
+                # left behind by an esearchd which was killed
+                os.unlink(path)
+            else:
+                error("esearchd is already listening on " + path,
+                    stderr=self.config['stderr'])
+            finally:
+                probe.close()
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            listener.bind(path)
+            # only for the group of the directory, the others search
+            # in process
+            try:
+                os.chown(path, -1,
+                    os.stat(os.path.dirname(os.path.abspath(path))).st_gid)
+            except OSError:
+                pass
+            os.chmod(path, 0o660)
+            listener.listen(16)
+            while True:
+                conn = listener.accept()[0]
+                thread = threading.Thread(target=self.handle, args=(conn,))
+                thread.daemon = True
+                thread.start()
+        finally:
+            listener.close()
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+def _terminate(signum, frame):
+    sys.exit(0)
+
+
+def main():
+    try:
+        opts = getopt(sys.argv[1:], "hd:s:", ["help", "directory=", "socket="])
+    except GetoptError as errmsg:
+        error(str(errmsg) + "(see" + darkgreen("--help") +
+            "for all options)" + '\n')
+    config = parseopts(opts)
+    signal.signal(signal.SIGTERM, _terminate)
+    try:
+        Server(config).serve()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""Differences between two esearch indexes.
+
+eupdatedb writes the rows of the index in cat/pkg order, the order of
+portdb.cp_all().  Two indexes are compared by walking both in that order
+at once, like the merge of two sorted lists: every row is looked at
+once and the changes come out as soon as they are found.
+
+Rows are compared by a hash of their content.  Only the rows whose hash
+differs are read in full to tell what kind of change it is.
+"""
+
+from hashlib import md5
+from itertools import count
+
+from esearch.index import (Index, FULLNAME, MASKED, VERSION, SIZE, HOMEPAGE,
+    DESCRIPTION, LICENSE)
+
+
+# the kinds of changes, a changed row can be of several
+ADDED = "A"
+REMOVED = "R"
+VERSION_CHANGED = "V"
+MASK_CHANGED = "M"
+DESCRIPTION_CHANGED = "D"
+# homepage, license or size of the downloaded files
+OTHER_CHANGED = "O"
+
+KINDS = (ADDED, REMOVED, VERSION_CHANGED, MASK_CHANGED, DESCRIPTION_CHANGED,
+    OTHER_CHANGED)
+
+# the fields the content hash covers, the installed version does not
+# belong to the tree
+CONTENT = (MASKED, VERSION, SIZE, HOMEPAGE, DESCRIPTION, LICENSE)
+
+
+def content_hash(values):
+    """Returns the hash of the CONTENT values of a row"""
+    values = list(values)
+    values[0] = values[0] and "1" or ""
+    return md5(u"\0".join(u"%s" % value for value in values)
+        .encode("utf_8")).digest()[:8]
+
+
+def entries(db):
+    """Yields (fullname, content hash, row) of db, an Index or a list of
+    rows, in cat/pkg order.  Raises ValueError if db is out of order."""
+    if isinstance(db, Index):
+        columns = [db.column(field) for field in (FULLNAME,) + CONTENT]
+        rows = ((values[0], content_hash(values[1:]), i)
+            for values, i in zip(zip(*columns), count()))
+    else:
+        rows = ((pkg[FULLNAME], content_hash(pkg[field] for field in CONTENT),
+            i) for i, pkg in enumerate(db))
+    last = None
+    for entry in rows:
+        if last is not None and entry[0] < last:
+            raise ValueError("the index is not in cat/pkg order at " +
+                entry[0])
+        last = entry[0]
+        yield entry
+
+
+def classify(oldpkg, newpkg):
+    """Returns the kinds of change from row oldpkg to row newpkg, None
+    standing for a missing row"""
+    if oldpkg is None:
+        return ADDED
+    if newpkg is None:
+        return REMOVED
+    kinds = ""
+    if oldpkg[VERSION] != newpkg[VERSION]:
+        kinds += VERSION_CHANGED
+    if bool(oldpkg[MASKED]) != bool(newpkg[MASKED]):
+        kinds += MASK_CHANGED
+    if oldpkg[DESCRIPTION] != newpkg[DESCRIPTION]:
+        kinds += DESCRIPTION_CHANGED
+    for field in (SIZE, HOMEPAGE, LICENSE):
+        if oldpkg[field] != newpkg[field]:
+            kinds += OTHER_CHANGED
+            break
+    return kinds
+
+
+def changes(old, new):
+    """Yields (kinds, fullname, old row, new row) of every package which
+    was added, removed or changed from old to new, in cat/pkg order.  The
+    row a package is missing from is None."""
+    olds = entries(old)
+    current = next(olds, None)
+    for fullname, digest, i in entries(new):
+        while current is not None and current[0] < fullname:
+            yield REMOVED, current[0], old[current[2]], None
+            current = next(olds, None)
+        if current is None or current[0] != fullname:
+            yield ADDED, fullname, None, new[i]
+            continue
+        if current[1] != digest:
+            oldpkg, newpkg = old[current[2]], new[i]
+            kinds = classify(oldpkg, newpkg)
+            if kinds:
+                yield kinds, fullname, oldpkg, newpkg
+        current = next(olds, None)
+    while current is not None:
+        yield REMOVED, current[0], old[current[2]], None
+        current = next(olds, None)
@@ -8,6 +8,8 @@
 
 """Provides support functions for USE flag settings and analysis"""
 
+import re
+
 from portage import settings as default_settings
 from portage import portdb
 
@@ -31,7 +33,7 @@ def get_iuse(cpv, settings=default_settings):
 
 
 def filter_flags(use, use_expand_hidden, usemasked,
-        useforced, settings=default_settings):
+        useforced, settings=default_settings, archlist=None):
     """Filter function to remove hidden or otherwise not normally
     visible USE flags from a list.
 
@@ -45,29 +47,70 @@ def filter_flags(use, use_expand_hidden, usemasked,
     @param useforced: the forced USE flags.
     @param settings: optional portage config settings instance.
         defaults to portage.api.settings.default_settings
+    @type archlist: list
+    @param archlist: optional PORTAGE_ARCHLIST, split, read from
+        settings if None
     @rtype: list
-    @return the filtered USE flags.
+    @return the filtered USE flags, use itself.
     """
-    # clean out some environment flags, since they will most probably
-    # be confusing for the user
-    for flag in use_expand_hidden:
-        flag = flag.lower() + "_"
-        for expander in use:
-            if flag in expander:
-                use.remove(expander)
-    # clean out any arch's
-    archlist = settings["PORTAGE_ARCHLIST"].split()
-    for key in use[:]:
-        if key in archlist:
-            use.remove(key)
-    # dbl check if any from usemasked  or useforced are still there
-    masked = usemasked + useforced
-    for flag in use[:]:
-        if flag in masked:
-            use.remove(flag)
+    use[:] = FlagFilter(use_expand_hidden, archlist, settings).filter(use,
+        usemasked, useforced)
     return use
 
 
+class FlagFilter(object):
+    """Removes hidden, arch, masked and forced flags from USE flag lists.
+
+    What does not depend on the package is prepared once: the arch list
+    as a frozenset and the USE_EXPAND_HIDDEN prefixes as a single
+    regular expression, so each list is filtered in one pass.
+    """
+
+    def __init__(self, use_expand_hidden, archlist=None,
+            settings=default_settings):
+        if archlist is None:
+            archlist = settings["PORTAGE_ARCHLIST"].split()
+        self.archlist = frozenset(archlist)
+        # clean out some environment flags, since they will most probably
+        # be confusing for the user
+        if use_expand_hidden:
+            self._hidden = re.compile("|".join(re.escape(flag.lower() + "_")
+                for flag in use_expand_hidden)).search
+        else:
+            self._hidden = None
+
+    def filter(self, use, usemasked=(), useforced=()):
+        """Returns the flags of use which are neither hidden, an arch,
+        masked nor forced, in their order"""
+        removed = self.archlist.union(usemasked, useforced)
+        hidden = self._hidden
+        if hidden is None:
+            return [flag for flag in use if flag not in removed]
+        return [flag for flag in use
+            if flag not in removed and not hidden(flag)]
+
+
+def filter_flags_bulk(flags, use_expand_hidden, settings=default_settings,
+        archlist=None):
+    """Filters the USE flag lists of many packages at once.
+
+    @type flags: dict
+    @param flags: {cpv: (use, usemasked, useforced)}
+    @type use_expand_hidden: list
+    @param  use_expand_hidden: list of flags hidden.
+    @param settings: optional portage config settings instance.
+        defaults to portage.api.settings.default_settings
+    @type archlist: list
+    @param archlist: optional PORTAGE_ARCHLIST, split, read from
+        settings if None
+    @rtype: dict
+    @return {cpv: the filtered USE flags}
+    """
+    flagfilter = FlagFilter(use_expand_hidden, archlist, settings)
+    return dict((cpv, flagfilter.filter(use, usemasked, useforced))
+        for cpv, (use, usemasked, useforced) in flags.items())
+
+
 def get_all_cpv_use(cpv, settings=default_settings):
     """Uses portage to determine final USE flags and settings for an emerge
 
@@ -123,3 +166,57 @@ def get_flags(cpv, final_setting=False, settings=default_settings):
             usemasked, useforced, settings)
         return iuse_flags, final_flags
     return iuse_flags
+
+
+def get_flags_batch(cpvs, iuse=None, settings=default_settings):
+    """Retrieves the filtered IUSE and final USE flags of many packages
+    at once.  The settings are unlocked once for all of them, and what
+    does not depend on the package (the arch list and USE_EXPAND_HIDDEN)
+    is only looked up once.
+
+    @type cpvs: list
+    @param cpvs: eg. [cat/pkg-ver, ...]
+    @type iuse: dict
+    @param iuse: optional {cpv: IUSE string}, the IUSE of the cpvs
+        missing from it are read from the tree
+    @param settings: optional portage config settings instance.
+        defaults to portage.api.settings.default_settings
+    @rtype: dict
+    @return {cpv: (IUSE, final_flags)}
+    """
+    if iuse is None:
+        iuse = {}
+    archlist = settings["PORTAGE_ARCHLIST"].split()
+    # packages without settings are only cleaned of arch flags,
+    # as get_all_cpv_use() does
+    unknown = FlagFilter((), archlist, settings)
+    flagfilter = None
+    flags = {}
+    portdb.settings.unlock()
+    try:
+        for cpv in cpvs:
+            if cpv in flags:
+                continue
+            if cpv in iuse:
+                iuse_flags = iuse[cpv].split()
+            else:
+                iuse_flags = get_iuse(cpv)
+            try:
+                portdb.settings.setcpv(cpv, mydb=portdb)
+                final_use = settings['PORTAGE_USE'].split()
+                if flagfilter is None:
+                    flagfilter = FlagFilter(
+                        settings["USE_EXPAND_HIDDEN"].split(), archlist,
+                        settings)
+                usemasked = portdb.settings.usemask
+                useforced = portdb.settings.useforce
+            except KeyError:
+                flags[cpv] = (unknown.filter(iuse_flags), [])
+                continue
+            flags[cpv] = (flagfilter.filter(iuse_flags, usemasked, useforced),
+                flagfilter.filter(final_use, usemasked, useforced))
+    finally:
+        # reset cpv filter
+        portdb.settings.reset()
+        portdb.settings.lock()
+    return flags
@@ -0,0 +1,92 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""The history of the changes esync found.
+
+Every esync run appends one line to the history file next to the index,
+a JSON object holding the number of the sync, its time and the changes
+of the tree, each as [kinds, cat/pkg, old version, new version] (see
+esearch.diff for the kinds).  What changed since a sync or a date is
+read back from it, no copy of an old index has to be kept around.
+"""
+
+import io
+import json
+import time
+
+
+def read_history(path):
+    """Yields the syncs recorded in the history at path, oldest first"""
+    try:
+        historyfile = io.open(path, encoding="utf_8")
+    except (IOError, OSError):
+        return
+    with historyfile:
+        for line in historyfile:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # cut short by a crash while it was appended
+                continue
+
+
+def last_sync(path):
+    """Returns the number of the last sync in the history at path,
+    0 if there is none"""
+    number = 0
+    for sync in read_history(path):
+        number = sync["sync"]
+    return number
+
+
+def append_sync(path, changes, when=None):
+    """Appends a sync to the history at path and returns its number
+
+    @type changes: list
+    @param changes: the (kinds, cat/pkg, old version, new version) of
+        the sync, the versions are empty for added or removed packages
+    @type when: float
+    @param when: the time of the sync, now if None
+    """
+    if when is None:
+        when = time.time()
+    number = last_sync(path) + 1
+    line = json.dumps({"sync": number, "time": int(when),
+        "changes": [list(change) for change in changes]},
+        separators=(",", ":"), sort_keys=True)
+    line = u"" + line + u"\n"
+    with io.open(path, "a+b") as historyfile:
+        historyfile.seek(0, io.SEEK_END)
+        if historyfile.tell():
+            # a crash may have cut the last line short, which would
+            # swallow this one
+            historyfile.seek(-1, io.SEEK_END)
+            if historyfile.read(1) != b"\n":
+                line = u"\n" + line
+        historyfile.write(line.encode("utf_8"))
+    return number
+
+
+def parse_since(since):
+    """Returns (sync number, None) or (None, time) for the argument of
+    esync --since, a sync number or a date like 2010-03-21 [13:05].
+    Raises ValueError for anything else."""
+    if since.isdigit():
+        return int(since), None
+    for format in ("%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return None, time.mktime(time.strptime(since, format))
+        except ValueError:
+            continue
+    raise ValueError("'%s' is neither a sync number nor a date" % since)
+
+
+def syncs_since(path, number=None, when=None):
+    """Returns the syncs of the history at path after sync number, or
+    at or after the time when"""
+    if number is not None:
+        return [sync for sync in read_history(path) if sync["sync"] > number]
+    return [sync for sync in read_history(path) if sync["time"] >= when]
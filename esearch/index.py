@@ -0,0 +1,399 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""Reads and writes the binary esearch index.
+
+The index is a single file made of a header, a section table and one
+section per column.  String columns are stored as a table of nrows + 1
+little endian uint32 offsets followed by the utf-8 encoded strings, flag
+columns as one byte per row.  The reader mmaps the file, so a search only
+decodes the fields it actually looks at.
+
+The columns a name search needs sit in a small hot segment at the start
+of the file.  Homepage, description, license, fetch size, and the IUSE
+and version of the best unstable ebuild for --verbose follow in a page
+aligned cold segment, which is only read for the rows that are
+displayed or when descriptions are searched.  The trigram posting lists
+(see esearch.trigram), the sorted name tables (see esearch.prefix) and
+the word index (see esearch.words) are appended last.
+
+Installed versions are not part of the index, they change with every
+emerge.  They are joined in from the installed overlay (see esearch.vdb)
+the Index is opened with.
+
+eupdatedb --compress writes the same file compressed in blocks, which
+the Index decompresses as they are read (see esearch.compress).
+"""
+
+import mmap
+import os
+import struct
+from hashlib import md5
+from itertools import islice
+
+from esearch.binary import (COUNT, pack_strings, read_string, unpack_from,
+    unpack_uint32)
+from esearch.compress import BlockFile, MAGIC as BLOCK_MAGIC
+from esearch.prefix import SortedIndex, pack_sorted
+from esearch.trigram import TrigramIndex, pack_trigrams
+from esearch.words import WordIndex, pack_words
+
+
+MAGIC = b"ESDB"
+# magic, dbversion, number of rows, number of sections
+HEADER = struct.Struct("<4sIII")
+# tag, offset from the start of the file, length
+SECTION = struct.Struct("<4sQQ")
+
+# the fields of a row, in the order of the tuples eupdatedb has always used,
+# followed by the IUSE and the version of the best unstable ebuild
+(NAME, FULLNAME, MASKED, VERSION, INSTALLED, SIZE, HOMEPAGE,
+    DESCRIPTION, LICENSE, IUSE, UNSTABLE) = range(11)
+
+TAGS = (b"name", b"full", b"mask", b"vers", b"inst", b"size", b"home",
+    b"desc", b"lics", b"iuse", b"unst")
+
+HOT_COLUMNS = (NAME, FULLNAME, MASKED, VERSION)
+COLD_COLUMNS = (SIZE, HOMEPAGE, DESCRIPTION, LICENSE, IUSE, UNSTABLE)
+# the section spanning the whole cold segment
+COLD_TAG = b"cold"
+
+FLAG_COLUMNS = (MASKED,)
+
+
+# trigram posting lists of the full name and description columns
+TRIGRAM_TAGS = {FULLNAME: b"tful", DESCRIPTION: b"tdsc"}
+# rows in case folded order of the name and full name columns
+SORTED_TAGS = {NAME: b"snam", FULLNAME: b"sful"}
+WORDS_TAG = b"wrds"
+# eupdatedb's fingerprint of each row, FINGERPRINT_SIZE bytes per row
+FINGERPRINT_TAG = b"fprt"
+FINGERPRINT_SIZE = 8
+# string table of alternating keys and values describing the index
+META_TAG = b"meta"
+
+
+def _pack_flags(values):
+    return bytes(bytearray(1 if value else 0 for value in values))
+
+
+def _pack_column(rows, field):
+    values = [row[field] for row in rows]
+    if field in FLAG_COLUMNS:
+        return _pack_flags(values)
+    return pack_strings(values)
+
+
+def write_index(dbfile, rows, dbversion, homepage_words=False,
+        fingerprints=None, meta=None):
+    """Writes the index to the binary file object dbfile
+
+    @type rows: list
+    @param rows: the (name, fullname, masked, version, installed,
+        size, homepage, description, license, iuse, unstable version)
+        tuples, in tree order.
+        The installed versions are not written.
+    @type dbversion: int
+    @param dbversion: the index version stored in the header
+    @type homepage_words: boolean
+    @param homepage_words: add the words of the homepages to the word index
+    @type fingerprints: list
+    @param fingerprints: optional FINGERPRINT_SIZE byte strings, one per row
+    @type meta: dict
+    @param meta: optional strings describing the index, see Index.meta
+    """
+    hot = [(TAGS[field], _pack_column(rows, field)) for field in HOT_COLUMNS]
+    cold = [(TAGS[field], _pack_column(rows, field))
+        for field in COLD_COLUMNS]
+    extra = [(tag, pack_trigrams([row[field] for row in rows]))
+        for field, tag in sorted(TRIGRAM_TAGS.items())]
+    extra += [(tag, pack_sorted([row[field] for row in rows]))
+        for field, tag in sorted(SORTED_TAGS.items())]
+    if homepage_words:
+        homepages = [row[HOMEPAGE] for row in rows]
+    else:
+        homepages = None
+    extra.append((WORDS_TAG, pack_words([row[NAME] for row in rows],
+        [row[DESCRIPTION] for row in rows], homepages)))
+    if fingerprints is not None:
+        extra.append((FINGERPRINT_TAG, b"".join(fingerprints)))
+    if meta:
+        items = [item for key in sorted(meta) for item in (key, meta[key])]
+        extra.append((META_TAG, COUNT.pack(len(items)) + pack_strings(items)))
+
+    nsections = len(hot) + len(cold) + 1 + len(extra)
+    offset = HEADER.size + SECTION.size * nsections
+    table = []
+    for tag, data in hot:
+        table.append((tag, offset, len(data)))
+        offset += len(data)
+    padding = -offset % mmap.PAGESIZE
+    offset += padding
+    coldstart = offset
+    for tag, data in cold:
+        table.append((tag, offset, len(data)))
+        offset += len(data)
+    table.append((COLD_TAG, coldstart, offset - coldstart))
+    for tag, data in extra:
+        table.append((tag, offset, len(data)))
+        offset += len(data)
+
+    dbfile.write(HEADER.pack(MAGIC, dbversion, len(rows), nsections))
+    for section in table:
+        dbfile.write(SECTION.pack(*section))
+    for tag, data in hot:
+        dbfile.write(data)
+    dbfile.write(b"\0" * padding)
+    for tag, data in cold + extra:
+        dbfile.write(data)
+
+
+class StringColumn(object):
+    """A lazily decoded column of strings"""
+
+    def __init__(self, buf, offset, nrows):
+        self._buf = buf
+        self._offsets = unpack_uint32(buf, offset, nrows + 1)
+        self._base = offset + 4 * (nrows + 1)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        start = self._base + self._offsets[i]
+        end = self._base + self._offsets[i + 1]
+        return self._buf[start:end].decode("utf_8")
+
+    def __iter__(self):
+        buf, base = self._buf, self._base
+        start = base + self._offsets[0]
+        for end in islice(self._offsets, 1, None):
+            end += base
+            yield buf[start:end].decode("utf_8")
+            start = end
+
+
+class FlagColumn(object):
+    """A column of booleans, one byte per row"""
+
+    def __init__(self, buf, offset, nrows):
+        self._buf = buf
+        self._offset = offset
+        self._nrows = nrows
+
+    def __len__(self):
+        return self._nrows
+
+    def __getitem__(self, i):
+        return self._buf[self._offset + i:self._offset + i + 1] != b"\0"
+
+    def __iter__(self):
+        for byte in bytearray(self._buf[self._offset:self._offset + self._nrows]):
+            yield byte != 0
+
+
+class InstalledColumn(object):
+    """The installed versions of the rows, False if not installed,
+    looked up by full name in the installed overlay"""
+
+    def __init__(self, fullnames, installed):
+        self._fullnames = fullnames
+        self._installed = installed
+
+    def __len__(self):
+        return len(self._fullnames)
+
+    def __getitem__(self, i):
+        return self._installed.get(self._fullnames[i], False)
+
+    def __iter__(self):
+        installed = self._installed
+        for fullname in self._fullnames:
+            yield installed.get(fullname, False)
+
+
+class Row(object):
+    """A row of the index which behaves like the tuples of the old
+    esearchdb.py index, with the IUSE and UNSTABLE fields appended.
+    The cold fields are only read when used."""
+
+    __slots__ = ("_index", "_row", "_fields")
+
+    def __init__(self, index, row):
+        self._index = index
+        self._row = row
+        self._fields = {}
+
+    def __getitem__(self, field):
+        if isinstance(field, slice):
+            return tuple(self)[field]
+        if field < 0:
+            field += len(TAGS)
+        try:
+            return self._fields[field]
+        except KeyError:
+            value = self._fields[field] = self._index.field(self._row, field)
+            return value
+
+    def __len__(self):
+        return len(TAGS)
+
+    @property
+    def number(self):
+        """The number of the row in its index"""
+        return self._row
+
+    def __iter__(self):
+        for field in range(len(TAGS)):
+            yield self[field]
+
+    def __eq__(self, other):
+        return tuple(self) == tuple(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return repr(tuple(self))
+
+
+class Index(object):
+    """A read only, memory mapped esearch index
+
+    Rows are returned as Row objects which behave like the tuples the
+    old esearchdb.py index contained.  Use column() to scan a single
+    field of every row.  installed is the cat/pkg -> installed version
+    map joined in, generation tells the files eupdatedb wrote apart.
+    blocks is the BlockFile of a compressed index, else None.
+    """
+
+    def __init__(self, path, installed=None):
+        if installed is None:
+            installed = {}
+        self.installed = installed
+        dbfile = open(path, "rb")
+        try:
+            # eupdatedb renames every new index into place
+            st = os.fstat(dbfile.fileno())
+            self.generation = md5(("%d %d %r %d" % (st.st_dev, st.st_ino,
+                st.st_mtime, st.st_size)).encode("utf_8")).hexdigest()[:16]
+            try:
+                self._buf = mmap.mmap(dbfile.fileno(), 0,
+                    access=mmap.ACCESS_READ)
+            except ValueError:
+                # mmap refuses empty files
+                raise ValueError("%s is empty" % path)
+        finally:
+            dbfile.close()
+
+        self.blocks = None
+        if self._buf[:len(BLOCK_MAGIC)] == BLOCK_MAGIC:
+            self.blocks = self._buf = BlockFile(self._buf)
+        if len(self._buf) < HEADER.size:
+            raise ValueError("%s is truncated" % path)
+        magic, self.dbversion, self.nrows, nsections = \
+            unpack_from(HEADER, self._buf, 0)
+        if magic != MAGIC:
+            raise ValueError("%s is not an esearch index" % path)
+
+        self._sections = {}
+        for n in range(nsections):
+            tag, offset, length = unpack_from(SECTION, self._buf,
+                HEADER.size + n * SECTION.size)
+            if offset + length > len(self._buf):
+                raise ValueError("%s is truncated" % path)
+            self._sections[tag] = (offset, length)
+        self._columns = {}
+        self._meta = None
+
+        # a few rows are read from the cold segment at random, keep the
+        # kernel from reading ahead all of it
+        if COLD_TAG in self._sections and hasattr(self._buf, "madvise"):
+            offset, length = self._sections[COLD_TAG]
+            if length:
+                self._buf.madvise(mmap.MADV_RANDOM, offset, length)
+
+    def column(self, field):
+        """Returns the column holding field (NAME, FULLNAME, ...)"""
+        column = self._columns.get(field)
+        if column is None:
+            if field == INSTALLED:
+                column = InstalledColumn(self.column(FULLNAME),
+                    self.installed)
+                self._columns[field] = column
+                return column
+            offset, length = self._sections[TAGS[field]]
+            if field in FLAG_COLUMNS:
+                column = FlagColumn(self._buf, offset, self.nrows)
+            else:
+                column = StringColumn(self._buf, offset, self.nrows)
+            self._columns[field] = column
+        return column
+
+    def trigrams(self, field):
+        """Returns the TrigramIndex of field, None if the index has none"""
+        tag = TRIGRAM_TAGS.get(field)
+        if tag not in self._sections:
+            return None
+        return TrigramIndex(self._buf, self._sections[tag][0])
+
+    def sorted(self, field):
+        """Returns the SortedIndex of field, None if the index has none"""
+        tag = SORTED_TAGS.get(field)
+        if tag not in self._sections:
+            return None
+        return SortedIndex(self._buf, self._sections[tag][0],
+            self.column(field))
+
+    def words(self):
+        """Returns the WordIndex, None if the index has none"""
+        if WORDS_TAG not in self._sections:
+            return None
+        return WordIndex(self._buf, self._sections[WORDS_TAG][0])
+
+    @property
+    def meta(self):
+        """The dict of strings eupdatedb stored along with the index"""
+        if self._meta is None:
+            self._meta = {}
+            if META_TAG in self._sections:
+                offset, length = self._sections[META_TAG]
+                (count,) = unpack_from(COUNT, self._buf, offset)
+                items = list(StringColumn(self._buf, offset + COUNT.size,
+                    count))
+                self._meta = dict(zip(items[::2], items[1::2]))
+        return self._meta
+
+    def fingerprint(self, i):
+        """Returns eupdatedb's fingerprint of row i, None if the index
+        has none"""
+        if FINGERPRINT_TAG not in self._sections:
+            return None
+        offset = self._sections[FINGERPRINT_TAG][0] + FINGERPRINT_SIZE * i
+        return self._buf[offset:offset + FINGERPRINT_SIZE]
+
+    def field(self, i, field):
+        """Returns field of row i.  Cold fields of single rows are read
+        without loading their whole column."""
+        column = self._columns.get(field)
+        if column is not None or field not in COLD_COLUMNS:
+            return self.column(field)[i]
+        offset, length = self._sections[TAGS[field]]
+        return read_string(self._buf, offset, self.nrows, i)
+
+    def __len__(self):
+        return self.nrows
+
+    def __getitem__(self, i):
+        return Row(self, i)
+
+    def __iter__(self):
+        columns = [self.column(field) for field in range(len(TAGS))]
+        for row in zip(*columns):
+            yield row
@@ -0,0 +1,101 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""Sorted name tables for anchored and exact name searches.
+
+eupdatedb stores the rows ordered by their case folded name and full
+name.  A pattern such as '^python-' or '^dev-libs/foo$' is resolved by a
+binary search over that order instead of a regex scan of every row; the
+regex only runs on the rows sharing the prefix, and not at all when the
+pattern is a plain literal.
+"""
+
+import re
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+from esearch.binary import COUNT, pack_uint32, unpack_from
+from esearch.trigram import fold
+
+
+_BEGINNING = (sre_parse.AT_BEGINNING, sre_parse.AT_BEGINNING_STRING)
+_END = (sre_parse.AT_END, sre_parse.AT_END_STRING)
+
+
+def pack_sorted(values):
+    """Builds the section holding the rows ordered by folded value"""
+    keys = [fold(value) for value in values]
+    return pack_uint32(sorted(range(len(keys)), key=keys.__getitem__))
+
+
+class SortedIndex(object):
+    """The rows of a string column in case folded order"""
+
+    def __init__(self, buf, offset, column):
+        self._buf = buf
+        self._offset = offset
+        self._column = column
+
+    def _row(self, n):
+        return unpack_from(COUNT, self._buf, self._offset + 4 * n)[0]
+
+    def _key(self, n):
+        return fold(self._column[self._row(n)])
+
+    def lookup(self, prefix, exact=False):
+        """Returns the sorted rows whose folded value starts with
+        (or equals, if exact) the folded prefix"""
+        lo, hi = 0, len(self._column)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        rows = []
+        for n in range(lo, len(self._column)):
+            key = self._key(n)
+            if key == prefix or (not exact and key.startswith(prefix)):
+                rows.append(self._row(n))
+            else:
+                break
+        rows.sort()
+        return rows
+
+
+def anchored_prefix(regex):
+    """Returns (prefix, exact, literal) for a pattern anchored at the start
+    of the name, or None.  prefix is the folded literal every match starts
+    with, exact is True if the match must end right after it and literal
+    is True if matching the prefix is all the pattern does."""
+    try:
+        parsed = list(sre_parse.parse(regex.pattern, regex.flags))
+    except Exception:
+        return None
+    if not parsed or parsed[0][0] is not sre_parse.AT or \
+            parsed[0][1] not in _BEGINNING:
+        return None
+
+    prefix = []
+    rest = parsed[1:]
+    while rest and rest[0][0] is sre_parse.LITERAL and rest[0][1] < 0x80:
+        prefix.append(chr(rest[0][1]))
+        rest = rest[1:]
+    if not prefix:
+        return None
+    prefix = fold(u"".join(prefix))
+
+    if not regex.flags & re.IGNORECASE:
+        # the prefix lookup is case insensitive, let the regex decide
+        return prefix, False, False
+    if not rest:
+        return prefix, False, True
+    if len(rest) == 1 and rest[0][0] is sre_parse.AT and rest[0][1] in _END:
+        return prefix, True, True
+    return prefix, False, False
@@ -0,0 +1,119 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""Publishing of the index eupdatedb writes.
+
+eupdatedb holds an advisory flock on a lock file in the index directory
+while it runs, so a second one gives up instead of writing the same
+files, and a crashed one leaves no lock behind.  The new index is
+written to a temporary file next to the live one, fsync'ed and renamed
+to its generation, esearchdb.idx.N.  The live esearchdb.idx is then
+replaced by a hard link to the generation with another rename, so a
+search opens either the old or the new index, never a half written
+one, and nothing is copied.
+
+The last generations are kept: esync diffs the one it started with
+against the one eupdatedb published, and searches which have an older
+one mmap'ed keep reading it after it is removed.
+"""
+
+import io
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def lock(path):
+    """Returns the open lock file path once it holds the lock on it, None
+    if another process holds it.  Closing the file releases the lock."""
+    lockfile = io.open(path, "ab")
+    if fcntl is not None:
+        try:
+            fcntl.flock(lockfile.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):
+            lockfile.close()
+            return None
+    return lockfile
+
+
+def generation_path(dbdir, dbfile, number):
+    return os.path.join(dbdir, "%s.%d" % (dbfile, number))
+
+
+def generations(dbdir, dbfile):
+    """Returns the numbers of the generations kept in dbdir, oldest
+    first"""
+    numbers = []
+    prefix = dbfile + "."
+    for name in os.listdir(dbdir):
+        if name.startswith(prefix) and name[len(prefix):].isdigit():
+            numbers.append(int(name[len(prefix):]))
+    return sorted(numbers)
+
+
+def _tmp_prefix(dbfile):
+    return "." + dbfile + "."
+
+
+def new_file(dbdir, dbfile):
+    """Returns a file descriptor and the path of a new temporary file in
+    dbdir to write the next generation to"""
+    path = os.path.join(dbdir, "%s%d.tmp" % (_tmp_prefix(dbfile),
+        os.getpid()))
+    if os.path.exists(path):
+        # left behind by a crashed eupdatedb with the same pid
+        os.unlink(path)
+    return os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644), path
+
+
+def _sync_dir(path):
+    """Writes the renames in directory path to disk, where the platform
+    allows it"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def publish(tmppath, dbdir, dbfile, number, keep):
+    """Makes the fsync'ed index at tmppath generation number and the live
+    index, then removes all but the last keep generations and the
+    temporary files of crashed runs.  Call it with the lock held."""
+    path = generation_path(dbdir, dbfile, number)
+    live = os.path.join(dbdir, dbfile)
+    os.rename(tmppath, path)
+    if os.path.exists(live + ".new"):
+        os.unlink(live + ".new")
+    try:
+        os.link(path, live + ".new")
+    except OSError:
+        # a file system without hard links
+        shutil.copyfile(path, live + ".new")
+    os.rename(live + ".new", live)
+    _sync_dir(dbdir)
+
+    for old in generations(dbdir, dbfile)[:-keep]:
+        try:
+            os.unlink(generation_path(dbdir, dbfile, old))
+        except OSError:
+            pass
+    prefix = _tmp_prefix(dbfile)
+    for name in os.listdir(dbdir):
+        if name.startswith(prefix) and name.endswith(".tmp"):
+            try:
+                os.unlink(os.path.join(dbdir, name))
+            except OSError:
+                pass
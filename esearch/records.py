@@ -0,0 +1,143 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""Machine readable output of esearch and esync.
+
+Every package found, or every change esync found, is written as one
+record of the selected fields as soon as it is found: a JSON object per
+line, a line of tab separated values, or NUL terminated values.  The
+values come straight from the index columns, without colors or
+padding, and only the selected columns are read.
+
+In TSV a backslash, tab, newline or carriage return within a value is
+written as \\\\, \\t, \\n or \\r.  In NUL mode the values are not escaped,
+each one is followed by a NUL, so a record is as many values as fields
+were selected (xargs -0 -n <number of fields>).
+"""
+
+import json
+
+from esearch.common import JSONL, TSV, NUL
+from esearch.index import (NAME, FULLNAME, MASKED, VERSION, INSTALLED, SIZE,
+    HOMEPAGE, DESCRIPTION, LICENSE, IUSE, UNSTABLE)
+
+
+# field => index column
+COLUMNS = {
+    "name": NAME,
+    "fullname": FULLNAME,
+    "masked": MASKED,
+    "version": VERSION,
+    "installed": INSTALLED,
+    "size": SIZE,
+    "homepage": HOMEPAGE,
+    "description": DESCRIPTION,
+    "license": LICENSE,
+    "iuse": IUSE,
+    "unstable": UNSTABLE,
+}
+
+# fields of esync: the kinds of change (see esearch.diff), the version
+# before the sync, and the number and time of the sync for --since
+CHANGE_FIELDS = ("change", "oldversion", "sync", "time")
+
+_INDEX_FIELDS = ("category",) + tuple(sorted(COLUMNS))
+# the fields each tool knows, esearch's pattern is the search pattern
+# that found the package
+SEARCH_FIELDS = _INDEX_FIELDS + ("pattern",)
+SYNC_FIELDS = _INDEX_FIELDS + CHANGE_FIELDS
+
+# the fields of the normal output of esearch
+DEFAULT_FIELDS = ("fullname", "masked", "version", "installed", "size",
+    "homepage", "description", "license")
+DEFAULT_CHANGE_FIELDS = ("change", "fullname", "oldversion", "version")
+
+
+def parse_fields(fields, known):
+    """Returns the fields of a comma separated list like
+    "fullname,version".  Raises ValueError for fields not in known."""
+    selected = tuple(field.strip() for field in fields.split(",")
+        if field.strip())
+    unknown = [field for field in selected if field not in known]
+    if unknown:
+        raise ValueError("unknown fields: " + ", ".join(unknown) +
+            " (known: " + ", ".join(known) + ")")
+    if not selected:
+        raise ValueError("no fields selected")
+    return selected
+
+
+def _category(pkg):
+    return pkg[FULLNAME].split("/", 1)[0]
+
+
+def _getter(field):
+    """Returns the function reading field of a row"""
+    if field == "category":
+        return _category
+    column = COLUMNS.get(field)
+    if column is None:
+        # the fields of esync and esearch's pattern have no column
+        return lambda pkg: None
+    if column == MASKED:
+        return lambda pkg: bool(pkg[MASKED])
+    if column == INSTALLED:
+        return lambda pkg: pkg[INSTALLED] or None
+    # rows of an older index lack the last columns
+    return lambda pkg: pkg[column] if column < len(pkg) else None
+
+
+def _text(value):
+    if value is None:
+        return ""
+    if value is True:
+        return "1"
+    if value is False:
+        return "0"
+    return "%s" % value
+
+
+_TSV_ESCAPES = (("\\", "\\\\"), ("\t", "\\t"), ("\n", "\\n"), ("\r", "\\r"))
+
+
+def _tsv(value):
+    value = _text(value)
+    for char, escape in _TSV_ESCAPES:
+        if char in value:
+            value = value.replace(char, escape)
+    return value
+
+
+class RecordWriter(object):
+    """Writes records of fields in one of the output modes JSONL, TSV
+    or NUL"""
+
+    def __init__(self, mode, fields, write):
+        self.mode = mode
+        self.fields = fields
+        self.write = write
+        self._getters = [(field, _getter(field)) for field in fields]
+        self._keys = [json.dumps(field) + ":" for field in fields]
+
+    def format(self, pkg, extra=None):
+        """Returns the record of row pkg, extra holds the values of
+        fields which are not read from pkg, a missing row's are None"""
+        if extra is None:
+            extra = {}
+        values = [extra[field] if field in extra else
+            get(pkg) if pkg is not None else None
+            for field, get in self._getters]
+        if self.mode == JSONL:
+            # in the order the fields were selected
+            return "{" + ",".join([key + json.dumps(value)
+                for key, value in zip(self._keys, values)]) + "}\n"
+        if self.mode == TSV:
+            return "\t".join([_tsv(value) for value in values]) + "\n"
+        return "".join([_text(value) + "\0" for value in values])
+
+    def record(self, pkg, extra=None):
+        """Writes the record of row pkg"""
+        self.write(self.format(pkg, extra))
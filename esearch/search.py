@@ -12,27 +12,32 @@ from __future__ import print_function
 from getopt import getopt, GetoptError
 import sys
 from os import listdir, getenv, system
-from os.path import isdir, exists
+from os.path import isdir, exists, join
 import re
 
+# before portage, to time its import
+from esearch.stats import Profile, Stats
+
 #sys.path.insert(0, "/usr/lib/portage/pym")
 # commented out so it can run from the git checkout
 #sys.path.insert(0, "/usr/lib/esearch")
 
-try:
-    from portage.output import bold, red, green, darkgreen, turquoise, blue, nocolor
-    from portage import settings, pkgcmp, pkgsplit, portdb, best
-    from portage.util import cmp_sort_key
-except ImportError:
-    print("Critical: portage imports failed!")
-    sys.exit(1)
-
+# portage is imported by the few searches that need it, the others
+# only read the index
+from esearch.color import bold, red, green, darkgreen, turquoise, blue, nocolor
 from esearch.common import (CONFIG, NORMAL, COMPACT, VERBOSE, EBUILDS, OWN, pkg_version,
-    error, outofdateerror, version)
-
-# migrate this to the portage public api
-# when/if it is merged into master
-from esearch.flag import get_flags
+    JSONL, TSV, NUL, RECORDS, error, outofdateerror, version)
+from esearch.index import (Index, NAME, FULLNAME, INSTALLED, DESCRIPTION,
+    IUSE, UNSTABLE)
+from esearch.prefix import anchored_prefix
+from esearch.publish import generation_path
+from esearch.trigram import required_trigrams
+from esearch.words import ScanWordIndex, query_words, rank
+from esearch.vdb import load_installed
+from esearch.cache import ResultCache, cache_dir
+from esearch.template import Template
+from esearch.records import (DEFAULT_FIELDS, SEARCH_FIELDS, RecordWriter,
+    parse_fields)
 
 
 
@@ -47,6 +52,10 @@ def usage():
     print(darkgreen("  --searchdesc") + ", " + darkgreen("-S"))
     print("    Search package descriptions as well")
     print("")
+    print(darkgreen("  --words") + ", " + darkgreen("-W"))
+    print("    Find packages using all the given words in their name or")
+    print("    description, best matches first")
+    print("")
     print(darkgreen("  --fullname") + ", " + darkgreen("-F"))
     print("    Search packages full name (includes category)")
     print("")
@@ -71,22 +80,46 @@ def usage():
     print(darkgreen("  --own=") + "format" + ", " + darkgreen("-o"), "format")
     print("    Use your own output format, see manpage for details of format")
     print("")
+    print(darkgreen("  --json") + ", " + darkgreen("-J"))
+    print("    Print a JSON object per package, one per line")
+    print("")
+    print(darkgreen("  --tsv") + ", " + darkgreen("-t"))
+    print("    Print a line of tab separated values per package")
+    print("")
+    print(darkgreen("  --null") + ", " + darkgreen("-0"))
+    print("    Print the values of each package followed by a NUL each")
+    print("")
+    print(darkgreen("  --fields=") + "list" + ", " + darkgreen("-k"), "list")
+    print("    Comma separated fields of --json, --tsv and --null, see manpage")
+    print("")
     print(darkgreen("  --directory=") + "dir" + ", " + darkgreen("-d"), "dir")
     print("    Use dir as directory to load esearch index from")
     print("")
     print(darkgreen("  --nocolor") + ", " + darkgreen("-n"))
     print("    Don't use ANSI codes for colored output")
+    print("")
+    print(darkgreen("  --nocache") + ", " + darkgreen("-C"))
+    print("    Don't use or update the cache of earlier results")
+    print("")
+    print(darkgreen("  --stats") + ", " + darkgreen("-T"))
+    print("    Print the time and peak memory use of each phase to stderr")
+    print("")
+    print(darkgreen("  --profile=") + "file" + ", " + darkgreen("-P"), "file")
+    print("    Write cProfile data of the search to file")
 
     sys.exit(0)
 
 
 
 def mypkgcmp(pkg1, pkg2):
+    from portage import pkgcmp
     return pkgcmp(pkg1[:3], pkg2[:3])
 
 
 def searchEbuilds(path, portdir=True, searchdef="", repo_num="",
         config=None, data=None):
+    from portage import pkgsplit
+    from portage.util import cmp_sort_key
     pv = ""
     pkgs = []
     nr = len(data['ebuilds']) + 1
@@ -133,6 +166,8 @@ def parseopts(opts, config=None):
             usage()
         if arg in ("-S", "--searchdesc"):
             config['searchdesc'] = True
+        elif arg in ("-W", "--words"):
+            config['wordsearch'] = True
         elif arg in ("-F", "--fullname"):
             config['fullname'] = True
         elif arg in ("-I", "--instonly"):
@@ -144,6 +179,7 @@ def parseopts(opts, config=None):
         elif arg in ("-v", "--verbose"):
             config['outputm'] = VERBOSE
         elif arg in ("-e", "--ebuild"):
+            from portage import settings
             config['portdir'] = settings["PORTDIR"]
             config['overlay'] = settings["PORTDIR_OVERLAY"]
             config['outputm'] = EBUILDS
@@ -152,6 +188,17 @@ def parseopts(opts, config=None):
         elif arg in ("-o", "--own"):
             config['outputm'] = OWN
             config['outputf'] = a[1]
+        elif arg in ("-J", "--json"):
+            config['outputm'] = JSONL
+        elif arg in ("-t", "--tsv"):
+            config['outputm'] = TSV
+        elif arg in ("-0", "--null"):
+            config['outputm'] = NUL
+        elif arg in ("-k", "--fields"):
+            try:
+                config['fields'] = parse_fields(a[1], SEARCH_FIELDS)
+            except ValueError as errmsg:
+                error(str(errmsg), stderr=config['stderr'])
         elif arg in ("-d", "--directory"):
             config['esearchdbdir'] = a[1]
             if not exists(config['esearchdbdir']):
@@ -159,14 +206,51 @@ def parseopts(opts, config=None):
                     "' does not exist.", stderr=config['stderr'])
         elif arg in ("-n", "--nocolor"):
             nocolor()
+            config['nocolor'] = True
+        elif arg in ("-C", "--nocache"):
+            config['resultcache'] = False
+        elif arg in ("-T", "--stats"):
+            config['stats'] = Stats()
+        elif arg in ("-P", "--profile"):
+            config['profile'] = a[1]
     if config['fullname'] and config['searchdesc']:
         error("Please use either " + darkgreen("--fullname") +
             " or " + darkgreen("--searchdesc"), stderr=config['stderr'])
+    if config['fields'] and config['outputm'] not in RECORDS:
+        error("Please use " + darkgreen("--fields") + " with " +
+            darkgreen("--json") + ", " + darkgreen("--tsv") + " or " +
+            darkgreen("--null"), stderr=config['stderr'])
     return config
 
 
-def loaddb(config):
-    """Loads the esearchdb"""
+def loaddb(config, generation=None):
+    """Loads the esearchdb, or the generation of it eupdatedb kept"""
+    if generation is None:
+        path = join(config['esearchdbdir'], config['esearchdbfile'])
+    else:
+        path = generation_path(config['esearchdbdir'],
+            config['esearchdbfile'], generation)
+    try:
+        db = Index(path, load_installed(config))
+    except (IOError, OSError):
+        if generation is not None:
+            error("Could not find generation " + str(generation) +
+                " of the esearch-index", stderr=config['stderr'])
+        return loadlegacydb(config)
+    except ValueError:
+        outofdateerror(config['stderr'])
+    if db.dbversion < config['needdbversion']:
+        outofdateerror(config['stderr'])
+    stats = config['stats']
+    if stats is not None and db.blocks is not None:
+        db.blocks.decode = stats.timed("decompress", db.blocks.decode)
+        stats.size("index", len(db.blocks))
+        stats.size("compressed index", db.blocks.compressed)
+    return db
+
+
+def loadlegacydb(config):
+    """Loads an esearchdb.py index written before the binary format"""
     try:
         sys.path.append(config['esearchdbdir'])
         from esearchdb import db
@@ -177,14 +261,14 @@ def loaddb(config):
         raise
     try:
         from esearchdb import dbversion
-        if dbversion < config['needdbversion']:
+        if dbversion < config['legacydbversion']:
             outofdateerror(config['stderr'])
     except ImportError:
         outofdateerror(config['stderr'])
     return db
 
 
-def do_compact(pkg):
+def do_compact(pkg, colored=True):
     prefix0 = " "
     prefix1 = " "
 
@@ -201,17 +285,62 @@ def do_compact(pkg):
     if pkg[2]:
         prefix0 = "M"
 
+    if not colored:
+        return " [%s%s] %s (%s):  %s" % \
+            (prefix0, prefix1, pkg[1], pkg[3], pkg[7])
     return " [%s%s] %s (%s):  %s" % \
             (red(prefix0), color(prefix1), bold(pkg[1]), color(pkg[3]), pkg[7])
 
 
-def do_normal(pkg, verbose):
+def unstable_cpv(pkg):
+    """Returns the cpv of the best unstable ebuild of pkg"""
+    if len(pkg) > UNSTABLE:
+        if not pkg[UNSTABLE]:
+            return ""
+        return pkg[FULLNAME] + "-" + pkg[UNSTABLE]
+    from portage import best, portdb
+    return best(portdb.xmatch("match-all", pkg[FULLNAME]))
+
+
+def verbose_flags(pkgs):
+    """Returns {cpv: (IUSE, final USE flags)} of the best unstable
+    ebuilds of pkgs, looked up in one batch"""
+    # migrate this to the portage public api
+    # when/if it is merged into master
+    from esearch.flag import get_flags_batch
+    cpvs = []
+    iuse = {}
+    for pkg in pkgs:
+        cpv = unstable_cpv(pkg)
+        cpvs.append(cpv)
+        if len(pkg) > IUSE:
+            iuse[cpv] = pkg[IUSE]
+    return get_flags_batch(cpvs, iuse)
+
+
+def do_normal(pkg, verbose, colored=True, flags=None):
     data = []
     if not pkg[4]:
         installed = "[ Not Installed ]"
     else:
         installed = pkg[4]
 
+    if not colored and not verbose:
+        if pkg[2]:
+            masked = " [ Masked ]"
+        else:
+            masked = ""
+        data.append("*  %s%s\n"
+            "      Latest version available: %s\n"
+            "      Latest version installed: %s\n"
+            "      Size of downloaded files: %s\n"
+            "      Homepage:    %s\n"
+            "      Description: %s\n"
+            "      License:     %s\n" %
+            (pkg[1], masked, pkg[3], installed, pkg[5], pkg[6], pkg[7],
+             pkg[8]))
+        return data, False
+
     if pkg[2]:
         masked = red(" [ Masked ]")
     else:
@@ -223,8 +352,10 @@ def do_normal(pkg, verbose):
             darkgreen("Latest version installed:"), installed))
 
     if verbose:
-        mpv = best(portdb.xmatch("match-all", pkg[1]))
-        iuse_split, final_use = get_flags(mpv, final_setting=True)
+        mpv = unstable_cpv(pkg)
+        if flags is None or mpv not in flags:
+            flags = verbose_flags([pkg])
+        iuse_split, final_use = flags[mpv]
         iuse = ""
         use_list = []
         for ebuild_iuse in iuse_split:
@@ -251,40 +382,12 @@ def do_normal(pkg, verbose):
 
 
 def do_own(pkg, own):
-    # %c => category
-    # %n => package name
-    # %p => same as %c/%n
-    # %m => masked
-    # %va => latest version available
-    # %vi => latest version installed
-    # %s => size of downloaded files
-    # %h => homepage
-    # %d => description
-    # %l => license
-
-
-    own = own.replace("%c", pkg[1].split("/")[0])
-    own = own.replace("%n", pkg[0])
-    own = own.replace("%p", pkg[1])
-
-    masked = ""
-    if pkg[2]:
-        masked = "masked"
-    own = own.replace("%m", masked)
-    own = own.replace("%va", pkg[3])
-
-    installed = pkg[4]
-    if not installed:
-        installed = ""
-    own = own.replace("%vi", installed)
-    own = own.replace("%s", pkg[5])
-    own = own.replace("%h", pkg[6])
-    own = own.replace("%d", pkg[7])
-    own = own.replace("%l", pkg[8])
-
-    own = own.replace("\\n", "\n")
-    own = own.replace("\\t", "\t")
-    return own
+    """Returns row pkg in the --own format own, a format string or a
+    Template compiled from one.  See esearch.template for the
+    placeholders."""
+    if not isinstance(own, Template):
+        own = Template(own)
+    return own.render(pkg)
 
 
 def create_regex(config, pattern):
@@ -327,71 +430,209 @@ def searchdb(config, patterns, db=None):
     return output_results(config, regexlist, found)
 
 
-# turns out this is slower :(
-def search1(config, regexlist, db=None):
-    """Test search method that performs
-    multiple reg expr. checks for each pkg
-    """
-    data = {}
-
-    #for regex, pattern, foo, foo, fullname in regexlist:
-    for p in range(len(regexlist)):
-        data[regexlist[p][1]] = []
+def search_list(config, regexlist, db=None):
+    """Searches db for every pattern of regexlist, returns
+    {pattern: [matching rows]}.  The patterns which have to scan the
+    whole index share a single pass over it."""
+    if not isinstance(db, Index):
+        db = list(db)
+    searchdesc = config['searchdesc']
+    columns = {}
 
-    for pkg in db:
-        for regex, pattern, foo, foo, fullname in regexlist:
-            found = False
+    data = {}
+    # [pattern, regex, fullname, rows known to match, rows to look at]
+    # of every pattern, the rows are None for the patterns scanning
+    # the whole index
+    searches = []
+    for regex, pattern, foo, foo, fullname in regexlist:
+        if pattern in data:
+            continue
+        data[pattern] = []
+        if isinstance(db, Index):
+            rows, known = candidate_rows(config, regex, fullname, db)
+        else:
+            rows, known = None, set()
+        searches.append([pattern, regex, fullname, known, rows])
 
-            if config['instonly'] and not pkg[4]:
-                continue
-            elif config['notinst'] and pkg[4]:
-                continue
+    if config['instonly'] or config['notinst']:
+        installed = _column(db, columns, INSTALLED)
+    else:
+        installed = None
+    # the few installed rows are cheaper to pick out than to run the
+    # scanning patterns over every row
+    if config['instonly'] and [search for search in searches
+            if search[4] is None]:
+        universe = [i for i, version in enumerate(installed) if version]
+    else:
+        universe = None
 
-            if  fullname and regex.search(pkg[1]):
-                found = True
-            elif regex.search(pkg[0]):
-                found = True
-            elif config['searchdesc'] and regex.search(pkg[7]):
-                found = True
+    scanning = [search for search in searches if search[4] is None]
+    if len(scanning) > 1 and isinstance(db, Index):
+        # only worth it when decoding the values is the expensive part
+        anyscanning = _combine([search[1] for search in scanning])
+    else:
+        anyscanning = None
+    if anyscanning is not None:
+        # one pass finds the rows any of the scanning patterns may match,
+        # the values it decoded are handed on to the patterns
+        fields = sorted(set(search[2] and FULLNAME or NAME
+            for search in scanning))
+        if searchdesc:
+            fields.append(DESCRIPTION)
+        texts = [_column(db, columns, field) for field in fields]
+        if universe is None:
+            values = enumerate(zip(*texts))
+        else:
+            values = ((i, tuple(text[i] for text in texts))
+                for i in universe)
+        match = anyscanning.search
+        hits = [(i, value) for i, value in values if any(map(match, value))]
+        rows = [i for i, value in hits]
+        decoded = dict((field, [value[n] for i, value in hits])
+            for n, field in enumerate(fields))
+        for search in scanning:
+            search[4] = rows
+            search.append(decoded)
+
+    for search in searches:
+        pattern, regex, fullname, known, rows = search[:5]
+        if fullname:
+            field = FULLNAME
+        else:
+            field = NAME
+        description = None
+        if len(search) > 5:
+            text = search[5][field]
+            description = search[5].get(DESCRIPTION)
+        elif rows is None and universe is None:
+            rows = range(len(db))
+            text = _column(db, columns, field)
+            if searchdesc:
+                description = _column(db, columns, DESCRIPTION)
+        else:
+            if rows is None:
+                rows = universe
+            column = _column(db, columns, field)
+            text = [column[i] for i in rows]
+            if searchdesc:
+                column = _column(db, columns, DESCRIPTION)
+                description = [column[i] for i in rows]
+
+        match = regex.search
+        if description is None:
+            matched = [i for i, value in zip(rows, text)
+                if i in known or match(value)]
+        else:
+            matched = [i for i, value, desc in zip(rows, text, description)
+                if i in known or match(value) or match(desc)]
+        # the installed filters only look at the rows which matched
+        if config['instonly']:
+            matched = [i for i in matched if installed[i]]
+        elif config['notinst']:
+            matched = [i for i in matched if not installed[i]]
+        data[pattern] = [db[i] for i in matched]
 
-            if found:
-                data[pattern].append(pkg)
     return data
 
 
-def search_list(config, regexlist, db=None):
-    """An optimized regular expression list db search"""
-    data = {}
-
-    for regex, pattern, foo, foo, fullname in regexlist:
-        data[pattern] = search(config, regex, fullname, db)
-    return data
+def _column(db, columns, field):
+    """Returns the column holding field of db, an Index or a list of
+    rows, columns caches the columns of lists"""
+    if isinstance(db, Index):
+        return db.column(field)
+    column = columns.get(field)
+    if column is None:
+        column = columns[field] = [pkg[field] for pkg in db]
+    return column
+
+
+def _combine(regexes):
+    """Returns a regular expression matching wherever one of regexes
+    does, or None if there are none or they cannot be joined"""
+    if len(regexes) < 2:
+        return regexes and regexes[0] or None
+    for regex in regexes:
+        # group references would be renumbered by the join
+        if regex.groups or regex.groupindex:
+            return None
+        if regex.flags != regexes[0].flags:
+            return None
+    try:
+        return re.compile("|".join("(?:%s)" % regex.pattern
+            for regex in regexes), regexes[0].flags)
+    except re.error:
+        return None
 
 
 def search(config, regex, fullname, db):
-    """An optimized single regular expression db search"""
-    data = []
+    """Single regular expression db search"""
+    return search_list(config, [[regex, None, "", 0, fullname]], db)[None]
 
-    for pkg in db:
-        found = False
 
+def candidate_rows(config, regex, fullname, db):
+    """Returns the sorted rows of db which may match regex according to
+    the sorted name and trigram indexes, or None if every row has to be
+    checked, and the set of rows known to match without the regex"""
+    if fullname:
+        field = FULLNAME
+    else:
+        field = NAME
+    anchored = anchored_prefix(regex)
+    sortedindex = db.sorted(field)
+    if anchored is not None and sortedindex is not None:
+        prefix, exact, literal = anchored
+        rows = sortedindex.lookup(prefix, exact)
+        if literal:
+            known = set(rows)
+        else:
+            known = set()
+        if not config['searchdesc']:
+            return rows, known
+        # the description can still match anywhere
+        fields = [DESCRIPTION]
+        rows = set(rows)
+    else:
+        fields = [FULLNAME]
+        if config['searchdesc']:
+            fields.append(DESCRIPTION)
+        known = set()
+        rows = set()
+
+    required = required_trigrams(regex)
+    if required is None:
+        return None, known
+    for field in fields:
+        trigrams = db.trigrams(field)
+        if trigrams is None:
+            return None, known
+        rows.update(trigrams.candidates(required))
+    return sorted(rows), known
+
+
+def search_words(config, patterns, db):
+    """Ranked word search, returns the rows using every word of the
+    patterns, best match first"""
+    words = query_words(patterns)
+    if not words:
+        return []
+
+    wordindex = None
+    if isinstance(db, Index):
+        wordindex = db.words()
+        names = db.column(NAME)
+    else:
+        names = [pkg[0] for pkg in db]
+    if wordindex is None:
+        wordindex = ScanWordIndex(db)
+
+    data = []
+    for i in rank(wordindex, words, names):
+        pkg = db[i]
         if config['instonly'] and not pkg[4]:
             continue
         elif config['notinst'] and pkg[4]:
             continue
-
-        if fullname:
-            found = regex.search(pkg[1])
-        else:
-            found = regex.search(pkg[0])
-        if found:
-            data.append(pkg)
-        else:
-            if config['searchdesc']:
-                found = regex.search(pkg[7])
-                if found:
-                    data.append(pkg)
-
+        data.append(pkg)
     return data
 
 
@@ -419,60 +660,79 @@ def filter_excluded(config, found):
 
 
 def output_results(config, regexlist, found):
+    """Writes the found packages of every pattern to stdout as soon as
+    they are rendered"""
     data = {}
     data['ebuilds'] = []
     data['defebuild'] = (0, 0)
-    i = 0
-    for regex, pattern, foo, foo, fullname in regexlist:
-        count = 0
-        data['output'] = []
-        for pkg in found[pattern]:
+    colored = not config['nocolor']
+    write = sys.stdout.write
+    count = 0
+    try:
+        for i, (regex, pattern, foo, foo, fullname) in enumerate(regexlist):
+            # the search is over, the count is known before any output
+            count = len(found[pattern])
             if config['outputm'] in (NORMAL, VERBOSE):
-                newdata, _continue = do_normal(pkg,
-                    config['outputm'] == VERBOSE)
-                data['output'] += newdata
-                if _continue:
-                    continue
-            elif config['outputm'] in (COMPACT, EBUILDS):
-                data['output'].append(do_compact(pkg))
-
-            elif config['outputm'] == OWN:
-                data['output'].append(do_own(pkg, config['outputf']))
-
-            if config['outputm'] == EBUILDS:
-                if count == 0:
-                    searchdef = pkg[0] + "-" + pkg[3]
-                else:
-                    searchdef = ""
-
-                searchEbuilds("%s/%s/" % (config['portdir'], pkg[1]),
-                    True, searchdef, "", config, data)
-                if config['overlay']:
-                    repo_num=1
-                    for repo in config['overlay'].split():
-                        searchEbuilds("%s/%s/" % ( repo, pkg[1]),
-                            False, searchdef,repo_num, config, data)
-                        repo_num += 1
-
-            count += 1
-
-        regexlist[i][2] = "\n".join(data['output'])
-        regexlist[i][3] = count
-        i += 1
-
-    for regex, pattern, output, count, foo in regexlist:
-        if config['outputm'] in (NORMAL, VERBOSE):
-            print("[ Results for search key :", bold(pattern), "]")
-            print("[ Applications found :", bold(str(count)), "]\n")
-            try:
-                print(output, end=' ')
-                print("")
-            except IOError:
-                pass
-        else:
-            print(output)
+                write("[ Results for search key : %s ]\n" % bold(pattern))
+                write("[ Applications found : %s ]\n\n" % bold(str(count)))
 
+            if config['outputm'] == VERBOSE:
+                useflags = verbose_flags(found[pattern])
+            else:
+                useflags = None
+            if config['outputm'] == OWN:
+                own = Template(config['outputf'])
+            elif config['outputm'] in RECORDS:
+                # no separators, every record is complete
+                records = RecordWriter(config['outputm'],
+                    config['fields'] or DEFAULT_FIELDS, write)
+                # several patterns write one stream of records
+                extra = {"pattern": pattern}
+                for pkg in found[pattern]:
+                    records.record(pkg, extra)
+                regexlist[i][3] = count
+                continue
 
+            separator = ""
+            for n, pkg in enumerate(found[pattern]):
+                data['output'] = []
+                if config['outputm'] in (NORMAL, VERBOSE):
+                    newdata, _continue = do_normal(pkg,
+                        config['outputm'] == VERBOSE, colored, useflags)
+                    data['output'] += newdata
+                elif config['outputm'] in (COMPACT, EBUILDS):
+                    data['output'].append(do_compact(pkg, colored))
+
+                elif config['outputm'] == OWN:
+                    data['output'].append(own.render(pkg))
+
+                if config['outputm'] == EBUILDS:
+                    if n == 0:
+                        searchdef = pkg[0] + "-" + pkg[3]
+                    else:
+                        searchdef = ""
+
+                    searchEbuilds("%s/%s/" % (config['portdir'], pkg[1]),
+                        True, searchdef, "", config, data)
+                    if config['overlay']:
+                        repo_num=1
+                        for repo in config['overlay'].split():
+                            searchEbuilds("%s/%s/" % ( repo, pkg[1]),
+                                False, searchdef,repo_num, config, data)
+                            repo_num += 1
+
+                for line in data['output']:
+                    write(separator + line)
+                    separator = "\n"
+
+            if config['outputm'] in (NORMAL, VERBOSE):
+                write(" \n")
+            else:
+                write("\n")
+            regexlist[i][3] = count
+        sys.stdout.flush()
+    except IOError:
+        pass
 
     if config['outputm'] == EBUILDS:
         if config['overlay'] and config['found_in_overlay']:
@@ -492,6 +752,7 @@ def output_results(config, regexlist, found):
                     print(bold("\nShow Ebuild"), " (" + darkgreen(data['defebuild'][0]) + "): ", end=' ')
                 else:
                     print(bold("\nShow Ebuild: "), end=' ')
+                sys.stdout.flush()
                 try:
                     nr = sys.stdin.readline()
                 except KeyboardInterrupt:
@@ -516,22 +777,77 @@ def output_results(config, regexlist, found):
     return True
 
 
+def getopts(args):
+    """Parses the esearch command line arguments args with getopt"""
+    return getopt(args, "hSWFINcveo:Jt0k:d:x:nCTP:",
+        ["help", "searchdesc", "words", "fullname", "instonly", "notinst",
+         "compact", "verbose", "ebuild", "own=", "json", "tsv", "null",
+         "fields=", "directory=", "exclude=", "nocolor", "nocache", "stats",
+         "profile="
+        ])
+
+
+def query(config, patterns, db):
+    """Searches db for patterns and prints the results as config says,
+    returns success"""
+    if config['wordsearch']:
+        pattern = " ".join(patterns)
+        regexlist = [[None, pattern, "", 0, False]]
+    else:
+        regexlist = create_regexlist(config, patterns)
+
+    cache = None
+    found = None
+    if config['resultcache'] and isinstance(db, Index):
+        cache = ResultCache(config['resultcachedir'] or cache_dir(),
+            db.generation, config['resultcachesize'])
+        key = cache.key(config, patterns, db.installed)
+        cached = cache.get(key)
+        if cached is not None:
+            found = dict((pattern, [db[i] for i in numbers])
+                for pattern, numbers in cached.items())
+
+    stats = config['stats']
+    if found is None:
+        if config['wordsearch']:
+            found = {pattern: search_words(config, patterns, db)}
+        else:
+            found = search_list(config, regexlist, db)
+        if stats is not None:
+            stats.mark("search")
+        if config['exclude']:
+            found = filter_excluded(config, found)
+            if stats is not None:
+                stats.mark("exclude")
+        if cache is not None:
+            cache.put(key, dict((pattern, [pkg.number for pkg in rows])
+                for pattern, rows in found.items()))
+    elif stats is not None:
+        stats.mark("cache")
+    success = output_results(config, regexlist, found)
+    if stats is not None:
+        stats.mark("output")
+    return success
+
+
 def main():
     try:
-        opts = getopt(sys.argv[1:], "hSFINcveo:d:x:n",
-            ["help", "searchdesc", "fullname", "instonly", "notinst", "compact",
-             "verbose", "ebuild", "own=", "directory=", "exclude=", "nocolor"
-            ])
+        opts = getopts(sys.argv[1:])
     except GetoptError as errmsg:
         error(str(errmsg) + "(see" + darkgreen("--help") +
             "for all options)" + '\n')
     config = parseopts(opts)
+    profile = None
+    if config['profile']:
+        profile = Profile(config['profile'])
     db = loaddb(config)
-    regexlist = create_regexlist(config, opts[1])
-    found = search_list(config, regexlist, db)
-    if config['exclude']:
-        found = filter_excluded(config, found)
-    success = output_results(config, regexlist, found)
+    if config['stats'] is not None:
+        config['stats'].mark("loaddb")
+    success = query(config, opts[1], db)
+    if profile is not None:
+        profile.stop()
+    if config['stats'] is not None:
+        config['stats'].report(config['stderr'])
 
     # sys.exit() values are opposite T/F
     sys.exit(not success)
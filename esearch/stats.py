@@ -0,0 +1,171 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""Phase timing and profiling of esearch, eupdatedb and esync.
+
+With --stats a run records the wall time of its phases and the peak
+resident set size at the end of each, and prints them to stderr when
+it is done.  Calls which are made many times, like the portdb lookups
+of eupdatedb, are wrapped to add up their number and time.
+
+The modules of esearch import this one before portage, and it does not
+import portage itself, so the time of the imports is measured too.
+With --profile the run is profiled with cProfile and the data written
+to a file for pstats or a viewer like snakeviz.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+from time import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# when the first module of esearch was imported
+IMPORTED = time()
+
+
+def process_start():
+    """Returns the time the process started, None where /proc does not
+    tell it"""
+    try:
+        with open("/proc/self/stat") as statfile:
+            # the name of the program may hold spaces and parentheses
+            fields = statfile.read().rsplit(")", 1)[1].split()
+        started = int(fields[19]) / float(os.sysconf("SC_CLK_TCK"))
+        with open("/proc/stat") as statfile:
+            for line in statfile:
+                if line.startswith("btime "):
+                    return int(line.split()[1]) + started
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def peak_rss(children=False):
+    """Returns the peak resident set size of the process in kB, None if
+    it is not known.  With children that of the largest child process
+    which ended and was waited for, like the workers of eupdatedb."""
+    if resource is None:
+        return None
+    if children:
+        who = resource.RUSAGE_CHILDREN
+    else:
+        who = resource.RUSAGE_SELF
+    peak = resource.getrusage(who).ru_maxrss
+    if sys.platform == "darwin":
+        # in bytes there
+        peak //= 1024
+    return peak
+
+
+class Stats(object):
+    """The phases of a run and the calls timed during it"""
+
+    def __init__(self, process=True):
+        """process: whether the run is the whole process, then its start
+        up and the imports are the first phases"""
+        # [name, seconds, peak rss, peak rss of the children]
+        self.phases = []
+        # name => [calls, seconds]
+        self.calls = {}
+        # name => bytes
+        self.sizes = {}
+        self._last = time()
+        if process:
+            started = process_start()
+            if started is not None and started < IMPORTED:
+                self.phases.append(["startup", IMPORTED - started, None,
+                    None])
+            self._last = IMPORTED
+            self.mark("imports")
+
+    def mark(self, name):
+        """Ends the phase name, which began at the end of the last one"""
+        now = time()
+        self.phases.append([name, now - self._last, peak_rss(),
+            peak_rss(children=True)])
+        self._last = now
+
+    def size(self, name, nbytes):
+        """Records the size of name, like that of a file"""
+        self.sizes[name] = nbytes
+
+    def timed(self, name, function):
+        """Returns function wrapped to add its calls to name"""
+        calls = self.calls.setdefault(name, [0, 0.0])
+
+        def timed_call(*args, **kwargs):
+            start = time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                calls[0] += 1
+                calls[1] += time() - start
+        timed_call.__wrapped__ = function
+        return timed_call
+
+    def add_calls(self, calls):
+        """Adds the calls another process timed"""
+        for name, (count, seconds) in calls.items():
+            mine = self.calls.setdefault(name, [0, 0.0])
+            mine[0] += count
+            mine[1] += seconds
+
+    def take_calls(self):
+        """Returns the calls timed since the last take_calls() and
+        starts counting from zero"""
+        calls = dict((name, tuple(counts))
+            for name, counts in self.calls.items())
+        for counts in self.calls.values():
+            counts[0], counts[1] = 0, 0.0
+        return calls
+
+    def report(self, stream=None):
+        """Prints the phases and calls to stream, stderr by default"""
+        if stream is None:
+            stream = sys.stderr
+        total = sum(phase[1] for phase in self.phases)
+        print("%-24s %10s %12s %12s" % ("phase", "seconds", "peak RSS kB",
+            "children kB"), file=stream)
+        for name, seconds, rss, children in self.phases:
+            print("%-24s %10.4f %12s %12s" % (name, seconds,
+                rss is None and "-" or rss,
+                not children and "-" or children), file=stream)
+        print("%-24s %10.4f" % ("total", total), file=stream)
+        if self.calls:
+            print("", file=stream)
+            print("%-24s %10s %10s" % ("calls", "count", "seconds"),
+                file=stream)
+            for name in sorted(self.calls):
+                count, seconds = self.calls[name]
+                print("%-24s %10d %10.4f" % (name, count, seconds),
+                    file=stream)
+        if self.sizes:
+            print("", file=stream)
+            print("%-24s %10s" % ("size", "kB"), file=stream)
+            for name in sorted(self.sizes):
+                print("%-24s %10d" % (name, self.sizes[name] // 1024),
+                    file=stream)
+
+
+class Profile(object):
+    """cProfile of a run, written to path by stop()"""
+
+    def __init__(self, path):
+        import cProfile
+        self.path = path
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self.profile.dump_stats(self.path)
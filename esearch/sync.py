@@ -17,23 +17,32 @@ from __future__ import print_function
 import os
 import sys
 from getopt import getopt, GetoptError
+from time import localtime, strftime
 
 #sys.path.insert(0, "/usr/lib/portage/pym")
 
+# before portage, to time its import
+from esearch.stats import Profile, Stats
+
+# before esearch.common, which takes EPREFIX from it
 import portage
 try:
-    from portage.output import red, green, bold, darkgreen, nocolor, xtermTitle
+    from portage.output import xtermTitle
 except ImportError:
     print("Critical: portage imports failed!")
     sys.exit(1)
 
-from esearch.common import (CONFIG, SyncOpts, error, outofdateerror,
-    logfile_sync, laymanlog_sync, tmp_path, tmp_prefix, version,
-    EPREFIX, COMPACT, warn)
-from esearch.update import updatedb
-from esearch.search import searchdb
-
-sys.path.append(tmp_path)
+from esearch.color import red, green, bold, darkgreen, nocolor
+from esearch.common import (CONFIG, SyncOpts, error,
+    logfile_sync, laymanlog_sync, version,
+    EPREFIX, warn, JSONL, TSV, NUL, RECORDS)
+from esearch.update import compression, updatedb
+from esearch.search import do_compact, loaddb
+from esearch.diff import changes, ADDED, VERSION_CHANGED, REMOVED
+from esearch.history import append_sync, parse_since, syncs_since
+from esearch.index import VERSION
+from esearch.records import (DEFAULT_CHANGE_FIELDS, SYNC_FIELDS, RecordWriter,
+    parse_fields)
 
 
 def usage():
@@ -68,6 +77,32 @@ def usage():
     print("")
     print(darkgreen("  --nospinner") + ", " + darkgreen("-s"))
     print("    Don't display the remaining index count")
+    print("")
+    print(darkgreen("  --since=") + "sync" + ", " + darkgreen("-S"), "sync")
+    print("    Don't sync, show what changed since sync number 'sync' or since")
+    print("    a date like 2010-03-21 or '2010-03-21 13:05'")
+    print("")
+    print(darkgreen("  --json") + ", " + darkgreen("-J"))
+    print("    Print a JSON object per change, one per line")
+    print("")
+    print(darkgreen("  --tsv") + ", " + darkgreen("-t"))
+    print("    Print a line of tab separated values per change")
+    print("")
+    print(darkgreen("  --null") + ", " + darkgreen("-0"))
+    print("    Print the values of each change followed by a NUL each")
+    print("")
+    print(darkgreen("  --fields=") + "list" + ", " + darkgreen("-k"), "list")
+    print("    Comma separated fields of --json, --tsv and --null, see manpage")
+    print("")
+    print(darkgreen("  --compress=") + "codec" + ", " + darkgreen("-z"),
+        "codec")
+    print("    Have eupdatedb compress the index with zlib or lzma")
+    print("")
+    print(darkgreen("  --stats") + ", " + darkgreen("-T"))
+    print("    Print the time and peak memory use of each phase to stderr")
+    print("")
+    print(darkgreen("  --profile=") + "file" + ", " + darkgreen("-P"), "file")
+    print("    Write cProfile data of the run to file")
 
     sys.exit(0)
 
@@ -102,48 +137,61 @@ def parseopts(opts, config=None):
             config['verbose'] = 1
         elif arg in ("-s", "--nospinner"):
             config['eupdatedb_extra_options'] = "-q"
+        elif arg in ("-S", "--since"):
+            try:
+                config['since'] = parse_since(a[1])
+            except ValueError as errmsg:
+                error(str(errmsg))
+        elif arg in ("-J", "--json"):
+            config['outputm'] = JSONL
+        elif arg in ("-t", "--tsv"):
+            config['outputm'] = TSV
+        elif arg in ("-0", "--null"):
+            config['outputm'] = NUL
+        elif arg in ("-k", "--fields"):
+            try:
+                config['fields'] = parse_fields(a[1], SYNC_FIELDS)
+            except ValueError as errmsg:
+                error(str(errmsg))
+        elif arg in ("-z", "--compress"):
+            config['compress'] = compression(a[1], config)
+        elif arg in ("-T", "--stats"):
+            config['stats'] = Stats()
+        elif arg in ("-P", "--profile"):
+            config['profile'] = a[1]
+    if config['fields'] and config['outputm'] not in RECORDS:
+        error("Please use " + darkgreen("--fields") + " with " +
+            darkgreen("--json") + ", " + darkgreen("--tsv") + " or " +
+            darkgreen("--null"))
+    if config['outputm'] in RECORDS:
+        # stdout is left to the records
+        config['stdout'] = sys.stderr
+        config['showtitles'] = False
     return config
 
 
+def change_records(config):
+    """Returns the RecordWriter of the changes, None unless esync writes
+    records"""
+    if config['outputm'] not in RECORDS:
+        return None
+    return RecordWriter(config['outputm'],
+        config['fields'] or DEFAULT_CHANGE_FIELDS, sys.stdout.write)
+
+
 def emsg(msg, config):
     if config['showtitles']:
         xtermTitle(msg)
     if config['verbose'] == -1:
         return
-    print(green(" *"), msg)
+    print(green(" *"), msg, file=config['stdout'])
 
 
-def gettree(tree, config):
+def gettree(tree, config, generation=None):
     emsg("Importing " + tree + " portage tree", config)
-    if '.pyc' in config['esearchdbfile']:
-        ext = ".pyc"
-    else:
-        ext = ".py"
-    try:
-        target = tmp_prefix + tree + "tree" + ext
-        if os.path.exists(target):
-            os.unlink(target)
-        os.symlink(os.path.join(config['esearchdbdir'], config['esearchdbfile']), target)
-    except OSError as e:
-        if e.errno != 17:
-            error(str(e), fatal=True)
-    try:
-        if tree == "old":
-            from esyncoldtree import db
-            try:
-                from esyncoldtree import dbversion
-                if dbversion < config['needdbversion']:
-                    outofdateerror()
-            except ImportError:
-                outofdateerror()
-        else:
-            from esyncnewtree import db
-    except ImportError:
-        error("Could not find " + tree +
-            "esearch-index. Please run " +
-            green("eupdatedb") + " as root first", fatal=True)
-    os.unlink(target)
-    return db
+    # eupdatedb replaces the index by renaming a new file over it,
+    # so the old tree stays readable after the update
+    return loaddb(config, generation)
 
 
 def layman_sync(config):
@@ -165,7 +213,7 @@ def layman_sync(config):
         if errorcode != 0:
             error("'" + config['layman-cmd'] + "' failed, see " +
                 laymanlog_sync + " for errors", fatal=False)
-            print("")
+            print("", file=config['stdout'])
             return False, []
         return True, []
     # run the api to sync
@@ -193,13 +241,18 @@ def layman_sync(config):
 def sync(config):
 
     warnings = None
+    stats = config['stats']
 
     tree_old = gettree("old", config)
+    if stats is not None:
+        stats.mark("old index")
 
     if config['layman-sync']:
         success, warnings = layman_sync(config)
         if not success:
             return False
+        if stats is not None:
+            stats.mark("layman")
 
     if config['verbose'] >= 0:
         emsg("Doing '" + config['syncprogram'] + "' now", config)
@@ -215,93 +268,141 @@ def sync(config):
         error("'" + config['syncprogram'] + "' failed, see " +
             logfile_sync + " for errors", fatal=False)
         return False
+    if stats is not None:
+        stats.mark("sync")
 
     if config['verbose'] >= 0:
-        print("")
+        print("", file=config['stdout'])
         emsg("Doing 'eupdatedb' now", config)
-        print("")
+        print("", file=config['stdout'])
 
     # run eupdatedb natively
     success = updatedb(config)
     if not success:
-        print("")
+        print("", file=config['stdout'])
         error("running updatedb failed", fatal=False)
         return False
 
     if config['verbose'] >= 0:
-        print("")
-
-    # uncomment the sys.path line below if you comment out the
-    # emerge sync code section for testing
-    #sys.path.insert(0, config['esearchdbdir'])
-    from esearchdb import db as tree_new
-
-    emsg("Preparing databases", config)
-
-    new = {}
-    for pkg in tree_new:
-        new[pkg[1]] = pkg[3]
+        print("", file=config['stdout'])
 
-    old = {}
-    for pkg in tree_old:
-        old[pkg[1]] = pkg[3]
+    # the generation eupdatedb published, even if another one
+    # replaced it since
+    tree_new = gettree("new", config, config['generation'])
+    if stats is not None:
+        stats.mark("new index")
 
     emsg("Searching for changes", config)
-    print("")
-
-    # alphabetic sort
-    items = list(new.items())
-    items.sort(key=lambda x: x[0])
+    print("", file=config['stdout'])
 
-    old_keys = list(old.keys())
-
-    # update our config to run searchdb
-    config['outputm'] = COMPACT
-    config['fullname'] = True
-
-    #individual pkgname search method
+    # both indexes are in cat/pkg order, a single merge of them finds
+    # the changed packages
     haspkgs = False
-    for (pkg, version) in items:
-        if (pkg not in old_keys) or (old[pkg] != new[pkg]):
-            success = searchdb(config, ["^" + pkg + "$"], tree_new)
-            haspkgs = True
+    found = []
+    records = change_records(config)
+    try:
+        for kinds, fullname, oldpkg, newpkg in changes(tree_old, tree_new):
+            change = (kinds, fullname, oldpkg and oldpkg[VERSION] or "",
+                newpkg and newpkg[VERSION] or "")
+            if records is not None:
+                records.record(newpkg or oldpkg, {"change": kinds,
+                    "oldversion": change[2], "version": change[3]})
+                haspkgs = True
+            elif ADDED in kinds or VERSION_CHANGED in kinds:
+                print(do_compact(newpkg, not config["nocolor"]))
+                haspkgs = True
+            found.append(change)
+    except ValueError as errmsg:
+        error(str(errmsg) + ", please run " + green("eupdatedb"),
+            fatal=False)
+        return False
+    if stats is not None:
+        stats.mark("diff")
+
+    try:
+        number = append_sync(os.path.join(config['esearchdbdir'],
+            config['historyfile']), found)
+        if config['verbose'] == 1:
+            print("", file=config['stdout'])
+            emsg("Recorded " + str(len(found)) + " changes as sync " +
+                str(number), config)
+    except (IOError, OSError):
+        warn("Could not record the changes in the sync history",
+            stdout=config['stdout'])
+    if stats is not None:
+        stats.mark("history")
 
     if not haspkgs:
         emsg("No updates found", config)
-        success = True
+    success = True
 
     if warnings:
         print("", file=config['stdout'])
         for ovl, result in warnings:
-            warn(result)
+            warn(result, stdout=config['stdout'])
 
-    # multiple pkgname search method
-    # build our re search list
-    #pkg_patterns = []
-    #for (pkg, version) in items:
-        #if (pkg not in old_keys) or (old[pkg] != new[pkg]):
-            #pkg_patterns.append("^" + pkg + "$")
+    return success
 
-    #if pkg_patterns == []:
-        #emsg("No updates found", config)
-        #success = True
-    #else:
-        #success = searchdb(config, pkg_patterns, tree_new)
 
-    return success
+def show_history(config):
+    """Prints the changes the sync history recorded since config['since']"""
+    number, when = config['since']
+    syncs = syncs_since(os.path.join(config['esearchdbdir'],
+        config['historyfile']), number, when)
+    if config['stats'] is not None:
+        config['stats'].mark("history")
+    if not syncs:
+        emsg("No changes recorded since then", config)
+        return True
+    records = change_records(config)
+    if records is not None:
+        # only the history is read, the index fields are empty
+        for sync in syncs:
+            for kinds, fullname, oldversion, newversion in sync["changes"]:
+                records.record(None, {"sync": sync["sync"],
+                    "time": sync["time"], "change": kinds,
+                    "fullname": fullname, "oldversion": oldversion,
+                    "version": newversion})
+        return True
+    for sync in syncs:
+        print(bold("Sync " + str(sync["sync"])), "(" +
+            strftime("%Y-%m-%d %H:%M", localtime(sync["time"])) + "):",
+            str(len(sync["changes"])), "changes")
+        for kinds, fullname, oldversion, newversion in sync["changes"]:
+            if ADDED in kinds:
+                versions = newversion
+            elif REMOVED in kinds or oldversion == newversion:
+                versions = oldversion
+            else:
+                versions = oldversion + " -> " + newversion
+            print(" [%s] %s (%s)" % (green(kinds.ljust(2)), bold(fullname),
+                darkgreen(versions)))
+        print("")
+    return True
 
 
 def main():
     try:
-        opts = getopt(sys.argv[1:], "hwdlmnqvs",
+        opts = getopt(sys.argv[1:], "hwdlmnqvsS:Jt0k:z:TP:",
             ["help", "webrsync", "delta-webrsync", "layman-sync",
             "nocolor", "verbose", "metadata", "nospinner",
-            "quiet"])
+            "quiet", "since=", "json", "tsv", "null", "fields=", "compress=",
+            "stats", "profile="])
     except GetoptError as errmsg:
         error(str(errmsg) + "(see" + darkgreen("--help") +
             "for all options)" + '\n')
     config = parseopts(opts)
-    success = sync(config)
+    profile = None
+    if config['profile']:
+        profile = Profile(config['profile'])
+    if config['since'] is not None:
+        success = show_history(config)
+    else:
+        success = sync(config)
+    if profile is not None:
+        profile.stop()
+    if config['stats'] is not None:
+        config['stats'].report(sys.stderr)
     # sys.exit() values are opposite T/F
     sys.exit(not success)
 
@@ -0,0 +1,106 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""The format strings of esearch --own.
+
+A format is parsed once into a template of literal text and fields,
+each field a function of the row.  A row is then rendered by calling
+the fields and joining the pieces, however long the format is.  The
+text a field inserts is never parsed again, so a description holding
+"%s" or "\\n" comes out as it is.
+"""
+
+import re
+from operator import itemgetter
+
+from esearch.index import (NAME, FULLNAME, MASKED, VERSION, INSTALLED, SIZE,
+    HOMEPAGE, DESCRIPTION, LICENSE, IUSE, UNSTABLE)
+
+
+def _column(field):
+    """Returns the function reading column field of a row, "" for rows
+    of an older index without it"""
+    def read(pkg):
+        if len(pkg) > field:
+            return pkg[field]
+        return ""
+    return read
+
+
+def _category(pkg):
+    return pkg[FULLNAME].split("/", 1)[0]
+
+
+def _installed(pkg):
+    return pkg[INSTALLED] or ""
+
+
+def _masked(pkg):
+    if pkg[MASKED]:
+        return "masked"
+    return ""
+
+
+# placeholder => function of the row, only the columns a format uses
+# are read from the index
+FIELDS = {
+    "%c": _category,
+    "%n": itemgetter(NAME),
+    "%p": itemgetter(FULLNAME),
+    "%m": _masked,
+    "%va": itemgetter(VERSION),
+    "%vi": _installed,
+    "%vu": _column(UNSTABLE),
+    "%s": itemgetter(SIZE),
+    "%h": itemgetter(HOMEPAGE),
+    "%d": itemgetter(DESCRIPTION),
+    "%l": itemgetter(LICENSE),
+    "%u": _column(IUSE),
+}
+
+# the text the escapes and %% stand for
+LITERALS = {
+    "\\n": "\n",
+    "\\t": "\t",
+    "%%": "%",
+}
+
+# the longest placeholders first, %va before a %v which is none
+_TOKEN = re.compile("|".join(re.escape(token) for token in
+    sorted(list(FIELDS) + list(LITERALS), key=len, reverse=True)))
+
+
+class Template(object):
+    """A compiled --own format"""
+
+    def __init__(self, own):
+        self.own = own
+        parts = []
+        fields = []
+        literal = []
+        start = 0
+        for match in _TOKEN.finditer(own):
+            literal.append(own[start:match.start()])
+            token = match.group()
+            if token in LITERALS:
+                literal.append(LITERALS[token])
+            else:
+                parts.append("".join(literal))
+                literal = []
+                fields.append((len(parts), FIELDS[token]))
+                parts.append("")
+            start = match.end()
+        literal.append(own[start:])
+        parts.append("".join(literal))
+        self.parts = parts
+        self.fields = fields
+
+    def render(self, pkg):
+        """Returns the format filled in with the fields of row pkg"""
+        parts = self.parts[:]
+        for i, field in self.fields:
+            parts[i] = field(pkg)
+        return "".join(parts)
@@ -0,0 +1,182 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""Trigram posting lists used to narrow down regular expression searches.
+
+eupdatedb stores, for every lower cased ascii trigram, the sorted list
+of rows whose full name (or description) contains it.  For a search the
+literal strings a pattern requires are pulled out of the parsed regular
+expression, their posting lists are intersected and only the remaining
+candidate rows are matched against the real regular expression.
+"""
+
+from array import array
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+from esearch.binary import (COUNT, OFFSET_PAIR, UINT32, pack_uint32,
+    unpack_from, unpack_uint32)
+
+
+# non ascii characters which re.IGNORECASE matches to ascii letters,
+# folded so a trigram lookup never misses a row the regex would match
+_FOLD = {0x130: u"i", 0x131: u"i", 0x17f: u"s", 0x212a: u"k"}
+
+try:
+    _unichr = unichr
+except NameError:
+    # Python 3
+    _unichr = chr
+
+# stop intersecting once this few candidates are left, the regex
+# check of the remaining rows is cheaper than decoding more postings
+_ENOUGH = 32
+
+
+def fold(text):
+    """Case folds text the way re.IGNORECASE compares ascii letters.
+    Byte strings, which portage and sys.argv give on Python 2, are
+    decoded first, only unicode.translate() takes the fold table."""
+    if isinstance(text, bytes):
+        text = text.decode("utf_8", "replace")
+    return text.translate(_FOLD).lower()
+
+
+def trigrams(text):
+    """Returns the set of ascii trigrams in the folded text"""
+    text = fold(text)
+    found = set()
+    for i in range(len(text) - 2):
+        trigram = text[i:i + 3]
+        if max(trigram) < u"\x80":
+            found.add(trigram)
+    return found
+
+
+def pack_trigrams(values):
+    """Builds the posting list section for a column of strings"""
+    postings = {}
+    for row, value in enumerate(values):
+        for trigram in trigrams(value or u""):
+            postings.setdefault(trigram, []).append(row)
+
+    keys = sorted(postings)
+    offsets = [0]
+    rows = []
+    for key in keys:
+        rows.extend(postings[key])
+        offsets.append(len(rows))
+    keydata = u"".join(keys).encode("ascii")
+    keydata += b"\0" * (-len(keydata) % 4)
+    return (COUNT.pack(len(keys)) + keydata + pack_uint32(offsets) +
+        pack_uint32(rows))
+
+
+class TrigramIndex(object):
+    """The posting lists of one column, read from the mmap'ed index"""
+
+    def __init__(self, buf, offset):
+        self._buf = buf
+        (self._nkeys,) = unpack_from(COUNT, buf, offset)
+        self._keys = offset + COUNT.size
+        self._offsets = self._keys + 3 * self._nkeys + (-3 * self._nkeys % 4)
+        self._rows = self._offsets + 4 * (self._nkeys + 1)
+
+    def _find(self, key):
+        buf, keys = self._buf, self._keys
+        lo, hi = 0, self._nkeys
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if buf[keys + 3 * mid:keys + 3 * mid + 3] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._nkeys and buf[keys + 3 * lo:keys + 3 * lo + 3] == key:
+            return lo
+        return -1
+
+    def lookup(self, trigram):
+        """Returns the sorted rows containing trigram"""
+        n = self._find(trigram.encode("ascii"))
+        if n == -1:
+            return array(UINT32)
+        start, end = unpack_from(OFFSET_PAIR, self._buf,
+            self._offsets + 4 * n)
+        return unpack_uint32(self._buf, self._rows + 4 * start, end - start)
+
+    def candidates(self, alternatives):
+        """Returns the set of rows which may match, given the trigrams
+        returned by required_trigrams()"""
+        found = set()
+        for required in alternatives:
+            postings = sorted((self.lookup(trigram) for trigram in required),
+                key=len)
+            rows = set(postings[0])
+            for posting in postings[1:]:
+                if len(rows) <= _ENOUGH:
+                    break
+                rows.intersection_update(posting)
+            found.update(rows)
+        return found
+
+
+def _literals(parsed):
+    """Returns a list of alternatives for the parsed pattern, each a list
+    of literal strings every match of that alternative contains"""
+    items = list(parsed)
+    if len(items) == 1:
+        op, av = items[0]
+        if op is sre_parse.BRANCH:
+            alternatives = []
+            for branch in av[1]:
+                alternatives.extend(_literals(branch))
+            return alternatives
+        if op is sre_parse.SUBPATTERN:
+            return _literals(av[-1])
+
+    literals = []
+    run = []
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            run.append(_unichr(av))
+            continue
+        literals.append(u"".join(run))
+        run = []
+        if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and \
+                av[0] >= 1 and len(av[2]) == 1 and \
+                av[2][0][0] is sre_parse.LITERAL:
+            # x+ ends the literal before it and starts the one after it
+            char = _unichr(av[2][0][1])
+            literals[-1] += char
+            run = [char]
+        elif op is sre_parse.SUBPATTERN:
+            alternatives = _literals(av[-1])
+            if len(alternatives) == 1:
+                literals.extend(alternatives[0])
+    literals.append(u"".join(run))
+    return [literals]
+
+
+def required_trigrams(regex):
+    """Returns a list of alternative trigram sets, at least one of which
+    every row matched by regex contains, or None if the pattern has no
+    usable literals"""
+    try:
+        parsed = sre_parse.parse(regex.pattern, regex.flags)
+    except Exception:
+        return None
+    alternatives = []
+    for literals in _literals(parsed):
+        required = set()
+        for literal in literals:
+            required.update(trigrams(literal))
+        if not required:
+            return None
+        alternatives.append(required)
+    return alternatives
@@ -11,12 +11,17 @@ from __future__ import print_function
 from time import time
 start = time()
 
+# before portage, to time its import
+from esearch.stats import Profile, Stats
+
 import os
 import sys
-from os import stat, unlink, environ, open, O_EXCL, O_CREAT, O_WRONLY
+from os import stat, unlink, environ, listdir, rename
 from os.path import exists
-from shutil import copyfile
 from getopt import getopt, GetoptError
+from hashlib import md5
+import json
+from multiprocessing import Pool
 
 import io
 
@@ -24,16 +29,23 @@ import io
 # commented out so it can run from the git checkout
 #sys.path.insert(0, "/usr/lib/esearch")
 
+# before esearch.common, which takes EPREFIX from it
 import portage
 try:
-    from portage.output import yellow, darkgreen, green, bold, nocolor
     from portage.manifest import Manifest
     from portage.exception import PortageException
+    from portage.const import USER_CONFIG_PATH, VDB_PATH
 except ImportError:
     print("Critical: portage imports failed!")
     sys.exit(1)
 
+from esearch.color import yellow, darkgreen, green, bold, nocolor
 from esearch.common import version, CONFIG, pkg_version, error
+from esearch.compress import BlockWriter, CODECS
+from esearch.flag import FlagFilter
+from esearch.index import Index, FULLNAME, FINGERPRINT_SIZE, write_index
+from esearch.publish import generations, lock, new_file, publish
+from esearch.vdb import installed_versions, vdb_fingerprint, write_installed
 
 
 
@@ -45,6 +57,16 @@ if sys.hexversion >= 0x3000000:
 else:
     _unicode = unicode
 
+# the FetchSizeCache of the running eupdatedb
+FETCHSIZES = None
+
+# the Stats of the running eupdatedb with --stats
+STATS = None
+
+# drops the arch and USE_EXPAND_HIDDEN flags from IUSE before it is
+# stored, created on first use so the workers each build their own
+IUSEFILTER = None
+
 
 def usage():
     print("eupdatedb (%s) - Update the search-index for esearch" % version)
@@ -63,13 +85,38 @@ def usage():
     print(darkgreen("  --directory=") + "dir, " + darkgreen("-d") + " dir")
     print("    Load esearch index from dir")
     print("")
+    print(darkgreen("  --full") + ", " + darkgreen("-f"))
+    print("    Rebuild every row instead of only those of changed packages")
+    print("")
+    print(darkgreen("  --jobs=") + "N, " + darkgreen("-j") + " N")
+    print("    Index changed packages in N processes")
+    print("")
+    print(darkgreen("  --generations=") + "N, " + darkgreen("-g") + " N")
+    print("    Keep the last N indexes written, 2 by default")
+    print("")
+    print(darkgreen("  --compress=") + "codec, " + darkgreen("-z") +
+        " codec")
+    print("    Write the index compressed with zlib or lzma")
+    print("")
+    print(darkgreen("  --homepage-words") + ", " + darkgreen("-H"))
+    print("    Add the words of homepages to the index for esearch --words")
+    print("")
     print(darkgreen("  --nocolor") + ", " + darkgreen("-n"))
     print("    Don't use ANSI codes for colored output")
+    print("")
+    print(darkgreen("  --stats") + ", " + darkgreen("-T"))
+    print("    Print the time and peak memory use of each phase and the time")
+    print("    spent in portage lookups to stderr")
+    print("")
+    print(darkgreen("  --profile=") + "file" + ", " + darkgreen("-P"), "file")
+    print("    Write cProfile data of the run to file")
 
     sys.exit(0)
 
-def duration(start):
-    d = int(round(time() - start))
+def duration(start, end=None):
+    if end is None:
+        end = time()
+    d = int(round(end - start))
     if d >= 60:
         d = str(d // 60) + " minute(s) and " + str(d % 60) + " second(s)"
     else:
@@ -77,11 +124,80 @@ def duration(start):
     return d
 
 
+class FetchSizeCache(object):
+    """The fetch sizes of earlier runs, keyed by cpv and a hash of the
+    package's Manifest and SRC_URI"""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        # the entries looked up or added, passed back by worker processes
+        self.touched = {}
+        self._used = set()
+        try:
+            with io.open(path, encoding="utf_8") as cachefile:
+                self.entries = json.load(cachefile)
+        except (IOError, OSError, ValueError):
+            pass
+
+    def get(self, cpv, key):
+        self._used.add(cpv)
+        entry = self.entries.get(cpv)
+        if entry is not None and entry[0] == key:
+            self.touched[cpv] = entry
+            return entry[1]
+        return None
+
+    def set(self, cpv, key, size):
+        self._used.add(cpv)
+        self.entries[cpv] = self.touched[cpv] = [key, size]
+
+    def keep(self, cpv):
+        """Marks cpv as still in the tree, although it was not looked up"""
+        self._used.add(cpv)
+
+    def update(self, touched):
+        """Adds the entries a worker process touched"""
+        for cpv, entry in touched.items():
+            self.set(cpv, entry[0], entry[1])
+
+    def save(self):
+        """Writes the cache, without the cpvs no longer in the tree"""
+        entries = dict((cpv, entry) for cpv, entry in self.entries.items()
+            if cpv in self._used)
+        try:
+            with io.open(self.path + ".new", "w",
+                    encoding="utf_8") as cachefile:
+                cachefile.write(_unicode(json.dumps(entries, sort_keys=True)))
+            rename(self.path + ".new", self.path)
+        except (IOError, OSError):
+            pass
+
+
+def manifest_key(pkg, pkgdir):
+    """Returns the hash of the Manifest and SRC_URI the size of pkg's
+    distfiles is computed from"""
+    digest = md5()
+    try:
+        with io.open(os.path.join(pkgdir, "Manifest"), "rb") as manifest:
+            digest.update(manifest.read())
+    except (IOError, OSError):
+        pass
+    digest.update(portage.portdb.aux_get(pkg, ["SRC_URI"])[0]
+        .encode("utf_8"))
+    return digest.hexdigest()
+
+
 def getfetchsize(pkg):
     # from /usr/bin/emerge
     try:
         myebuild = portage.portdb.findname(pkg)
         pkgdir = os.path.dirname(myebuild)
+        if FETCHSIZES is not None:
+            key = manifest_key(pkg, pkgdir)
+            mysum = FETCHSIZES.get(pkg, key)
+            if mysum is not None:
+                return mysum
         mf = Manifest(pkgdir, portage.settings["DISTDIR"])
         if hasattr(portage.portdb, "getFetchMap"):
             fetchlist = portage.portdb.getFetchMap(pkg)
@@ -96,11 +212,243 @@ def getfetchsize(pkg):
             mystr = mystr[:mycount] + "," + mystr[mycount:]
         mysum = mystr + " kB"
 
+        if FETCHSIZES is not None:
+            FETCHSIZES.set(pkg, key, mysum)
         return mysum
     except (PortageException, KeyError):
         return "[no/bad digest]"
 
 
+def _update_stats(digest, path, recursive=False):
+    """Adds the names, sizes and mtimes of the files below path"""
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            try:
+                st = stat(os.path.join(root, name))
+            except OSError:
+                continue
+            digest.update(("%s/%s %d %r\n" % (root, name, st.st_size,
+                st.st_mtime)).encode("utf_8"))
+        if not recursive:
+            break
+
+
+def tree_fingerprint():
+    """Returns a fingerprint of the settings and profiles which every
+    row depends on, when it changes all rows have to be rebuilt"""
+    settings = portage.settings
+    digest = md5()
+    for key in ("ACCEPT_KEYWORDS", "ACCEPT_LICENSE", "ARCH"):
+        digest.update(("%s=%s\n" % (key, settings.get(key, "")))
+            .encode("utf_8"))
+    for path in getattr(settings, "profiles", ()):
+        _update_stats(digest, path)
+    for tree in portage.portdb.porttrees:
+        _update_stats(digest, os.path.join(tree, "profiles"))
+    _update_stats(digest, os.path.join(
+        settings.get("PORTAGE_CONFIGROOT", "/"), USER_CONFIG_PATH),
+        recursive=True)
+    return digest.hexdigest()
+
+
+def fingerprint(pkg):
+    """Returns a fingerprint of the ebuilds, Manifest and metadata cache
+    entries the row of pkg is built from"""
+    digest = md5()
+    cat = pkg.split("/")[0]
+    for tree in portage.portdb.porttrees:
+        pkgdir = os.path.join(tree, pkg)
+        try:
+            files = sorted(listdir(pkgdir))
+        except OSError:
+            continue
+        for name in files:
+            if name.endswith(".ebuild"):
+                paths = [os.path.join(pkgdir, name)] + [
+                    os.path.join(tree, "metadata", cache, cat, name[:-7])
+                    for cache in ("md5-cache", "cache")]
+            elif name == "Manifest":
+                paths = [os.path.join(pkgdir, name)]
+            else:
+                continue
+            for path in paths:
+                try:
+                    st = stat(path)
+                except OSError:
+                    continue
+                digest.update(("%s %d %r\n" % (path, st.st_size,
+                    st.st_mtime)).encode("utf_8"))
+    return digest.digest()[:FINGERPRINT_SIZE]
+
+
+def previous_index(config, treefp):
+    """Returns the current index and {cat/pkg: row number}, if its rows
+    can be reused for the packages which did not change"""
+    try:
+        db = Index(os.path.join(config['esearchdbdir'],
+            config['esearchdbfile']))
+    except (IOError, OSError, ValueError):
+        return None, {}
+    if db.dbversion != config['needdbversion'] or \
+            db.meta.get("tree") != treefp or \
+            (len(db) and db.fingerprint(0) is None):
+        return None, {}
+    return db, dict((pkg, i) for i, pkg in enumerate(db.column(FULLNAME)))
+
+
+def iuse_filter():
+    """Returns the FlagFilter for the IUSE of the index"""
+    global IUSEFILTER
+    if IUSEFILTER is None:
+        IUSEFILTER = FlagFilter(
+            portage.settings["USE_EXPAND_HIDDEN"].split(),
+            portage.settings["PORTAGE_ARCHLIST"].split())
+    return IUSEFILTER
+
+
+def index_package(pkg):
+    """Returns the index row of pkg, None if it has no ebuilds"""
+    masked = False
+    homepage, description, _license = "", "", ""
+    iuse = ""
+
+    # the best unstable ebuild, whose USE flags esearch --verbose shows
+    unstable = portage.best(portage.portdb.xmatch("match-all", pkg))
+    if not unstable:
+        return None
+    pkgv = portage.portdb.xmatch("bestmatch-visible", pkg)
+    if not pkgv:
+        pkgv = unstable
+        masked = True
+
+    if len(pkgv) > 1:
+        try:
+            homepage, description, _license = portage.portdb.aux_get(
+                pkgv, ["HOMEPAGE", "DESCRIPTION", "LICENSE"])
+        except KeyError:
+            pass
+        try:
+            iuse = portage.portdb.aux_get(unstable, ["IUSE"])[0]
+        except KeyError:
+            pass
+        else:
+            iuse = " ".join(iuse_filter().filter(iuse.split()))
+
+    if len(pkgv) > 1 and STATS is not None:
+        filesize = STATS.timed("getfetchsize", getfetchsize)(pkgv)
+    elif len(pkgv) > 1:
+        filesize = getfetchsize(pkgv)
+    else:
+        filesize = '0'
+
+    pkgname = pkg.split("/")[1]
+
+    # the installed version is joined in from the installed overlay
+    return (pkgname, pkg, masked, pkg_version(pkgv), False,
+        filesize, homepage, description, _license, iuse,
+        pkg_version(unstable))
+
+
+def time_calls(stats):
+    """Adds the portdb lookups of this process to stats"""
+    global STATS
+    STATS = stats
+    portdb = portage.portdb
+    portdb.xmatch = stats.timed("xmatch", portdb.xmatch)
+    portdb.aux_get = stats.timed("aux_get", portdb.aux_get)
+
+
+def untime_calls():
+    global STATS
+    STATS = None
+    for name in ("xmatch", "aux_get"):
+        portage.portdb.__dict__.pop(name, None)
+
+
+def _init_worker(fetchsizes, timed):
+    """Gives each worker process its own portdb.  The globals are only
+    inherited where workers are forked, elsewhere the fetch size cache is
+    loaded from path fetchsizes again, and timed tells whether to time
+    the calls for --stats."""
+    global FETCHSIZES
+    if FETCHSIZES is None:
+        FETCHSIZES = FetchSizeCache(fetchsizes)
+    settings = portage.config(clone=portage.settings)
+    portage.portdb = portage.portdbapi(mysettings=settings)
+    if timed:
+        if STATS is None:
+            stats = Stats(process=False)
+        else:
+            stats = STATS
+            # those of the parent are counted there
+            stats.take_calls()
+        time_calls(stats)
+
+
+def index_category(pkgs):
+    """Worker process job: returns the category of pkgs, their
+    (pkg, row) pairs, the start and end time, the new fetch sizes and
+    the timed calls"""
+    cattime = time()
+    FETCHSIZES.touched = {}
+    rows = [(pkg, index_package(pkg)) for pkg in pkgs]
+    calls = STATS is not None and STATS.take_calls() or {}
+    return (pkgs[0].split("/")[0], rows, cattime, time(), FETCHSIZES.touched,
+        calls)
+
+
+def index_parallel(config, pkgs):
+    """Indexes pkgs in config['jobs'] worker processes, one category at a
+    time, and returns {pkg: row}"""
+    shards = []
+    for pkg in pkgs:
+        curcat = pkg.split("/")[0]
+        if not shards or shards[-1][0].split("/")[0] != curcat:
+            shards.append([])
+        shards[-1].append(pkg)
+
+    if not config['verbose']:
+        config['stdout'].write(green(" * ") + "indexing: ")
+        config['stdout'].flush()
+        nrchars = 0
+    togo = len(pkgs)
+
+    built = {}
+    pool = Pool(config['jobs'], _init_worker,
+        (FETCHSIZES.path, STATS is not None))
+    try:
+        for curcat, rows, cattime, catend, fetchsizes, calls in \
+                pool.imap_unordered(index_category, shards):
+            built.update(rows)
+            FETCHSIZES.update(fetchsizes)
+            if STATS is not None:
+                STATS.add_calls(calls)
+            togo -= len(rows)
+            if not config['verbose']:
+                s = str(togo) + " ebuilds to go"
+                config['stdout'].write((nrchars * "\b \b") + s)
+                config['stdout'].flush()
+                nrchars = len(s)
+            elif config['verbose'] == 1:
+                print(bold(" * " + curcat) + ":", duration(cattime, catend),
+                    file=config['stdout'])
+        pool.close()
+    finally:
+        # also stops the workers on errors and KeyboardInterrupt
+        pool.terminate()
+        pool.join()
+    return built
+
+
+def compression(codec, config):
+    """Returns codec if eupdatedb can compress the index with it"""
+    if codec not in CODECS:
+        error("'" + darkgreen(codec) + "' is not one of the compressions " +
+            "available: " + ", ".join(sorted(CODECS)), stderr=config['stderr'])
+    return codec
+
+
 def parseopts(opts, config=None):
     if config is None:
         config = CONFIG
@@ -118,18 +466,61 @@ def parseopts(opts, config=None):
             if not exists(config['esearchdbdir']):
                 error("directory '" + darkgreen(config['esearchdbdir']) +
                     "'", "does not exist.", stderr=config['stderr'])
+        elif arg in ("-f", "--full"):
+            config['fullrebuild'] = True
+        elif arg in ("-j", "--jobs"):
+            try:
+                config['jobs'] = int(a[1])
+            except ValueError:
+                config['jobs'] = 0
+            if config['jobs'] < 1:
+                error("'" + darkgreen(a[1]) + "' is not a valid number of jobs",
+                    stderr=config['stderr'])
+        elif arg in ("-g", "--generations"):
+            try:
+                config['generations'] = int(a[1])
+            except ValueError:
+                config['generations'] = 0
+            if config['generations'] < 1:
+                error("'" + darkgreen(a[1]) + "' is not a valid number of " +
+                    "generations", stderr=config['stderr'])
+        elif arg in ("-z", "--compress"):
+            config['compress'] = compression(a[1], config)
+        elif arg in ("-H", "--homepage-words"):
+            config['homepagewords'] = True
         elif arg in ("-n", "--nocolor"):
             nocolor()
+        elif arg in ("-T", "--stats"):
+            config['stats'] = Stats()
+        elif arg in ("-P", "--profile"):
+            config['profile'] = a[1]
     return config
 
 
 def updatedb(config=None):
-
     if not os.access(config['esearchdbdir'], os.W_OK):
         print(yellow("Warning:"),
             "You do not have sufficient permissions to save the index file in:",
             green(config['esearchdbdir']), file=config['stderr'])
         return False
+    lockfile = lock(os.path.join(config['esearchdbdir'], config['lockfile']))
+    if lockfile is None:
+        error("there is another eupdatedb running already.", fatal=False)
+        return False
+
+    stats = config['stats']
+    if stats is not None:
+        time_calls(stats)
+    try:
+        return _updatedb(config, stats)
+    finally:
+        if stats is not None:
+            untime_calls()
+        lockfile.close()
+
+
+def _updatedb(config, stats):
+    global FETCHSIZES
 
     if config['verbose'] != -1 and "ACCEPT_KEYWORDS" in environ:
         print(yellow("Warning:"),
@@ -139,108 +530,147 @@ def updatedb(config=None):
 
     ebuilds = portage.portdb.cp_all()
     numebuilds = len(ebuilds)
+    if stats is not None:
+        stats.mark("cp_all")
 
-    if exists(config['tmpfile']):
-        error("there is probably another eupdatedb running already.\n" +
-            "         If you're sure there is no other process, remove " +
-            config['tmpfile'], fatal=False)
-        return False
+    numbers = generations(config['esearchdbdir'], config['esearchdbfile'])
+    number = numbers and numbers[-1] + 1 or 1
     try:
-        dbfd = open(config['tmpfile'], O_CREAT | O_EXCL | O_WRONLY, 0o600)
+        dbfd, tmppath = new_file(config['esearchdbdir'],
+            config['esearchdbfile'])
     except OSError:
         error("Failed to open temporary file.", fatal=False)
         return False
 
 
-    dbfile = io.open(dbfd, mode="w", encoding="utf_8")
-    dbfile.write(_unicode("# -*- coding: UTF8 -*-\n"))
-
-    dbfile.write(_unicode("dbversion = ") +
-        _unicode(config['needdbversion']) +
-        _unicode("\n"))
-    dbfile.write(_unicode("db = (\n"))
-
-    if not config['verbose']:
-        config['stdout'].write(green(" * ") + "indexing: ")
-        config['stdout'].flush()
-        nr = 0
-        nrchars = 0
-    elif config['verbose'] == 1:
-        lastcat = False
-
-    cattime = time()
+    dbfile = io.open(dbfd, mode="wb")
     try:
-        for pkg in ebuilds:
-            masked = False
-
-            if not config['verbose']:
-                nr += 1
-                s = str(numebuilds - nr) + " ebuilds to go"
-                config['stdout'].write((nrchars * "\b \b") + s)
-                config['stdout'].flush()
-                nrchars = len(s)
-
-            pkgv = portage.portdb.xmatch("bestmatch-visible", pkg)
-            if not pkgv:
-                pkgv = portage.best(portage.portdb.xmatch("match-all", pkg))
-                if not pkgv:
+        rows = []
+        fingerprints = []
+        reused = 0
+
+        FETCHSIZES = FetchSizeCache(os.path.join(config['esearchdbdir'],
+            config['fetchsizefile']))
+        if stats is not None:
+            stats.mark("fetch size cache")
+        vdb = os.path.join(portage.settings["EROOT"], VDB_PATH)
+        vdbfp = vdb_fingerprint(vdb)
+        installed = installed_versions(VARTREE)
+        if stats is not None:
+            stats.mark("vartree")
+        treefp = tree_fingerprint()
+        if config['fullrebuild']:
+            previous, previous_rows = None, {}
+        else:
+            previous, previous_rows = previous_index(config, treefp)
+
+        pkgfps = dict((pkg, fingerprint(pkg)) for pkg in ebuilds)
+        if stats is not None:
+            stats.mark("fingerprints")
+
+        def reusable(pkg):
+            i = previous_rows.get(pkg)
+            return i is not None and previous.fingerprint(i) == pkgfps[pkg]
+
+        # index_parallel() reports its own progress
+        built = None
+        serial = config['jobs'] == 1
+        if serial and not config['verbose']:
+            config['stdout'].write(green(" * ") + "indexing: ")
+            config['stdout'].flush()
+            nr = 0
+            nrchars = 0
+        elif serial and config['verbose'] == 1:
+            lastcat = False
+
+        cattime = time()
+        try:
+            if not serial:
+                built = index_parallel(config,
+                    [pkg for pkg in ebuilds if not reusable(pkg)])
+
+            for pkg in ebuilds:
+                if serial and not config['verbose']:
+                    nr += 1
+                    s = str(numebuilds - nr) + " ebuilds to go"
+                    config['stdout'].write((nrchars * "\b \b") + s)
+                    config['stdout'].flush()
+                    nrchars = len(s)
+
+                if reusable(pkg):
+                    row = tuple(previous[previous_rows[pkg]])
+                    FETCHSIZES.keep(pkg + "-" + row[3])
+                    reused += 1
+                elif built is not None:
+                    row = built[pkg]
+                else:
+                    row = index_package(pkg)
+                if row is None:
                     continue
-                masked = True
-
-            if len(pkgv) > 1:
-                try:
-                    homepage, description, _license = portage.portdb.aux_get(
-                        pkgv, ["HOMEPAGE", "DESCRIPTION", "LICENSE"])
-                except KeyError:
-                    homepage, description, _license = "", "", ""
-                    pass
-
-            if len(pkgv) > 1:
-                filesize = getfetchsize(pkgv)
-            else:
-                filesize = '0'
 
-            (curcat, pkgname) = pkg.split("/")
+                curcat = pkg.split("/")[0]
 
-            if config['verbose'] == 1 and curcat != lastcat:
-                if lastcat != False:
-                    print(duration(cattime), file=config['stdout'])
-                print(bold(" * " + curcat) + ":", end=' ', file=config['stdout'])
-                cattime = time()
-                lastcat = curcat
+                if serial and config['verbose'] == 1 and curcat != lastcat:
+                    if lastcat != False:
+                        print(duration(cattime), file=config['stdout'])
+                    print(bold(" * " + curcat) + ":", end=' ', file=config['stdout'])
+                    cattime = time()
+                    lastcat = curcat
 
-            installed = pkg_version(VARTREE.dep_bestmatch(pkg))
+                rows.append(row)
+                fingerprints.append(pkgfps[pkg])
 
-            dbfile.write(
-                repr((pkgname, pkg, masked, pkg_version(pkgv), installed,
-                    filesize, homepage, description, _license)) + ",\n")
+        except KeyboardInterrupt:
+            dbfile.close()
+            unlink(tmppath)
+            print("", file=config['stdout'])
+            return False
 
-    except KeyboardInterrupt:
-        dbfile.close()
-        unlink(config['tmpfile'])
         print("", file=config['stdout'])
-        return False
-
-    print("", file=config['stdout'])
-
-    dbfile.write(_unicode(")"))
-    dbfile.close()
-
-    copyfile(config['tmpfile'],
-        os.path.join(config['esearchdbdir'], config['esearchdbfile']))
-    unlink(config['tmpfile'])
-
-    sys.path.insert(0, config['esearchdbdir'])
-    import esearchdb # import the file, to generate pyc
-
-    if exists(
-        os.path.join(config['esearchdbdir'], config['esearchdbfile']) + "c"):
-        config['esearchdbfile'] += "c"
+        if stats is not None:
+            stats.mark("index")
+
+        writer = dbfile
+        if config['compress']:
+            writer = BlockWriter(dbfile, config['compress'])
+        write_index(writer, rows, config['needdbversion'],
+            config['homepagewords'], fingerprints,
+            {"tree": treefp, "generation": str(number)})
+        if config['compress']:
+            writer.finish()
+            if stats is not None:
+                stats.size("index", writer.size)
+                stats.size("compressed index", writer.compressed)
+        dbfile.flush()
+        os.fsync(dbfile.fileno())
+        dbfile.close()
+        if stats is not None:
+            stats.mark("write")
+
+        # replace the index with a rename, so running searches which
+        # have the old one mmap'ed keep a consistent view of it
+        publish(tmppath, config['esearchdbdir'], config['esearchdbfile'],
+            number, config['generations'])
+    except BaseException:
+        # an error or a signal while writing must not leave the half
+        # written generation behind
+        dbfile.close()
+        if os.path.exists(tmppath):
+            unlink(tmppath)
+        raise
+    config['generation'] = number
+    FETCHSIZES.save()
+    write_installed(os.path.join(config['esearchdbdir'],
+        config['installedfile']), vdb, vdbfp, installed)
+    if stats is not None:
+        stats.mark("publish")
 
     print(green(" *"), "esearch-index generated in", duration(start),
         file=config['stdout'])
     print(green(" *"), "indexed", bold(str(numebuilds)), "ebuilds",
         file=config['stdout'])
+    print(green(" *"), "reused", bold(str(reused)), "rows, rebuilt",
+        bold(str(len(rows) - reused)), file=config['stdout'])
     print(green(" *"), "size of esearch-index:",
         bold(str(int(stat(
             os.path.join(config['esearchdbdir'], config['esearchdbfile'])
@@ -250,14 +680,22 @@ def updatedb(config=None):
 
 def main():
     try:
-        opts = getopt(sys.argv[1:], "hvqd:n",
-            ["help", "verbose", "quiet", "directory=", "nocolor"]
+        opts = getopt(sys.argv[1:], "hvqd:fj:g:z:HnTP:",
+            ["help", "verbose", "quiet", "directory=", "full", "jobs=",
+            "generations=", "compress=", "homepage-words", "nocolor", "stats", "profile="]
             )
     except GetoptError as errmsg:
         error(str(errmsg) + "(see" + darkgreen("--help") +
             "for all options)" + '\n')
     config = parseopts(opts)
+    profile = None
+    if config['profile']:
+        profile = Profile(config['profile'])
     success = updatedb(config)
+    if profile is not None:
+        profile.stop()
+    if config['stats'] is not None:
+        config['stats'].report(config['stderr'])
     # sys.exit() values are opposite T/F
     sys.exit(not success)
 
@@ -0,0 +1,139 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""Installed package lookups for the esearch index.
+
+Instead of asking the vartree for the best installed version of every
+package in the tree, the installed package database is enumerated once
+into a cat/pkg -> version map.  vdb_fingerprint() tells whether the
+database changed since that map was built.
+
+The map is kept out of the tree index, in a small overlay file next to
+it, so the installed versions are current after every emerge without
+running eupdatedb.  load_installed() rebuilds the overlay whenever the
+fingerprint of the installed package database changed.  Users who
+cannot write the overlay next to the index keep one of their own in
+their cache directory, until the shared one is current again.
+"""
+
+import io
+import json
+import os
+import sys
+from hashlib import md5
+
+from esearch.cache import cache_dir
+from esearch.common import pkg_version, warn
+
+
+def installed_versions(vartree):
+    """Returns {cat/pkg: best installed version} from a single pass over
+    the installed package database of vartree"""
+    from portage import best, catpkgsplit
+
+    cpvs = {}
+    for cpv in vartree.dbapi.cpv_all():
+        parts = catpkgsplit(cpv)
+        if parts is None:
+            continue
+        cpvs.setdefault(parts[0] + "/" + parts[1], []).append(cpv)
+    return dict((cp, pkg_version(best(matches)))
+        for cp, matches in cpvs.items())
+
+
+def vdb_fingerprint(vdb):
+    """Returns a fingerprint of the installed package database at vdb.
+    Merging or unmerging a package changes the mtime of its category
+    directory, so only the top two levels are looked at."""
+    digest = md5()
+    try:
+        categories = sorted(os.listdir(vdb))
+    except OSError:
+        return ""
+    for name in [""] + categories:
+        try:
+            st = os.stat(os.path.join(vdb, name))
+        except OSError:
+            continue
+        digest.update(("%s %r\n" % (name, st.st_mtime)).encode("utf_8"))
+    return digest.hexdigest()
+
+
+def write_installed(path, vdb, fingerprint, installed):
+    """Writes the installed overlay, returns the IOError or OSError
+    which kept it from being written, None if it was"""
+    overlay = {"vdb": vdb, "fingerprint": fingerprint, "installed": installed}
+    try:
+        with io.open(path + ".new", "w", encoding="utf_8") as overlayfile:
+            overlayfile.write(u"" + json.dumps(overlay, sort_keys=True))
+        os.rename(path + ".new", path)
+    except (IOError, OSError) as failure:
+        return failure
+    return None
+
+
+def user_installed_path(config):
+    """Returns the path of the user's own installed overlay for the index
+    in config['esearchdbdir']"""
+    dbdir = os.path.abspath(config['esearchdbdir'])
+    return os.path.join(cache_dir(), "%s.%s" % (config['installedfile'],
+        md5(dbdir.encode("utf_8")).hexdigest()[:8]))
+
+
+def update_installed(path, userpath=None, stderr=None):
+    """Rebuilds the installed overlay at path from the vartree and
+    returns its map.  If path cannot be written the overlay is written
+    to userpath instead, saying so the first time."""
+    import portage
+    from portage.const import VDB_PATH
+
+    vdb = os.path.join(portage.settings["EROOT"], VDB_PATH)
+    # taken first, a merge running during the scan triggers another one
+    fingerprint = vdb_fingerprint(vdb)
+    installed = installed_versions(portage.vartree())
+    failure = write_installed(path, vdb, fingerprint, installed)
+    if failure is None or userpath is None:
+        return installed
+    if not os.path.exists(userpath):
+        warn("Could not update %s (%s), keeping the installed packages "
+            "in %s until it is updated" % (path,
+            getattr(failure, "strerror", None) or failure, userpath),
+            stdout=stderr or sys.stderr)
+    try:
+        if not os.path.isdir(os.path.dirname(userpath)):
+            os.makedirs(os.path.dirname(userpath))
+    except OSError:
+        pass
+    write_installed(userpath, vdb, fingerprint, installed)
+    return installed
+
+
+def _current_overlay(path):
+    """Returns the map of the installed overlay at path, None if there is
+    none or the installed package database changed since"""
+    try:
+        with io.open(path, encoding="utf_8") as overlayfile:
+            overlay = json.load(overlayfile)
+    except (IOError, OSError, ValueError):
+        return None
+    if vdb_fingerprint(overlay["vdb"]) != overlay["fingerprint"]:
+        return None
+    return overlay["installed"]
+
+
+def load_installed(config):
+    """Returns {cat/pkg: installed version} from the installed overlay,
+    or else the user's own, updated first if the installed package
+    database changed"""
+    path = os.path.join(config['esearchdbdir'], config['installedfile'])
+    installed = _current_overlay(path)
+    if installed is not None:
+        return installed
+    userpath = user_installed_path(config)
+    installed = _current_overlay(userpath)
+    if installed is not None:
+        return installed
+    return update_installed(path, userpath, config['stderr'])
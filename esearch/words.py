@@ -0,0 +1,196 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""Ranked word search over package names and descriptions.
+
+eupdatedb stores an inverted index mapping every word of the package
+names and descriptions (and, optionally, homepages) to the rows using
+it, with the number of times it is used.  A word query intersects the
+posting lists of its words and orders the result by relevance: packages
+with a query word in their name come first, the rest by a TF-IDF score.
+"""
+
+import re
+from math import log
+
+from esearch.binary import (COUNT, OFFSET_PAIR, pack_strings, pack_uint32,
+    read_string, unpack_from, unpack_uint32)
+from esearch.trigram import fold
+
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+# a trailing '*' in a query word matches every word it is a prefix of
+WILDCARD = "*"
+
+
+def tokenize(text):
+    """Returns the folded words of text, ignoring single characters"""
+    return [word for word in _WORD.findall(fold(text or u""))
+        if len(word) > 1]
+
+
+def _documents(names, descriptions, homepages=None):
+    """Yields the words each row is indexed by"""
+    for row, name in enumerate(names):
+        words = tokenize(name) + tokenize(descriptions[row])
+        if homepages is not None:
+            words += tokenize(homepages[row])
+        yield row, words
+
+
+def pack_words(names, descriptions, homepages=None):
+    """Builds the word index section for the given columns"""
+    postings = {}
+    for row, words in _documents(names, descriptions, homepages):
+        counts = {}
+        for word in words:
+            counts[word] = counts.get(word, 0) + 1
+        for word, count in counts.items():
+            postings.setdefault(word, []).append((row, min(count, 255)))
+
+    keys = sorted(postings)
+    offsets = [0]
+    rows = []
+    frequencies = bytearray()
+    for key in keys:
+        for row, count in postings[key]:
+            rows.append(row)
+            frequencies.append(count)
+        offsets.append(len(rows))
+    return (COUNT.pack(len(keys)) + COUNT.pack(len(names)) +
+        pack_strings(keys) + pack_uint32(offsets) + pack_uint32(rows) +
+        bytes(frequencies))
+
+
+class WordIndex(object):
+    """The inverted word index, read from the mmap'ed index"""
+
+    def __init__(self, buf, offset):
+        self._buf = buf
+        (self._nkeys,) = unpack_from(COUNT, buf, offset)
+        (self.nrows,) = unpack_from(COUNT, buf, offset + COUNT.size)
+        self._keys = offset + 2 * COUNT.size
+        keysize = unpack_from(OFFSET_PAIR, buf,
+            self._keys + 4 * (self._nkeys - 1))[1] if self._nkeys else 0
+        self._offsets = self._keys + 4 * (self._nkeys + 1) + keysize
+        self._rows = self._offsets + 4 * (self._nkeys + 1)
+        total = unpack_from(OFFSET_PAIR, buf, self._offsets +
+            4 * (self._nkeys - 1))[1] if self._nkeys else 0
+        self._frequencies = self._rows + 4 * total
+
+    def _key(self, n):
+        return read_string(self._buf, self._keys, self._nkeys, n)
+
+    def _first(self, word):
+        lo, hi = 0, self._nkeys
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < word:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _posting(self, n):
+        start, end = unpack_from(OFFSET_PAIR, self._buf,
+            self._offsets + 4 * n)
+        rows = unpack_uint32(self._buf, self._rows + 4 * start, end - start)
+        frequencies = bytearray(self._buf[self._frequencies + start:
+            self._frequencies + end])
+        return rows, frequencies
+
+    def lookup(self, word):
+        """Returns {row: frequency} for word, a trailing '*' matches
+        every word starting with it"""
+        prefix = word.endswith(WILDCARD)
+        word = word.rstrip(WILDCARD)
+        found = {}
+        n = self._first(word)
+        while n < self._nkeys:
+            key = self._key(n)
+            if key != word and not (prefix and key.startswith(word)):
+                break
+            rows, frequencies = self._posting(n)
+            for row, frequency in zip(rows, frequencies):
+                found[row] = found.get(row, 0) + frequency
+            n += 1
+        return found
+
+
+class ScanWordIndex(object):
+    """Answers the same lookups as WordIndex by tokenizing the rows of an
+    index without a word index, such as the old esearchdb.py"""
+
+    def __init__(self, db):
+        self._postings = {}
+        self.nrows = 0
+        for row, pkg in enumerate(db):
+            self.nrows += 1
+            for word in tokenize(pkg[0]) + tokenize(pkg[7]):
+                counts = self._postings.setdefault(word, {})
+                counts[row] = counts.get(row, 0) + 1
+
+    def lookup(self, word):
+        prefix = word.endswith(WILDCARD)
+        word = word.rstrip(WILDCARD)
+        found = {}
+        for key, counts in self._postings.items():
+            if key == word or (prefix and key.startswith(word)):
+                for row, frequency in counts.items():
+                    found[row] = found.get(row, 0) + frequency
+        return found
+
+
+def query_words(patterns):
+    """Splits the search patterns into folded query words"""
+    words = []
+    for pattern in patterns:
+        for word in fold(pattern).split():
+            prefix = word.endswith(WILDCARD)
+            before = len(words)
+            for token in tokenize(word):
+                words.append(token)
+            # not if the word had no tokens, the wildcard would end up
+            # on the one before
+            if prefix and len(words) > before:
+                words[-1] += WILDCARD
+    return words
+
+
+def rank(wordindex, words, names):
+    """Returns the rows containing every query word, best match first
+
+    @param wordindex: a WordIndex or ScanWordIndex
+    @type words: list
+    @param words: the query words from query_words()
+    @param names: the name column, a row whose name contains one of the
+        words ranks before every row which does not
+    """
+    rows = None
+    scores = {}
+    for word in words:
+        found = wordindex.lookup(word)
+        if not found:
+            return []
+        idf = log(float(wordindex.nrows + 1) / len(found))
+        if rows is None:
+            rows = set(found)
+        else:
+            rows.intersection_update(found)
+        for row, frequency in found.items():
+            scores[row] = scores.get(row, 0.0) + frequency * idf
+    if not rows:
+        return []
+
+    plain = [word.rstrip(WILDCARD) for word in words]
+
+    def key(row):
+        name = fold(names[row])
+        hits = len([word for word in plain if word in name])
+        return (-hits, -scores[row], row)
+
+    return sorted(rows, key=key)
@@ -0,0 +1,129 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""What the tests share: random rows of an index, and the plain scans
+over a list of them which the fast paths of esearch have to agree with.
+
+The tests run under Python 2 and 3, with the portage stand-in of the
+benchmarks (see bench/portage) where eupdatedb or esync is run.
+"""
+
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+TESTSDIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(TESTSDIR)
+# the stand-in portage first, the esearch of this checkout after it
+for path in (ROOT, os.path.join(ROOT, "bench")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from esearch.index import Index, write_index, NAME, FULLNAME, DESCRIPTION
+
+
+# some upper case and non-ASCII text, for the case folding of the
+# trigrams, the sorted names and the words
+WORDS = (u"lib", u"gtk", u"python", u"perl", u"xml", u"net", u"tool",
+    u"qt", u"kde", u"ssl", u"x11", u"media", u"font", u"util", u"sound",
+    u"video", u"db", u"sql", u"fs", u"sys", u"term", u"go", u"vim",
+    u"Qt", u"GTK", u"Lib", u"libxml", u"xmllib", u"py", u"pyqt")
+TEXT_WORDS = WORDS + (u"caf\xe9", u"\xdcber", u"na\xefve", u"stra\xdfe",
+    u"\u0440\u0443\u0441", u"(C)", u"%s", u"\\n", u"tab\there",
+    u"line\nbreak", u"back\\slash", u"cr\rlf")
+CATEGORIES = (u"app-misc", u"dev-libs", u"dev-python", u"media-sound",
+    u"net-misc", u"sys-apps", u"x11-libs")
+LICENSES = (u"GPL-2", u"MIT", u"BSD", u"LGPL-2.1")
+
+# patterns of every kind the fast paths tell apart: literals, anchored
+# prefixes and exact names, alternatives, repeats, classes and patterns
+# which have no literal to narrow the rows down with
+PATTERNS = (u"lib", u"xml", u"pyqt", u"qt", u"^lib", u"^lib$", u"^LIB",
+    u"^py", u"^python$", u"^x11", u"ml$", u"lib|sql", u"^(lib|db)",
+    u"gtk+", u"l+ib", u"x?ml", u"pyt.on", u"[qg]t", u"^[a-d]", u".*",
+    u"^", u"dev-libs/", u"/lib", u"^app-misc/lib", u"misc/.*ss",
+    u"net-.*/s", u"caf\xe9", u"\xfcber", u"STRA\xdfE", u"sound|video",
+    u"(?:gtk|qt)-", u"\\d", u"^go$", u"nomatchatall", u"^zz")
+
+
+def make_rows(count, seed=0, words=WORDS):
+    """Returns count random rows in cat/pkg order, as eupdatedb writes
+    them"""
+    rnd = random.Random(seed)
+    rows = {}
+    while len(rows) < count:
+        name = u"-".join(rnd.sample(words, rnd.randint(1, 3)))
+        if rnd.random() < 0.3:
+            name += u"%d" % rnd.randint(0, 99)
+        fullname = rnd.choice(CATEGORIES) + u"/" + name
+        rows[fullname] = (name, fullname, rnd.random() < 0.1,
+            u"%d.%d" % (rnd.randint(0, 9), rnd.randint(0, 20)), False,
+            u"%d kB" % rnd.randint(1, 50000),
+            u"https://%s.example.org/" % name,
+            u" ".join(rnd.sample(TEXT_WORDS, rnd.randint(2, 8))),
+            rnd.choice(LICENSES),
+            u" ".join(rnd.sample((u"X", u"gtk", u"qt5", u"ssl", u"doc"),
+                rnd.randint(0, 3))),
+            u"")
+    return [rows[fullname] for fullname in sorted(rows)]
+
+
+def write(path, rows, compress=None, **kwargs):
+    """Writes rows to the index at path, compressed with codec compress
+    if it is set"""
+    with io.open(path, "wb") as dbfile:
+        writer = dbfile
+        if compress:
+            from esearch.compress import BlockWriter
+            writer = BlockWriter(dbfile, compress, **kwargs.pop(
+                "compress_options", {}))
+        write_index(writer, rows, 1, **kwargs)
+        if compress:
+            writer.finish()
+
+
+def scan(rows, regex, fullname=False, searchdesc=False):
+    """Returns the numbers of the rows regex matches, looking at every
+    row as the old esearch did"""
+    field = fullname and FULLNAME or NAME
+    return [i for i, row in enumerate(rows) if regex.search(row[field]) or
+        (searchdesc and regex.search(row[DESCRIPTION]))]
+
+
+class TempDirTestCase(unittest.TestCase):
+    """A test case with a temporary directory, self.tmpdir"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="esearch-test-")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def path(self, *names):
+        return os.path.join(self.tmpdir, *names)
+
+
+class IndexTestCase(TempDirTestCase):
+    """A test case with ROWS random rows written to an index"""
+
+    ROWS = 600
+    SEED = 0
+    HOMEPAGE_WORDS = False
+
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.rows = make_rows(self.ROWS, self.SEED)
+        write(self.path("esearchdb.idx"), self.rows,
+            homepage_words=self.HOMEPAGE_WORDS)
+        self.db = Index(self.path("esearchdb.idx"))
+
+    def tearDown(self):
+        self.db = None
+        TempDirTestCase.tearDown(self)
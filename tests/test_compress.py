@@ -0,0 +1,99 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""Round trips through the block compressed index"""
+
+import io
+import random
+import unittest
+
+from support import IndexTestCase, PATTERNS, write
+
+from esearch.common import CONFIG
+from esearch.compress import CODECS, HEADER, BlockFile, BlockWriter
+from esearch.index import Index, NAME, DESCRIPTION
+from esearch.search import create_regexlist, search_list
+
+
+class BlocksTest(unittest.TestCase):
+
+    def compress(self, data, codec, blocksize, chunk):
+        buf = io.BytesIO()
+        writer = BlockWriter(buf, codec, blocksize)
+        for start in range(0, len(data), chunk):
+            writer.write(data[start:start + chunk])
+        writer.finish()
+        self.assertEqual(writer.size, len(data))
+        self.assertEqual(writer.compressed, len(buf.getvalue()))
+        return buf.getvalue()
+
+    def test_slices(self):
+        rnd = random.Random(0)
+        data = bytes(bytearray(rnd.randint(0, 40) for i in range(20000)))
+        for codec in sorted(CODECS):
+            for blocksize, chunk in ((1000, 1), (1000, 999), (1000, 1000),
+                    (1000, 3001), (4096, 20000), (30000, 7)):
+                blocks = BlockFile(self.compress(data, codec, blocksize,
+                    chunk))
+                self.assertEqual(len(blocks), len(data))
+                self.assertEqual(blocks[:], data)
+                for n in range(200):
+                    start = rnd.randint(0, len(data))
+                    stop = start + rnd.choice((0, 1, 4, 999, 1000, 1001,
+                        5000))
+                    self.assertEqual(blocks[start:stop], data[start:stop])
+
+    def test_empty(self):
+        for codec in CODECS:
+            blocks = BlockFile(self.compress(b"", codec, 1000, 1))
+            self.assertEqual(len(blocks), 0)
+            self.assertEqual(blocks[0:10], b"")
+
+    def test_errors(self):
+        data = self.compress(b"x" * 5000, "zlib", 1000, 5000)
+        self.assertRaises(ValueError, BlockFile, data[:HEADER.size])
+        self.assertRaises(ValueError, BlockFile, data[:-1])
+        self.assertRaises(ValueError, BlockFile, data[:4] + b"none" +
+            data[8:])
+
+
+class CompressedIndexTest(IndexTestCase):
+
+    def check(self, codec):
+        write(self.path("compressed.idx"), self.rows, codec,
+            compress_options={"blocksize": 4096})
+        db = Index(self.path("compressed.idx"))
+        self.assertNotEqual(db.blocks, None)
+        self.assertEqual(db.blocks.codec, codec)
+        self.assertEqual(list(db), self.rows)
+        self.assertEqual([db.field(i, DESCRIPTION) for i in range(len(db))],
+            [row[DESCRIPTION] for row in self.rows])
+        self.assertEqual(db.sorted(NAME).lookup(u"lib"),
+            self.db.sorted(NAME).lookup(u"lib"))
+        self.assertEqual(db.words().lookup(u"lib*"),
+            self.db.words().lookup(u"lib*"))
+
+        # every search finds what it finds in the uncompressed index
+        for options in ({}, {"fullname": True}, {"searchdesc": True}):
+            config = dict(CONFIG)
+            config.update(options)
+            regexlist = create_regexlist(config, PATTERNS)
+            found = search_list(config, regexlist, db)
+            expected = search_list(config, regexlist, self.db)
+            for pattern in PATTERNS:
+                self.assertEqual([pkg.number for pkg in found[pattern]],
+                    [pkg.number for pkg in expected[pattern]])
+
+    def test_zlib(self):
+        self.check("zlib")
+
+    @unittest.skipIf("lzma" not in CODECS, "Python 2 has no lzma")
+    def test_lzma(self):
+        self.check("lzma")
+
+
+if __name__ == "__main__":
+    unittest.main()
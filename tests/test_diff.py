@@ -0,0 +1,109 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""The merge diff of esync against a comparison of every package"""
+
+import random
+import unittest
+
+from support import IndexTestCase, make_rows, write
+
+from esearch.diff import changes
+from esearch.index import (Index, FULLNAME, MASKED, VERSION, SIZE, HOMEPAGE,
+    DESCRIPTION, LICENSE)
+
+# field => the kind of change it makes
+KINDS = ((VERSION, "V"), (MASKED, "M"), (DESCRIPTION, "D"), (SIZE, "O"),
+    (HOMEPAGE, "O"), (LICENSE, "O"))
+
+
+def changed(row, field):
+    row = list(row)
+    if field == MASKED:
+        row[field] = not row[field]
+    else:
+        row[field] += u"x"
+    return tuple(row)
+
+
+def expected_changes(old, new):
+    """The changes from the rows old to new, package by package"""
+    olds = dict((row[FULLNAME], row) for row in old)
+    news = dict((row[FULLNAME], row) for row in new)
+    found = []
+    for fullname in sorted(set(olds) | set(news)):
+        if fullname not in news:
+            found.append(("R", fullname))
+        elif fullname not in olds:
+            found.append(("A", fullname))
+        else:
+            kinds = ""
+            for field, kind in KINDS:
+                if olds[fullname][field] != news[fullname][field] and \
+                        kind not in kinds:
+                    kinds += kind
+            if kinds:
+                found.append((kinds, fullname))
+    return found
+
+
+class DiffTest(IndexTestCase):
+
+    def sync(self, seed):
+        """Returns the rows after a sync changing some of them"""
+        rnd = random.Random(seed)
+        new = []
+        for row in self.rows:
+            draw = rnd.random()
+            if draw < 0.05:
+                # removed
+                continue
+            if draw < 0.2:
+                for field in rnd.sample([field for field, kind in KINDS],
+                        rnd.randint(1, 3)):
+                    row = changed(row, field)
+            new.append(row)
+        # added, some of them sorting before or after every old one
+        added = make_rows(40, seed + 100)
+        added[0] = (u"aaa", u"aaa-first/aaa") + added[0][2:]
+        added[-1] = (u"zzz", u"zzz-last/zzz") + added[-1][2:]
+        known = set(row[FULLNAME] for row in new)
+        new += [row for row in added if row[FULLNAME] not in known]
+        new.sort(key=lambda row: row[FULLNAME])
+        return new
+
+    def test_changes(self):
+        for seed in range(3):
+            new = self.sync(seed)
+            write(self.path("new.idx"), new)
+            expected = expected_changes(self.rows, new)
+            found = list(changes(self.db, Index(self.path("new.idx"))))
+            self.assertEqual([(kinds, fullname) for kinds, fullname, oldpkg,
+                newpkg in found], expected)
+            for kinds, fullname, oldpkg, newpkg in found:
+                self.assertEqual(oldpkg is None, kinds == "A")
+                self.assertEqual(newpkg is None, kinds == "R")
+            # the rows of an old esearchdb.py
+            self.assertEqual([(kinds, fullname) for kinds, fullname, oldpkg,
+                newpkg in changes(self.rows, new)], expected)
+
+    def test_same(self):
+        self.assertEqual(list(changes(self.db, self.db)), [])
+        self.assertEqual(list(changes([], [])), [])
+
+    def test_empty(self):
+        self.assertEqual([kinds for kinds, fullname, oldpkg, newpkg
+            in changes([], self.db)], ["A"] * len(self.rows))
+        self.assertEqual([kinds for kinds, fullname, oldpkg, newpkg
+            in changes(self.db, [])], ["R"] * len(self.rows))
+
+    def test_order(self):
+        self.assertRaises(ValueError, list,
+            changes(self.rows, self.rows[::-1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
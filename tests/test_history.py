@@ -0,0 +1,78 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""The sync history of esync and its --since"""
+
+import io
+import time
+import unittest
+
+from support import TempDirTestCase
+
+from esearch.history import (append_sync, last_sync, parse_since,
+    read_history, syncs_since)
+
+# a sync a day from 2010-03-01 on
+START = time.mktime((2010, 3, 1, 12, 0, 0, 0, 0, -1))
+DAY = 24 * 60 * 60
+
+
+class HistoryTest(TempDirTestCase):
+
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.history = self.path("esearchdb.history")
+        self.changes = []
+        for n in range(10):
+            changes = [["V", u"app-misc/foo%d" % n, u"1.%d" % n,
+                u"1.%d" % (n + 1)], ["AD", u"dev-libs/caf\xe9%d" % n, u"",
+                u""]]
+            self.changes.append(changes)
+            self.assertEqual(append_sync(self.history, changes,
+                START + n * DAY), n + 1)
+
+    def test_read(self):
+        syncs = list(read_history(self.history))
+        self.assertEqual([sync["sync"] for sync in syncs], list(range(1, 11)))
+        self.assertEqual([sync["changes"] for sync in syncs], self.changes)
+        self.assertEqual(last_sync(self.history), 10)
+        self.assertEqual(last_sync(self.path("missing")), 0)
+
+    def test_since_number(self):
+        syncs = list(read_history(self.history))
+        for number in (0, 1, 5, 10, 11):
+            self.assertEqual(syncs_since(self.history, number=number),
+                [sync for sync in syncs if sync["sync"] > number])
+
+    def test_since_date(self):
+        syncs = list(read_history(self.history))
+        for since in (u"2010-02-01", u"2010-03-01", u"2010-03-04 12:00",
+                u"2010-03-04 12:01", u"2010-03-10", u"2010-04-01"):
+            number, when = parse_since(since)
+            self.assertEqual(number, None)
+            self.assertEqual(syncs_since(self.history, when=when),
+                [sync for sync in syncs if sync["time"] >= when])
+        self.assertEqual(len(syncs_since(self.history,
+            when=parse_since(u"2010-03-04 12:00")[1])), 7)
+
+    def test_parse_since(self):
+        self.assertEqual(parse_since(u"12"), (12, None))
+        for since in (u"", u"yesterday", u"2010-13-01", u"-1"):
+            self.assertRaises(ValueError, parse_since, since)
+
+    def test_truncated(self):
+        # a line cut short by a crash is skipped, the next sync appended
+        # after it
+        with io.open(self.history, "a", encoding="utf_8") as history:
+            history.write(u'{"sync": 11, "chan')
+        self.assertEqual(last_sync(self.history), 10)
+        self.assertEqual(append_sync(self.history, [], START + 20 * DAY), 11)
+        self.assertEqual([sync["sync"] for sync in
+            syncs_since(self.history, number=9)], [10, 11])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""Round trips of rows through the binary index"""
+
+import io
+import unittest
+
+from support import IndexTestCase, write
+
+from esearch.index import (Index, NAME, FULLNAME, INSTALLED, FINGERPRINT_SIZE,
+    COLD_COLUMNS)
+
+
+class IndexTest(IndexTestCase):
+
+    def test_rows(self):
+        self.assertEqual(len(self.db), len(self.rows))
+        self.assertEqual(list(self.db), self.rows)
+        for i, row in enumerate(self.rows):
+            self.assertEqual(tuple(self.db[i]), row)
+
+    def test_columns(self):
+        for field in range(len(self.rows[0])):
+            self.assertEqual(list(self.db.column(field)),
+                [row[field] for row in self.rows])
+
+    def test_cold_fields(self):
+        # read without loading the whole column
+        for field in COLD_COLUMNS:
+            for i in (0, 17, len(self.rows) - 1):
+                self.assertEqual(self.db.field(i, field),
+                    self.rows[i][field])
+
+    def test_installed(self):
+        installed = {self.rows[3][FULLNAME]: u"1.0"}
+        db = Index(self.path("esearchdb.idx"), installed)
+        self.assertEqual(db[3][INSTALLED], u"1.0")
+        self.assertEqual(db[4][INSTALLED], False)
+        self.assertEqual([i for i, version in
+            enumerate(db.column(INSTALLED)) if version], [3])
+
+    def test_meta_and_fingerprints(self):
+        fingerprints = [(b"%08d" % i)[:FINGERPRINT_SIZE]
+            for i in range(len(self.rows))]
+        write(self.path("meta.idx"), self.rows, fingerprints=fingerprints,
+            meta={"tree": u"abc", "generation": u"7"})
+        db = Index(self.path("meta.idx"))
+        self.assertEqual(db.meta, {"tree": u"abc", "generation": u"7"})
+        self.assertEqual([db.fingerprint(i) for i in range(len(db))],
+            fingerprints)
+        self.assertEqual(self.db.meta, {})
+        self.assertEqual(self.db.fingerprint(0), None)
+
+    def test_byte_strings(self):
+        # Python 2 hands eupdatedb utf-8 encoded str values
+        encoded = [tuple(value.encode("utf_8") if isinstance(value,
+            type(u"")) else value for value in row) for row in self.rows]
+        write(self.path("bytes.idx"), encoded, homepage_words=True)
+        write(self.path("text.idx"), self.rows, homepage_words=True)
+        with io.open(self.path("bytes.idx"), "rb") as dbfile:
+            data = dbfile.read()
+        with io.open(self.path("text.idx"), "rb") as dbfile:
+            self.assertEqual(data, dbfile.read())
+        self.assertEqual(list(Index(self.path("bytes.idx"))), self.rows)
+
+    def test_errors(self):
+        io.open(self.path("empty.idx"), "wb").close()
+        self.assertRaises(ValueError, Index, self.path("empty.idx"))
+        with io.open(self.path("other.idx"), "wb") as dbfile:
+            dbfile.write(b"x" * 64)
+        self.assertRaises(ValueError, Index, self.path("other.idx"))
+        with io.open(self.path("esearchdb.idx"), "rb") as dbfile:
+            data = dbfile.read()
+        with io.open(self.path("truncated.idx"), "wb") as dbfile:
+            dbfile.write(data[:len(data) // 2])
+        self.assertRaises(ValueError, Index, self.path("truncated.idx"))
+
+
+class EmptyIndexTest(IndexTestCase):
+
+    ROWS = 0
+
+    def test_rows(self):
+        self.assertEqual(len(self.db), 0)
+        self.assertEqual(list(self.db), [])
+        self.assertEqual(self.db.sorted(NAME).lookup(u"lib"), [])
+        self.assertEqual(self.db.words().lookup(u"lib"), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""The sorted name tables against a scan of every row"""
+
+import re
+import unittest
+
+from support import IndexTestCase, PATTERNS, scan
+
+from esearch.index import NAME, FULLNAME
+from esearch.prefix import anchored_prefix
+
+ANCHORED = PATTERNS + (u"^Qt", u"^qt-", u"^lib-", u"^libxml$", u"^GTK$",
+    u"^py\\d", u"^sys-apps/", u"^dev-python/py", u"^x11-libs/qt$",
+    u"^lib\\Z", u"\\Alib")
+
+
+class SortedIndexTest(IndexTestCase):
+
+    def check(self, field, flags):
+        fullname = field == FULLNAME
+        index = self.db.sorted(field)
+        looked_up = 0
+        for pattern in ANCHORED:
+            regex = re.compile(pattern, flags)
+            anchored = anchored_prefix(regex)
+            if anchored is None:
+                continue
+            looked_up += 1
+            prefix, exact, literal = anchored
+            rows = index.lookup(prefix, exact)
+            self.assertEqual(rows, sorted(rows))
+            matched = scan(self.rows, regex, fullname)
+            if literal:
+                self.assertEqual(rows, matched, pattern)
+            else:
+                self.assertTrue(set(matched) <= set(rows), pattern)
+        self.assertTrue(looked_up > 10)
+
+    def test_name(self):
+        self.check(NAME, re.IGNORECASE)
+
+    def test_fullname(self):
+        self.check(FULLNAME, re.IGNORECASE)
+
+    def test_case_sensitive(self):
+        self.check(NAME, 0)
+        self.check(FULLNAME, 0)
+
+    def test_anchored_prefix(self):
+        def anchored(pattern, flags=re.IGNORECASE):
+            return anchored_prefix(re.compile(pattern, flags))
+        self.assertEqual(anchored(u"^Lib"), (u"lib", False, True))
+        self.assertEqual(anchored(u"^lib$"), (u"lib", True, True))
+        self.assertEqual(anchored(u"^lib-.*x"), (u"lib-", False, False))
+        self.assertEqual(anchored(u"^lib", 0), (u"lib", False, False))
+        for pattern in (u"lib", u"^", u"^.lib", u"^(lib|db)", u"a^lib"):
+            self.assertEqual(anchored(pattern), None, pattern)
+
+
+if __name__ == "__main__":
+    unittest.main()
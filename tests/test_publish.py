@@ -0,0 +1,86 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""The locking and the generations of the published index"""
+
+import io
+import os
+import unittest
+
+from support import TempDirTestCase, make_rows, write
+
+from esearch.index import Index
+from esearch.publish import (generation_path, generations, lock, new_file,
+    publish)
+
+
+class PublishTest(TempDirTestCase):
+
+    def generation(self, number, keep=2):
+        """Writes and publishes random rows as generation number"""
+        fd, tmppath = new_file(self.tmpdir, "esearchdb.idx")
+        os.close(fd)
+        rows = make_rows(50, number)
+        write(tmppath, rows)
+        publish(tmppath, self.tmpdir, "esearchdb.idx", number, keep)
+        return rows
+
+    def test_lock(self):
+        lockfile = lock(self.path("esearchdb.lock"))
+        self.assertNotEqual(lockfile, None)
+        self.assertEqual(lock(self.path("esearchdb.lock")), None)
+        lockfile.close()
+        lockfile = lock(self.path("esearchdb.lock"))
+        self.assertNotEqual(lockfile, None)
+        lockfile.close()
+
+    def test_generations(self):
+        for number in range(1, 6):
+            rows = self.generation(number)
+            self.assertEqual(generations(self.tmpdir, "esearchdb.idx"),
+                list(range(max(1, number - 1), number + 1)))
+            self.assertEqual(list(Index(self.path("esearchdb.idx"))), rows)
+            # the live index is the last generation, not a copy of it
+            self.assertTrue(os.path.samefile(self.path("esearchdb.idx"),
+                generation_path(self.tmpdir, "esearchdb.idx", number)))
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), ["esearchdb.idx",
+            "esearchdb.idx.4", "esearchdb.idx.5"])
+
+    def test_keep(self):
+        for number in range(1, 6):
+            self.generation(number, keep=3)
+        self.assertEqual(generations(self.tmpdir, "esearchdb.idx"), [3, 4, 5])
+        self.generation(6, keep=1)
+        self.assertEqual(generations(self.tmpdir, "esearchdb.idx"), [6])
+
+    def test_open_index(self):
+        # a search keeps reading the generation it opened
+        rows = self.generation(1)
+        db = Index(self.path("esearchdb.idx"))
+        for number in range(2, 5):
+            self.generation(number)
+        self.assertFalse(os.path.exists(generation_path(self.tmpdir,
+            "esearchdb.idx", 1)))
+        self.assertEqual(list(db), rows)
+
+    def test_crashed_runs(self):
+        # the temporary files of crashed runs go with the next publish
+        io.open(self.path(".esearchdb.idx.99999.tmp"), "wb").close()
+        io.open(self.path("esearchdb.idx.new"), "wb").close()
+        self.generation(1)
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), ["esearchdb.idx",
+            "esearchdb.idx.1"])
+
+    def test_other_files(self):
+        io.open(self.path("esearchdb.idx.installed"), "wb").close()
+        io.open(self.path("esearchdb.idx.old"), "wb").close()
+        self.generation(1)
+        self.assertEqual(generations(self.tmpdir, "esearchdb.idx"), [1])
+        self.assertTrue(os.path.exists(self.path("esearchdb.idx.installed")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""The records of --json, --tsv and --null read back"""
+
+import json
+import re
+import unittest
+
+from support import IndexTestCase
+
+from esearch.common import JSONL, TSV, NUL
+from esearch.records import (COLUMNS, SEARCH_FIELDS, SYNC_FIELDS,
+    RecordWriter, parse_fields)
+
+FIELDS = ("category", "name", "fullname", "masked", "version", "installed",
+    "size", "homepage", "description", "license", "iuse", "unstable",
+    "pattern")
+
+_UNESCAPES = {"\\\\": "\\", "\\t": "\t", "\\n": "\n", "\\r": "\r"}
+
+
+def unescape(value):
+    return re.sub(r"\\[\\tnr]", lambda match: _UNESCAPES[match.group()],
+        value)
+
+
+def values(row, pattern):
+    """The values of FIELDS of row"""
+    found = []
+    for field in FIELDS:
+        if field == "category":
+            found.append(row[1].split("/")[0])
+        elif field == "pattern":
+            found.append(pattern)
+        elif field == "installed":
+            found.append(row[4] or None)
+        else:
+            found.append(row[COLUMNS[field]])
+    return found
+
+
+def text(value):
+    if value is None:
+        return u""
+    if value is True or value is False:
+        return value and u"1" or u"0"
+    return value
+
+
+class RecordsTest(IndexTestCase):
+
+    def records(self, mode):
+        written = []
+        writer = RecordWriter(mode, FIELDS, written.append)
+        for pkg in self.db:
+            writer.record(pkg, {"pattern": u"lib\t.*"})
+        return "".join(written)
+
+    def test_jsonl(self):
+        lines = self.records(JSONL).split("\n")
+        self.assertEqual(lines.pop(), "")
+        for line, row in zip(lines, self.rows):
+            record = json.loads(line)
+            self.assertEqual([record[field] for field in FIELDS],
+                values(row, u"lib\t.*"))
+        self.assertEqual(len(lines), len(self.rows))
+
+    def test_tsv(self):
+        lines = self.records(TSV).split("\n")
+        self.assertEqual(lines.pop(), "")
+        # a newline or tab within a value never splits a record
+        self.assertEqual(len(lines), len(self.rows))
+        for line, row in zip(lines, self.rows):
+            self.assertEqual([unescape(value) for value in line.split("\t")],
+                [text(value) for value in values(row, u"lib\t.*")])
+
+    def test_null(self):
+        found = self.records(NUL).split("\0")
+        self.assertEqual(found.pop(), "")
+        self.assertEqual(len(found), len(FIELDS) * len(self.rows))
+        for n, row in enumerate(self.rows):
+            self.assertEqual(found[n * len(FIELDS):(n + 1) * len(FIELDS)],
+                [text(value) for value in values(row, u"lib\t.*")])
+
+    def test_missing_row(self):
+        written = []
+        RecordWriter(JSONL, ("change", "fullname"), written.append).record(
+            None, {"change": u"R"})
+        self.assertEqual(json.loads(written[0]),
+            {"change": u"R", "fullname": None})
+
+    def test_parse_fields(self):
+        self.assertEqual(parse_fields(u" fullname, version,", SEARCH_FIELDS),
+            (u"fullname", u"version"))
+        self.assertEqual(parse_fields(u"pattern", SEARCH_FIELDS),
+            (u"pattern",))
+        self.assertEqual(parse_fields(u"change,time", SYNC_FIELDS),
+            (u"change", u"time"))
+        # the fields of the other tool
+        self.assertRaises(ValueError, parse_fields, u"change", SEARCH_FIELDS)
+        self.assertRaises(ValueError, parse_fields, u"pattern", SYNC_FIELDS)
+        self.assertRaises(ValueError, parse_fields, u"nope", SEARCH_FIELDS)
+        self.assertRaises(ValueError, parse_fields, u" , ", SEARCH_FIELDS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""The searches of esearch against a scan of every row with the regex"""
+
+import unittest
+
+from support import IndexTestCase, PATTERNS, scan
+
+from esearch.common import CONFIG
+from esearch.index import Index, FULLNAME
+from esearch.search import create_regexlist, search_list
+
+
+class SearchTest(IndexTestCase):
+
+    def setUp(self):
+        IndexTestCase.setUp(self)
+        self.installed = dict((row[FULLNAME], u"1.0")
+            for row in self.rows[::7])
+        self.db = Index(self.path("esearchdb.idx"), self.installed)
+
+    def check(self, patterns, **options):
+        config = dict(CONFIG)
+        config.update(options)
+        regexlist = create_regexlist(config, patterns)
+        found = search_list(config, regexlist, self.db)
+        self.assertEqual(sorted(found), sorted(set(patterns)))
+        for regex, pattern, foo, foo, fullname in regexlist:
+            expected = scan(self.rows, regex, fullname, config['searchdesc'])
+            if config['instonly']:
+                expected = [i for i in expected
+                    if self.rows[i][FULLNAME] in self.installed]
+            elif config['notinst']:
+                expected = [i for i in expected
+                    if self.rows[i][FULLNAME] not in self.installed]
+            self.assertEqual([pkg.number for pkg in found[pattern]],
+                expected, "%r %r" % (pattern, options))
+
+    def test_patterns(self):
+        # one at a time, through the trigram and name tables
+        for pattern in PATTERNS:
+            self.check([pattern])
+            self.check([pattern], fullname=True)
+            self.check([pattern], searchdesc=True)
+
+    def test_all_patterns(self):
+        # the patterns scanning every row share a pass
+        self.check(PATTERNS)
+        self.check(PATTERNS, fullname=True)
+        self.check(PATTERNS, searchdesc=True)
+
+    def test_installed(self):
+        self.check(PATTERNS, instonly=True)
+        self.check(PATTERNS, notinst=True)
+        self.check([u".*"], instonly=True)
+
+    def test_list(self):
+        # rows of an old esearchdb.py are scanned
+        config = dict(CONFIG)
+        regexlist = create_regexlist(config, PATTERNS)
+        found = search_list(config, regexlist, self.rows)
+        for regex, pattern, foo, foo, fullname in regexlist:
+            self.assertEqual(found[pattern], [self.rows[i]
+                for i in scan(self.rows, regex, fullname)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""The compiled --own formats against expanding them character by
+character"""
+
+import random
+import unittest
+
+from support import make_rows
+
+from esearch.search import do_own
+from esearch.template import Template
+
+# placeholder => function of the row, as esearch.1 documents them
+PLACEHOLDERS = {
+    "%c": lambda row: row[1].split("/")[0],
+    "%n": lambda row: row[0],
+    "%p": lambda row: row[1],
+    "%m": lambda row: row[2] and "masked" or "",
+    "%va": lambda row: row[3],
+    "%vi": lambda row: row[4] or "",
+    "%vu": lambda row: len(row) > 10 and row[10] or "",
+    "%s": lambda row: row[5],
+    "%h": lambda row: row[6],
+    "%d": lambda row: row[7],
+    "%l": lambda row: row[8],
+    "%u": lambda row: len(row) > 9 and row[9] or "",
+    "%%": lambda row: "%",
+    "\\n": lambda row: "\n",
+    "\\t": lambda row: "\t",
+}
+
+FORMATS = ("%p\\n", "%c/%n-%va.ebuild\\n", "%p %va %vi %vu %s %h %d %l %u",
+    "%m%m", "100%% %p", "%%p", "%v %x %", "\\x %n\\t%d\\", "", "plain text",
+    "%p%%%va", "%%%%s", "%vaa %vii", "\\\\n")
+
+
+def expand(own, row):
+    """Returns own with the longest placeholder at each position
+    replaced"""
+    tokens = sorted(PLACEHOLDERS, key=len, reverse=True)
+    parts = []
+    i = 0
+    while i < len(own):
+        for token in tokens:
+            if own.startswith(token, i):
+                parts.append(PLACEHOLDERS[token](row))
+                i += len(token)
+                break
+        else:
+            parts.append(own[i])
+            i += 1
+    return "".join(parts)
+
+
+class TemplateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = make_rows(200)
+        # installed, and with the fields of an old esearchdb.py only
+        self.rows[::3] = [row[:4] + (u"0.9",) + row[5:]
+            for row in self.rows[::3]]
+        self.rows[1::5] = [row[:9] for row in self.rows[1::5]]
+
+    def test_formats(self):
+        for own in FORMATS:
+            template = Template(own)
+            for row in self.rows:
+                self.assertEqual(template.render(row), expand(own, row),
+                    own)
+                self.assertEqual(do_own(row, own), expand(own, row))
+
+    def test_random_formats(self):
+        rnd = random.Random(0)
+        pieces = list(PLACEHOLDERS) + ["%", "\\", "v", "a", " ", "%v", "x"]
+        for n in range(200):
+            own = "".join(rnd.choice(pieces) for i in range(rnd.randint(0,
+                12)))
+            template = Template(own)
+            for row in self.rows[:20]:
+                self.assertEqual(template.render(row), expand(own, row),
+                    own)
+
+    def test_values_not_parsed(self):
+        # the descriptions hold %s, \n and the like
+        row = (u"foo", u"app-misc/foo", False, u"1.0", False, u"%d kB",
+            u"%h", u"100%% \\n %s", u"%l", u"", u"")
+        self.assertEqual(Template("%s|%h|%d|%l").render(row),
+            u"%d kB|%h|100%% \\n %s|%l")
+
+
+if __name__ == "__main__":
+    unittest.main()
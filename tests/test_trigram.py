@@ -0,0 +1,92 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""The trigram candidates against a scan of every row"""
+
+import re
+import unittest
+
+from support import IndexTestCase, PATTERNS, scan, write
+
+from esearch.index import Index, FULLNAME, DESCRIPTION
+from esearch.trigram import fold, required_trigrams, trigrams
+
+
+class FoldTest(unittest.TestCase):
+
+    def test_fold(self):
+        self.assertEqual(fold(u"LibXML"), u"libxml")
+        self.assertEqual(fold(u"\u212aDE"), u"kde")
+        self.assertEqual(fold(u"Stra\xdfe"), u"stra\xdfe")
+        # byte strings, the str of Python 2, are utf-8
+        self.assertEqual(fold(u"Caf\xc9".encode("utf_8")), u"caf\xe9")
+        self.assertEqual(fold(b"GTK"), u"gtk")
+
+    def test_trigrams(self):
+        self.assertEqual(trigrams(u"LibX"), set([u"lib", u"ibx"]))
+        self.assertEqual(trigrams(u"caf\xe9s"), set([u"caf"]))
+        self.assertEqual(trigrams(u"ab"), set())
+
+
+class CandidatesTest(IndexTestCase):
+
+    def check(self, field, fullname, searchdesc):
+        index = self.db.trigrams(field)
+        for pattern in PATTERNS:
+            regex = re.compile(pattern, re.IGNORECASE)
+            required = required_trigrams(regex)
+            if required is None:
+                continue
+            rows = index.candidates(required)
+            if field == DESCRIPTION:
+                matched = [i for i, row in enumerate(self.rows)
+                    if regex.search(row[DESCRIPTION])]
+            else:
+                matched = scan(self.rows, regex, fullname, searchdesc)
+            missing = set(matched) - set(rows)
+            self.assertFalse(missing, "%r lost rows %r" % (pattern,
+                sorted(missing)[:5]))
+
+    def test_fullname(self):
+        self.check(FULLNAME, True, False)
+
+    def test_name(self):
+        # the names are within the full names
+        self.check(FULLNAME, False, False)
+
+    def test_description(self):
+        self.check(DESCRIPTION, False, True)
+
+    def test_pruning(self):
+        # a literal has to narrow the rows down
+        regex = re.compile(u"pyqt", re.IGNORECASE)
+        rows = self.db.trigrams(FULLNAME).candidates(required_trigrams(regex))
+        self.assertTrue(len(rows) < len(self.rows) // 2)
+        self.assertTrue(set(scan(self.rows, regex, True)) <= rows)
+
+    def test_ignorecase_letters(self):
+        # which re.IGNORECASE matches to ascii letters
+        descriptions = [u"\u212ade", u"\u017f\u017fl", u"\u0130ib",
+            u"\u0131ib", u"KDE", u"none"]
+        rows = [self.rows[i][:DESCRIPTION] + (description,) +
+            self.rows[i][DESCRIPTION + 1:]
+            for i, description in enumerate(descriptions)]
+        write(self.path("fold.idx"), rows)
+        index = Index(self.path("fold.idx")).trigrams(DESCRIPTION)
+        for pattern in (u"kde", u"ssl", u"lib"):
+            regex = re.compile(pattern, re.IGNORECASE | re.UNICODE)
+            matched = set(i for i, description in enumerate(descriptions)
+                if regex.search(description))
+            self.assertTrue(matched <= index.candidates(
+                required_trigrams(regex)), pattern)
+
+    def test_no_literals(self):
+        for pattern in (u".*", u"^", u"[qg]t", u"\\d", u"ab|.", u"x?y?z?"):
+            self.assertEqual(required_trigrams(re.compile(pattern)), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""Incremental eupdatedb against a full rebuild, on the synthetic trees
+of the benchmarks"""
+
+import os
+import unittest
+
+from support import TempDirTestCase
+
+import portage
+from synthetic import Tree
+
+from esearch import update
+from esearch.common import CONFIG
+from esearch.index import Index
+
+
+class UpdateTest(TempDirTestCase):
+
+    PACKAGES = 300
+
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.tree = Tree(self.PACKAGES, 1)
+        self.tree.write(self.path("tree"))
+        os.makedirs(self.path("tree", "root"))
+        portage.use_tree(self.tree)
+        self.devnull = open(os.devnull, "w")
+        self.indexed = []
+        self.index_package = update.index_package
+
+        def index_package(pkg):
+            self.indexed.append(pkg)
+            return self.index_package(pkg)
+        update.index_package = index_package
+
+    def tearDown(self):
+        update.index_package = self.index_package
+        self.devnull.close()
+        TempDirTestCase.tearDown(self)
+
+    def updatedb(self, dbdir, fullrebuild=False):
+        if not os.path.isdir(self.path(dbdir)):
+            os.makedirs(self.path(dbdir))
+        config = dict(CONFIG)
+        config.update({
+            'esearchdbdir': self.path(dbdir),
+            'stdout': self.devnull,
+            'stderr': self.devnull,
+            'verbose': -1,
+            'jobs': 1,
+            'fullrebuild': fullrebuild,
+        })
+        del self.indexed[:]
+        self.assertTrue(update.updatedb(config))
+        return list(Index(self.path(dbdir, config['esearchdbfile'])))
+
+    def test_incremental(self):
+        self.updatedb("db", True)
+        self.assertEqual(len(self.indexed), self.PACKAGES)
+        for n in range(3):
+            self.tree.sync(0.05)
+            rows = self.updatedb("db")
+            reindexed = len(self.indexed)
+            self.assertEqual(rows, self.updatedb("full", True))
+            # the bumps, new packages and new descriptions, no others
+            self.assertTrue(0 < reindexed <= self.PACKAGES * 0.05)
+
+    def test_unchanged(self):
+        rows = self.updatedb("db", True)
+        self.assertEqual(self.updatedb("db"), rows)
+        self.assertEqual(self.indexed, [])
+
+    def test_failure(self):
+        rows = self.updatedb("db", True)
+        write_index = update.write_index
+
+        def fail(*args, **kwargs):
+            raise IOError("no space left on device")
+        update.write_index = fail
+        try:
+            self.assertRaises(IOError, self.updatedb, "db")
+        finally:
+            update.write_index = write_index
+        # neither the temporary file is left nor the index touched
+        self.assertFalse([name for name in os.listdir(self.path("db"))
+            if name.endswith(".tmp")])
+        self.assertEqual(list(Index(self.path("db", "esearchdb.idx"))), rows)
+
+
+if __name__ == "__main__":
+    unittest.main()
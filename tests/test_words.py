@@ -0,0 +1,103 @@
+#!/usr/bin/python
+#
+# Copyright(c) 2010, Gentoo Foundation
+# Distributed under the terms of the GNU General Public License v2
+#
+
+"""The ranked word search against the words of every row"""
+
+import unittest
+
+from support import IndexTestCase
+
+from esearch.common import CONFIG
+from esearch.index import NAME, DESCRIPTION, HOMEPAGE
+from esearch.search import search_words
+from esearch.words import ScanWordIndex, query_words, rank, tokenize
+
+QUERIES = ([u"lib"], [u"LIB"], [u"lib*"], [u"xml lib"], [u"python", u"qt"],
+    [u"caf\xe9"], [u"\xdcBER"], [u"stra\xdfe"], [u"sound video*"], [u"s*"],
+    [u"nomatchatall"], [u"gtk-lib"], [u"x11"], [u"py* qt*"], [u"* lib"])
+
+
+class WordsTest(IndexTestCase):
+
+    def words(self, row):
+        words = tokenize(row[NAME]) + tokenize(row[DESCRIPTION])
+        if self.HOMEPAGE_WORDS:
+            words += tokenize(row[HOMEPAGE])
+        return words
+
+    def expected(self, query):
+        """The rows holding every word of query"""
+        found = []
+        for i, row in enumerate(self.rows):
+            words = self.words(row)
+            for word in query:
+                if word.endswith(u"*"):
+                    if not [w for w in words if w.startswith(word[:-1])]:
+                        break
+                elif word not in words:
+                    break
+            else:
+                found.append(i)
+        return found
+
+    def test_lookup(self):
+        index = self.db.words()
+        for query in QUERIES:
+            for word in query_words(query):
+                self.assertEqual(sorted(index.lookup(word)),
+                    self.expected([word]), word)
+
+    def test_rank(self):
+        index = self.db.words()
+        names = self.db.column(NAME)
+        for query in QUERIES:
+            words = query_words(query)
+            rows = rank(index, words, names)
+            if not words:
+                # single characters are no words
+                self.assertEqual(rows, [])
+                continue
+            self.assertEqual(sorted(rows), self.expected(words), query)
+            if not self.HOMEPAGE_WORDS:
+                # the index of an old esearchdb.py ranks the same
+                self.assertEqual(rank(ScanWordIndex(self.rows), words,
+                    names), rows, query)
+
+    def test_name_first(self):
+        names = self.db.column(NAME)
+        for query in QUERIES:
+            words = [word.rstrip(u"*") for word in query_words(query)]
+            hits = [len([word for word in words
+                if word in names[row].lower()])
+                for row in rank(self.db.words(), query_words(query), names)]
+            self.assertEqual(hits, sorted(hits, reverse=True), query)
+
+    def test_search_words(self):
+        config = dict(CONFIG)
+        names = self.db.column(NAME)
+        for query in QUERIES:
+            found = [tuple(pkg) for pkg in search_words(config, query,
+                self.db)]
+            self.assertEqual(found, [self.rows[i] for i in
+                rank(self.db.words(), query_words(query), names)])
+            if not self.HOMEPAGE_WORDS:
+                self.assertEqual(found, search_words(config, query,
+                    self.rows))
+
+    def test_query_words(self):
+        self.assertEqual(query_words([u"Lib* XML", u"a gtk"]),
+            [u"lib*", u"xml", u"gtk"])
+        # the wildcard of a word without tokens stays with it
+        self.assertEqual(query_words([u"lib", u"* x*"]), [u"lib"])
+
+
+class HomepageWordsTest(WordsTest):
+
+    HOMEPAGE_WORDS = True
+
+
+if __name__ == "__main__":
+    unittest.main()